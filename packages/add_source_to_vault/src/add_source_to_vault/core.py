@@ -3,7 +3,7 @@ import os
 import re
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
 import pymupdf4llm
 import requests
@@ -156,12 +156,19 @@ class SourceManager:
         return all((dir / f"{filename}.{ext}").exists() 
                   for dir, ext in [(self.sources_path, "pdf"), (self.source_notes_path, "md"), (self.sources_path, "txt"), (self.sources_path, "bib")])
     
-    def add_source(self, doi: str) -> list[str]:
-        """Add source to vault. Returns dict with filename, raw_text, md_content, bib_content if successful, raises on failure."""
+    def add_source(self, doi: str, on_stage: Optional[Callable[[str, str], None]] = None) -> list[str]:
+        """
+        Add source to vault. Returns dict with filename, raw_text, md_content, bib_content if successful, raises on failure.
+
+        on_stage is called with (stage, filename) after each finished stage: "metadata", "downloaded", "extracted", "written".
+        """
+        report = on_stage or (lambda stage, filename: None)
+
         # Get metadata
         metadata = self._get_metadata(doi)
             
         filename = self._create_filename(metadata)
+        report("metadata", filename)
         
         # Check if exists
         if self._source_exists(filename):
@@ -169,10 +176,12 @@ class SourceManager:
         
         # Download PDF
         pdf_path = self.pdffromdoi.download(doi=doi, filename=filename)
+        report("downloaded", filename)
         
         try:            
-            # Extract text using PyMuPDF4LLM
-            raw_text = pymupdf4llm.to_markdown(str(pdf_path))
+            # Extract text using PyMuPDF4LLM (page separators let readers address page ranges)
+            raw_text = pymupdf4llm.to_markdown(str(pdf_path), page_separators=True)
+            report("extracted", filename)
             (self.sources_path / f"{filename}.txt").write_text(raw_text, encoding="utf-8")
             
             # Create metadata markdown
@@ -182,6 +191,7 @@ class SourceManager:
             # Create BibTeX
             bib_content = self._create_bibtex(metadata, filename)
             (self.sources_path / f"{filename}.bib").write_text(bib_content, encoding="utf-8")
+            report("written", filename)
             
             return {
                 "filename": filename,
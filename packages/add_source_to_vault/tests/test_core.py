@@ -289,6 +289,27 @@ def test_add_source_success(mock_source_exists, mock_to_markdown, temp_vault):
         assert (temp_vault / "sources" / "bib" / "2023-doe-test-paper.bib").exists()
 
 
+@patch('add_source_to_vault.core.pymupdf4llm.to_markdown')
+@patch.object(SourceManager, '_source_exists')
+def test_add_source_reports_stages(mock_source_exists, mock_to_markdown, temp_vault):
+    """Test that add_source reports every finished stage."""
+    mock_source_exists.return_value = False
+    mock_to_markdown.return_value = "Extracted text content"
+    manager = SourceManager(str(temp_vault))
+    manager.pdffromdoi = MagicMock()
+    stages = []
+
+    with patch.object(manager, '_get_metadata') as mock_get_metadata:
+        mock_get_metadata.return_value = {
+            "title": "Test Paper", "authors": ["John Doe"], "journal": "Test Journal",
+            "year": "2023", "doi": "10.1234/test", "abstract": "",
+        }
+        result = manager.add_source("10.1234/test", on_stage=lambda stage, filename: stages.append((stage, filename)))
+
+    assert result["filename"] == "2023-doe-test-paper"
+    assert stages == [(stage, "2023-doe-test-paper") for stage in ["metadata", "downloaded", "extracted", "written"]]
+
+
 @patch.object(SourceManager, '_source_exists')
 def test_add_source_already_exists(mock_source_exists, temp_vault):
     """Test add_source when source already exists."""
@@ -1,3 +1,18 @@
-from .agent import SourceDigestionAgent
+from importlib import import_module
 
-__all__ = ["SourceDigestionAgent"]
\ No newline at end of file
+# Imported on first access, so that importing the package (e.g. for the CLI) stays cheap
+_EXPORTS = {
+    "SourceDigestionAgent": ".agent",
+    "digest_many": ".orchestrator",
+    "adigest_many": ".orchestrator",
+}
+
+__all__ = ["SourceDigestionAgent", "adigest_many", "digest_many"]
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -1,59 +1,109 @@
-import os
 import asyncio
-import mlflow
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import create_react_agent
-from langchain_core.tools import tool
-from langgraph.checkpoint.memory import InMemorySaver
+import os
+import queue
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import SystemMessage
+from langchain_core.tools import StructuredTool
+from langgraph.checkpoint.base import BaseCheckpointSaver
 import functools
 import inspect
-from rich.console import Console
-from rich.pretty import Pretty
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Literal, Optional, Tuple, Union
+
+from pydantic import BaseModel, Field
 
-from add_source_to_vault import SourceManager
-import tools as tool_pkg
+from . import tools as tool_pkg
+from .checkpoints import ThreadInfo, default_checkpointer, list_threads, prune_threads
+from .compaction import CompactionPolicy, compaction_hook
+from .concurrency import Hedger
+from .events import RunFinished, SourceStage, StreamEvent, TaskEvents
+from .llm_cache import LLMCache
+from .map_reduce import load_or_extract_plan, render_plan
+from .plan_execute import ExecutionResult, plan_and_execute
+from .runtime import enable_tracing, load_environment, tracing_requested
+from .source_text import SourceDocument
+from .telemetry import JsonlExporter, RunSummary, Telemetry
+from .usage import TurnUsage, total_usage, turn_usage
 
-# MLflow autologging
-mlflow.openai.autolog()
-mlflow.langchain.autolog()
-load_dotenv()
-console = Console()
+
+class PreparedSource(BaseModel):
+    """A Pydantic model for a source loaded for digestion."""
+    filename: str = Field(description="The source's filename in the vault.")
+    md_content: str = Field(description="The content of the source's note.")
+    context: str = Field(description="The source's part of the prompt.")
 
 
 class SourceDigestionAgent:
     def __init__(
             self, 
             vault_directory: str, 
-            doi: str, 
+            doi: Optional[str] = None, 
             model: str = "gpt-5-mini", 
             brightdata_api_key: str = None,
             debug: bool = False,
+            stable_ids: bool = False,
+            duplicate_threshold: Optional[float] = None,
+            parallel_tool_calls: bool = True,
+            checkpointer: Optional[BaseCheckpointSaver] = None,
+            source_access: Literal["inline", "chunked", "map_reduce"] = "inline",
+            compaction: Union[CompactionPolicy, bool, None] = None,
+            llm_cache: bool = False,
+            filename: Optional[str] = None,
+            llm: Optional[BaseChatModel] = None,
+            tool_wrappers: Optional[Dict[str, Callable[[Callable], Callable]]] = None,
+            callbacks: Optional[List[BaseCallbackHandler]] = None,
+            telemetry_log: Optional[str] = None,
+            tracing: Optional[bool] = None,
+            hedger: Optional[Hedger] = None,
         ) -> None:
+        """
+        Args (besides the model and mode options):
+            doi: DOI of the default source to add to the vault and digest (optional: sources can
+                also be given per `invoke` call, so one agent can digest many sources)
+            filename: Default to a source that is already in the vault instead, without fetching its metadata
+            llm: A chat model to use instead of `ChatOpenAI(model)` (e.g. a replay model for benchmarks)
+            tool_wrappers: Maps tool names to functions that wrap (or replace) the tool's function
+            callbacks: Callback handlers observing every model and tool call of every run
+            telemetry_log: Append a telemetry event per model and tool call to this JSONL file
+            tracing: Turn on MLflow autologging (default: the FASTERSCIENCE_TRACING environment variable)
+            hedger: Hedge the slow block calls of list_relevant_notes with duplicate requests
+            duplicate_threshold: Refuse new notes whose titles are this similar to existing ones
+                (e.g. 0.7; default: no check)
+            compaction: How to compact the history the model sees (default: `CompactionPolicy()`;
+                False sends the full history)
+        """
+        load_environment()
+        if tracing_requested(tracing):
+            enable_tracing()
 
-        try:
-            result = SourceManager(vault_path=vault_directory, brightdata_api_key=brightdata_api_key).add_source(doi)
-        except FileExistsError as e:
-            print(f"Source already exists: {e.filename}")
-            result = {
-                "filename": e.filename,
-                "raw_text": open(os.path.join(vault_directory, "Sources", f"{e.filename}.txt"), "r", encoding="utf-8").read(),
-                "md_content": open(os.path.join(vault_directory, "s", f"{e.filename}.md"), "r", encoding="utf-8").read(),
-                "bib_content": open(os.path.join(vault_directory, "Sources", f"{e.filename}.bib"), "r", encoding="utf-8").read()
-            }
-
-        prompt_path = os.path.join(os.path.dirname(__file__), "templates", "system_prompt.md")
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            prompt = f.read()
-
-        prompt = prompt.format(
-            filename=result["filename"],
-            raw_text=result["raw_text"],
-            bib_content=result["bib_content"]
-        )
-        print(prompt)
+        self.vault_directory = vault_directory
+        self._stable_ids = stable_ids
+        self._source_access = source_access
+        self._brightdata_api_key = brightdata_api_key
+        self._source_manager = None
+        if compaction is None or compaction is True:
+            compaction = CompactionPolicy()
+
+        # With llm_cache, identical model calls (e.g. re-running a thread) are replayed from disk
+        self._cache = LLMCache.for_vault(vault_directory) if llm_cache else None
+
+        # The static instructions come first and the source-specific content after them, so the
+        # tool definitions and instructions form a prefix that is identical for every source and
+        # can be served from the provider's prompt cache.
+        instructions = SystemMessage(content=_read_template("system_prompt.md"))
+        self._instructions = instructions
+
+        tool_kwargs = {"vault_directory": vault_directory, "stable_ids": stable_ids, "hedger": hedger, "duplicate_threshold": duplicate_threshold}
+        tool_names = [name for name in tool_pkg.__all__ if source_access != "inline" or name != "read_source_outer"]
 
         if debug:
+            from rich.console import Console
+            from rich.pretty import Pretty
+
+            console = Console()
+
             def _wrap_with_pause(func):
                 sig = inspect.signature(func)
 
@@ -72,41 +122,398 @@ class SourceDigestionAgent:
 
                 wrapped.__signature__ = sig
                 return wrapped
-
-            tools = [
-                tool(_wrap_with_pause(getattr(tool_pkg, name)(vault_directory=vault_directory)))
-                for name in tool_pkg.__all__
-            ]
         else:
-            tools = [
-                tool(getattr(tool_pkg, name)(vault_directory=vault_directory))
-                for name in tool_pkg.__all__
-            ]
-
-        llm = ChatOpenAI(
-            model=model,
-            use_responses_api=True,
-        )
+            def _wrap_with_pause(func):
+                return func
+
+        # Every tool has a sync and an async version, for invoke and ainvoke. Wrapped tools (and
+        # debug mode) only wrap the sync function, whose async version then runs it in a thread.
+        tool_wrappers = tool_wrappers or {}
+        tools = []
+        for name in tool_names:
+            func = getattr(tool_pkg, name)(**tool_kwargs)
+            coroutine = None
+            if func.__name__ in tool_wrappers:
+                func = tool_wrappers[func.__name__](func)
+            elif not debug:
+                coroutine = tool_pkg.coroutine_of(func)
+            func = _wrap_with_pause(func)
+            tools.append(StructuredTool.from_function(func=func, coroutine=coroutine or tool_pkg.to_async(func)))
+
+        if llm is None:
+            llm = _chat_model(model, cache=self._cache)
+        # Set up once; the unbound model also extracts map-reduce plans and plans vault changes
+        self._llm = llm
+        # The note tools are concurrency-safe, so several tool calls of one turn run in parallel.
+        # Debug mode pauses for input around every call, which only makes sense one call at a time.
+        llm = llm.bind_tools(tools, parallel_tool_calls=parallel_tool_calls and not debug)
         
+        # Checkpoints are durable by default so interrupted runs can be resumed
+        self.checkpointer = checkpointer if checkpointer is not None else default_checkpointer(vault_directory)
+
+        from langgraph.prebuilt import create_react_agent
+
+        # The graph and tools are compiled once; the source is part of each thread's state
         self._agent = create_react_agent(
             model=llm, 
             tools=tools, 
-            prompt=prompt, 
-            checkpointer=InMemorySaver(),
+            prompt=lambda state: [instructions, SystemMessage(content=state["source_context"]), *state["messages"]],
+            state_schema=_digestion_state(),
+            checkpointer=self.checkpointer,
+            # The model sees a compacted history, the checkpoints keep the full one
+            pre_model_hook=compaction_hook(compaction) if compaction else None,
+        )
+
+        self._callbacks = list(callbacks or [])
+        self._telemetry_exporters = [JsonlExporter(telemetry_log)] if telemetry_log else []
+
+        # Token usage of the turns and telemetry summary of the latest finished run, for
+        # convenience; with concurrent runs use `return_summary` or `RunFinished` instead
+        self.last_usage: List[TurnUsage] = []
+        self.last_summary: Optional[RunSummary] = None
+
+        # A source given here is the default source of every invoke call
+        self.source: Optional[PreparedSource] = None
+        if doi is not None or filename is not None:
+            self.source = self.prepare_source(doi=doi, filename=filename)
+            if debug:
+                print(self.source.context)
+
+    @property
+    def filename(self) -> Optional[str]:
+        """The filename of the default source."""
+        return self.source.filename if self.source else None
+
+    def prepare_source(
+            self,
+            doi: Optional[str] = None,
+            filename: Optional[str] = None,
+            on_stage: Optional[Callable[[str, str], None]] = None,
+        ) -> PreparedSource:
+        """
+        Load a source for digestion: add it to the vault by DOI (unless it is already there) or
+        load it by filename, and render its part of the prompt. This is the only per-source work.
+        `on_stage` is called with (stage, filename) after every finished ingestion stage.
+        """
+        if filename is not None:
+            result = _load_source(self.vault_directory, filename)
+        elif doi is None:
+            raise ValueError("Either doi or filename is required.")
+        else:
+            if self._source_manager is None:
+                # Imported here: PDF extraction is slow to import and not needed for sources in the vault
+                from add_source_to_vault import SourceManager
+
+                # Created once, so its download client is reused for every source
+                self._source_manager = SourceManager(vault_path=self.vault_directory, brightdata_api_key=self._brightdata_api_key)
+            try:
+                result = self._source_manager.add_source(doi, on_stage=on_stage)
+            except FileExistsError as e:
+                print(f"Source already exists: {e.filename}")
+                result = _load_source(self.vault_directory, e.filename)
+
+        # Inline mode puts the full text into the prompt; chunked mode only a table of contents,
+        # and the agent reads the text on demand with the read_source tool. Map-reduce mode adds
+        # a plan of the source's propositions, extracted from all sections in parallel.
+        if self._source_access == "map_reduce":
+            document = SourceDocument(result["raw_text"])
+            plan = load_or_extract_plan(
+                self._llm,
+                self.vault_directory,
+                result["filename"],
+                document=document,
+            )
+            source_content = _read_template("source_plan.md").format(
+                filename=result["filename"],
+                md_content=result["md_content"],
+                plan=render_plan(plan),
+                table_of_contents=document.table_of_contents(),
+            )
+        elif self._source_access == "chunked":
+            source_content = _read_template("source_chunked.md").format(
+                filename=result["filename"],
+                md_content=result["md_content"],
+                table_of_contents=SourceDocument(result["raw_text"]).table_of_contents(),
+            )
+        else:
+            source_content = _read_template("source_inline.md").format(raw_text=result["raw_text"])
+
+        context = _read_template("source_context.md").format(
+            filename=result["filename"],
+            bib_content=result["bib_content"],
+            source_content=source_content,
         )
+        if on_stage is not None:
+            on_stage("ready", result["filename"])
+        return PreparedSource(filename=result["filename"], md_content=result["md_content"], context=context)
+
+    def _resolve_source(self, doi: Optional[str], filename: Optional[str]) -> Optional[PreparedSource]:
+        if doi is not None or filename is not None:
+            return self.prepare_source(doi=doi, filename=filename)
+        return self.source
+
+    def invoke(
+            self,
+            message: Optional[str] = None,
+            thread_id: str = "default",
+            verbose: bool = False,
+            callbacks: Optional[List[BaseCallbackHandler]] = None,
+            return_summary: bool = False,
+            doi: Optional[str] = None,
+            filename: Optional[str] = None,
+        ) -> Union[str, Tuple[str, RunSummary]]:
+        """
+        Run the agent on a thread. A new thread digests the source given by `doi` or
+        `filename` (default: the source given to the constructor); later messages on the thread
+        continue with its source. Without a message, an interrupted run of the thread is
+        resumed from its last completed step. With `verbose`, the cached and uncached input
+        tokens of every model turn and the run's telemetry summary are printed. `callbacks`
+        observe all model and tool calls of this run.
 
-    def invoke(self, message: str, thread_id: str) -> str:
+        Returns:
+            The agent's final answer, or (answer, RunSummary) with `return_summary`.
+            The summary is also kept in `last_summary`, even if the run fails.
+        """
+        telemetry, config = self._run_config(thread_id, callbacks)
+        state = self._agent.get_state(config).values
+        source = self.prepare_source(doi=doi, filename=filename) if message is not None and (doi or filename) else None
+        inputs = self._inputs(state, message, thread_id, source)
+        try:
+            result = self._agent.invoke(inputs, config=config)
+        finally:
+            summary = self.last_summary = telemetry.summary()
+        return self._answer(result["messages"], len(state.get("messages", [])), summary, verbose, return_summary)
+
+    async def ainvoke(
+            self,
+            message: Optional[str] = None,
+            thread_id: str = "default",
+            verbose: bool = False,
+            callbacks: Optional[List[BaseCallbackHandler]] = None,
+            return_summary: bool = False,
+            doi: Optional[str] = None,
+            filename: Optional[str] = None,
+        ) -> Union[str, Tuple[str, RunSummary]]:
+        """
+        Async version of `invoke`. Model calls are awaited and the tools run their async
+        versions, so one event loop can drive many digestions at the same time.
+        """
+        telemetry, config = self._run_config(thread_id, callbacks)
+        state = (await self._agent.aget_state(config)).values
+        source = None
+        if message is not None and (doi or filename):
+            # Adding a source fetches metadata and extracts the PDF, which blocks
+            source = await asyncio.to_thread(self.prepare_source, doi=doi, filename=filename)
+        inputs = self._inputs(state, message, thread_id, source)
+        try:
+            result = await self._agent.ainvoke(inputs, config=config)
+        finally:
+            summary = self.last_summary = telemetry.summary()
+        return self._answer(result["messages"], len(state.get("messages", [])), summary, verbose, return_summary)
+
+    def stream(
+            self,
+            message: Optional[str] = None,
+            thread_id: str = "default",
+            callbacks: Optional[List[BaseCallbackHandler]] = None,
+            doi: Optional[str] = None,
+            filename: Optional[str] = None,
+        ) -> Iterator[StreamEvent]:
+        """
+        Run the agent like `invoke`, yielding typed events as they happen: ingestion stages,
+        model turns with their token usage, tool calls, changed notes and finally `RunFinished`.
+        Stop iterating to cancel the run after its current step; it can be resumed later.
+        """
+        telemetry, config = self._run_config(thread_id, callbacks)
+        state = self._agent.get_state(config).values
+        source = None
+        if message is not None and (doi or filename):
+            stages: queue.Queue = queue.Queue()
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(self._staged_prepare(doi, filename, stages.put))
+                while (event := stages.get()) is not None:
+                    yield event
+            source = future.result()
+        inputs = self._inputs(state, message, thread_id, source)
+        task_events = TaskEvents()
+        try:
+            for chunk in self._agent.stream(inputs, config=config, stream_mode="tasks"):
+                yield from task_events(chunk)
+        finally:
+            summary = self.last_summary = telemetry.summary()
+        messages = self._agent.get_state(config).values.get("messages", [])
+        yield RunFinished(answer=self._answer(messages, len(state.get("messages", [])), summary, False, False), summary=summary)
+
+    async def astream(
+            self,
+            message: Optional[str] = None,
+            thread_id: str = "default",
+            callbacks: Optional[List[BaseCallbackHandler]] = None,
+            doi: Optional[str] = None,
+            filename: Optional[str] = None,
+        ) -> AsyncIterator[StreamEvent]:
+        """Async version of `stream`."""
+        telemetry, config = self._run_config(thread_id, callbacks)
+        state = (await self._agent.aget_state(config)).values
+        source = None
+        if message is not None and (doi or filename):
+            loop = asyncio.get_running_loop()
+            stages: asyncio.Queue = asyncio.Queue()
+            # Adding a source fetches metadata and extracts the PDF, which blocks
+            future = asyncio.ensure_future(asyncio.to_thread(
+                self._staged_prepare(doi, filename, lambda event: loop.call_soon_threadsafe(stages.put_nowait, event))
+            ))
+            while (event := await stages.get()) is not None:
+                yield event
+            source = await future
+        inputs = self._inputs(state, message, thread_id, source)
+        task_events = TaskEvents()
+        try:
+            async for chunk in self._agent.astream(inputs, config=config, stream_mode="tasks"):
+                for event in task_events(chunk):
+                    yield event
+        finally:
+            summary = self.last_summary = telemetry.summary()
+        messages = (await self._agent.aget_state(config)).values.get("messages", [])
+        yield RunFinished(answer=self._answer(messages, len(state.get("messages", [])), summary, False, False), summary=summary)
+
+    def _staged_prepare(self, doi: Optional[str], filename: Optional[str], put: Callable[[Optional[SourceStage]], None]) -> Callable[[], PreparedSource]:
+        """A function preparing the source that puts a `SourceStage` per stage and then None."""
+        def prepare() -> PreparedSource:
+            try:
+                return self.prepare_source(doi=doi, filename=filename, on_stage=lambda stage, name: put(SourceStage(stage=stage, filename=name)))
+            finally:
+                put(None)
+
+        return prepare
+
+    def _run_config(self, thread_id: str, callbacks: Optional[List[BaseCallbackHandler]]) -> Tuple[Telemetry, dict]:
+        telemetry = Telemetry(thread_id=thread_id, exporters=self._telemetry_exporters)
+        return telemetry, {
+            "configurable": {"thread_id": thread_id},
+            "recursion_limit": 60,
+            "callbacks": [telemetry, *self._callbacks, *(callbacks or [])],
+        }
+
+    def _inputs(self, state: dict, message: Optional[str], thread_id: str, source: Optional[PreparedSource]) -> Optional[dict]:
+        """The graph input for a message; the source is only set for new threads or when given."""
+        if message is None:
+            return None
         inputs = {"messages": [{"role": "user", "content": message}]}
-        config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 60}
+        if source is not None:
+            inputs["source_context"] = source.context
+        elif "source_context" not in state:
+            if self.source is None:
+                raise ValueError(f"Thread {thread_id!r} has no source yet: pass doi or filename.")
+            inputs["source_context"] = self.source.context
+        return inputs
 
-        result = self._agent.invoke(inputs, config=config)
+    def _answer(self, messages: list, previous: int, summary: RunSummary, verbose: bool, return_summary: bool) -> Union[str, Tuple[str, RunSummary]]:
+        # The run's results stay local: runs on other threads or tasks may share this agent
+        usage = self.last_usage = turn_usage(messages[previous:])
+        if verbose:
+            for turn in usage:
+                print(turn)
+            print(total_usage(usage))
+            print(summary)
 
-        final = result["messages"][-1]
-        return getattr(final, "content", str(final))
+        final = messages[-1]
+        answer = getattr(final, "content", str(final))
+        return (answer, summary) if return_summary else answer
 
     __call__ = invoke
 
+    def digest_with_plan(self, max_repairs: int = 2, doi: Optional[str] = None, filename: Optional[str] = None) -> ExecutionResult:
+        """
+        Digest a source (default: the constructor's) in plan-then-execute mode: the model
+        returns all vault changes as one plan, which is applied locally in one transaction.
+        The model is only called again if the plan conflicts with the vault.
+        """
+        source = self._resolve_source(doi, filename)
+        if source is None:
+            raise ValueError("Either doi or filename is required.")
+        return plan_and_execute(
+            self._llm,
+            [self._instructions, SystemMessage(content=source.context)],
+            vault_directory=self.vault_directory,
+            filename=source.filename,
+            query=f"Notes related to the claims, concepts and findings of this source:\n{source.md_content}",
+            stable_ids=self._stable_ids,
+            max_repairs=max_repairs,
+        )
+
+    def token_usage(self, thread_id: str = "default") -> List[TurnUsage]:
+        """Return the token usage of every model turn of a thread."""
+        snapshot = self._agent.get_state({"configurable": {"thread_id": thread_id}})
+        return turn_usage(snapshot.values.get("messages", []))
+
+    def list_threads(self) -> List[ThreadInfo]:
+        """List all checkpointed threads, most recently updated first."""
+        return list_threads(self.checkpointer)
+
+    def get_thread(self, thread_id: str) -> Optional[ThreadInfo]:
+        """Inspect a thread's latest checkpoint. Returns None for unknown threads."""
+        return _thread_info(thread_id, self._agent.get_state({"configurable": {"thread_id": thread_id}}))
+
+    async def aget_thread(self, thread_id: str) -> Optional[ThreadInfo]:
+        """Async version of `get_thread`."""
+        return _thread_info(thread_id, await self._agent.aget_state({"configurable": {"thread_id": thread_id}}))
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete all checkpoints of a thread."""
+        self.checkpointer.delete_thread(thread_id)
+
+    def prune_threads(self, older_than: Optional[timedelta] = None, keep_latest: Optional[int] = None) -> List[str]:
+        """Delete old threads. Returns the ids of the deleted threads."""
+        return prune_threads(self.checkpointer, older_than=older_than, keep_latest=keep_latest)
+
+
+def _thread_info(thread_id: str, snapshot: Any) -> Optional[ThreadInfo]:
+    """Summarize a thread's state snapshot. Returns None for unknown threads."""
+    if snapshot.created_at is None:
+        return None
+    return ThreadInfo(
+        thread_id=thread_id,
+        updated_at=snapshot.created_at,
+        step=(snapshot.metadata or {}).get("step", -1),
+        next=list(snapshot.next),
+        message_count=len(snapshot.values.get("messages", [])),
+    )
+
+
+@functools.cache
+def _digestion_state() -> type:
+    """The graph's state: the messages and the source context of the thread."""
+    from langgraph.prebuilt.chat_agent_executor import AgentState
+
+    class DigestionState(AgentState):
+        source_context: str
+
+    return DigestionState
+
+
+def _chat_model(model: str, cache: Optional[LLMCache] = None) -> BaseChatModel:
+    # Imported here: the OpenAI client is slow to import and not needed for injected models
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=model, use_responses_api=True, cache=cache)
+
+
+def _load_source(vault_directory: str, filename: str) -> dict:
+    """Load the files of a source that is already in the vault."""
+    return {
+        "filename": filename,
+        "raw_text": open(os.path.join(vault_directory, "sources", f"{filename}.txt"), "r", encoding="utf-8").read(),
+        "md_content": open(os.path.join(vault_directory, "s", f"{filename}.md"), "r", encoding="utf-8").read(),
+        "bib_content": open(os.path.join(vault_directory, "sources", f"{filename}.bib"), "r", encoding="utf-8").read()
+    }
+
+
+def _read_template(name: str) -> str:
+    with open(os.path.join(os.path.dirname(__file__), "templates", name), "r", encoding="utf-8") as f:
+        return f.read()
+
 
 if __name__ == "__main__":
     agent = SourceDigestionAgent(vault_directory="./example_vault", doi="10.48550/arXiv.2506.13131", model="gpt-5-mini", debug=True)
-    print(agent.invoke("Digest this source?", thread_id="example-thread"))
\ No newline at end of file
+    print(agent.invoke("Digest this source?", thread_id="example-thread", verbose=True))
\ No newline at end of file
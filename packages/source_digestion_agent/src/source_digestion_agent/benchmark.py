@@ -0,0 +1,139 @@
+"""
+Offline benchmarks of the agent on fixture vaults.
+
+`record_run` digests a source live and saves a `Recording` of all model and tool calls.
+`run_benchmark` replays a recording against a copy of a fixture vault, without network
+access, and reports the run's steps, tool time versus (recorded) model time, tokens and
+vault I/O. Changes to tools and prompts can then be compared on identical runs.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+from langgraph.checkpoint.memory import InMemorySaver
+from pydantic import BaseModel, Field
+
+from .agent import SourceDigestionAgent
+from .recording import Recorder, Recording, ReplayChatModel, replay_tools
+from .usage import total_usage
+from .vault_io import count_io
+
+
+class VaultIO(BaseModel):
+    """A Pydantic model for the file operations of a run inside the vault."""
+    reads: int = Field(default=0, description="Notes read by the run's tools.")
+    writes: int = Field(default=0, description="Notes written, renamed or removed by the run's tools.")
+    notes_created: int = Field(default=0, description="Notes that exist only after the run.")
+    notes_modified: int = Field(default=0, description="Notes whose size or modification time changed.")
+    notes_deleted: int = Field(default=0, description="Notes that exist only before the run.")
+
+
+class BenchmarkResult(BaseModel):
+    """A Pydantic model for the measurements of one replayed run."""
+    recording: str = Field(description="Path of the replayed recording.")
+    steps: int = Field(description="Model turns of the agent.")
+    tool_calls: int = Field(description="Tool calls of the agent.")
+    wall_seconds: float = Field(description="Duration of the replayed run.")
+    tool_seconds: float = Field(description="Summed duration of the replayed tool calls (parallel calls overlap).")
+    recorded_model_seconds: float = Field(description="Summed duration of the agent's model calls in the live run.")
+    input_tokens: int = Field(description="Input tokens of all turns, as recorded.")
+    cached_input_tokens: int = Field(description="Input tokens served from the prompt cache, as recorded.")
+    output_tokens: int = Field(description="Output tokens of all turns, as recorded.")
+    vault_io: VaultIO = Field(description="File operations inside the vault.")
+    error: Optional[str] = Field(default=None, description="The error the replay stopped with, if any.")
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.recording}",
+            f"  steps: {self.steps}, tool calls: {self.tool_calls}",
+            f"  wall: {self.wall_seconds:.2f}s, tools: {self.tool_seconds:.2f}s, model (recorded): {self.recorded_model_seconds:.2f}s",
+            f"  tokens: {self.input_tokens:,} input ({self.cached_input_tokens:,} cached), {self.output_tokens:,} output",
+            f"  vault: {self.vault_io.reads} reads, {self.vault_io.writes} writes, "
+            f"{self.vault_io.notes_created} created, {self.vault_io.notes_modified} modified, {self.vault_io.notes_deleted} deleted",
+        ]
+        if self.error:
+            lines.append(f"  error: {self.error}")
+        return "\n".join(lines)
+
+
+def _snapshot(vault_directory: str) -> dict[str, tuple[int, int]]:
+    notes = {}
+    for root, dirs, files in os.walk(vault_directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for filename in files:
+            if filename.endswith(".md"):
+                stat = os.stat(os.path.join(root, filename))
+                notes[os.path.relpath(os.path.join(root, filename), vault_directory)] = (stat.st_size, stat.st_mtime_ns)
+    return notes
+
+
+def record_run(
+        vault_directory: str,
+        output_path: str,
+        message: str = "Digest this source",
+        doi: Optional[str] = None,
+        filename: Optional[str] = None,
+        **agent_kwargs,
+    ) -> Recording:
+    """Digest a source live and save a recording of all model and tool calls."""
+    agent = SourceDigestionAgent(vault_directory=vault_directory, doi=doi, filename=filename, **agent_kwargs)
+    recorder = Recorder(filename=agent.filename, message=message)
+    agent.invoke(message, thread_id=f"record-{agent.filename}", callbacks=[recorder])
+    recorder.recording.save(output_path)
+    return recorder.recording
+
+
+def run_benchmark(recording_path: str, vault_directory: str, **agent_kwargs) -> BenchmarkResult:
+    """
+    Replay a recording against a copy of a fixture vault (which must contain the recorded
+    source) and measure the run. The fixture vault itself is not changed.
+    """
+    recording = Recording.load(recording_path)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        vault = os.path.join(tmpdir, "vault")
+        shutil.copytree(vault_directory, vault)
+
+        agent = SourceDigestionAgent(
+            vault_directory=vault,
+            filename=recording.filename,
+            llm=ReplayChatModel(responses=recording.responses()),
+            tool_wrappers=replay_tools(recording),
+            checkpointer=InMemorySaver(),
+            **agent_kwargs,
+        )
+        recorder = Recorder(filename=recording.filename, message=recording.message)
+        before = _snapshot(vault)
+        error = None
+        start = time.perf_counter()
+        with count_io() as io:
+            try:
+                agent.invoke(recording.message, thread_id="benchmark", callbacks=[recorder])
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+        wall_seconds = time.perf_counter() - start
+        after = _snapshot(vault)
+
+    replayed = recorder.recording
+    usage = total_usage(agent.last_usage)
+    return BenchmarkResult(
+        recording=recording_path,
+        steps=sum(1 for call in replayed.model_calls if call.node in (None, "agent")),
+        tool_calls=len(replayed.tool_calls),
+        wall_seconds=wall_seconds,
+        tool_seconds=sum(call.seconds for call in replayed.tool_calls),
+        recorded_model_seconds=sum(call.seconds for call in recording.model_calls if call.node in (None, "agent")),
+        input_tokens=usage.input_tokens,
+        cached_input_tokens=usage.cached_input_tokens,
+        output_tokens=usage.output_tokens,
+        vault_io=VaultIO(
+            reads=io.reads,
+            writes=io.writes,
+            notes_created=len(after.keys() - before.keys()),
+            notes_modified=sum(1 for note in after.keys() & before.keys() if after[note] != before[note]),
+            notes_deleted=len(before.keys() - after.keys()),
+        ),
+        error=error,
+    )
@@ -0,0 +1,106 @@
+"""
+Durable checkpoints for resumable digestion runs.
+
+By default every agent checkpoints its graph into `<vault>/.fasterscience/checkpoints.sqlite`
+after each step, so a run that died (rate limit, crash, Ctrl-C) can be resumed from its last
+completed step instead of being paid for again. Any LangGraph checkpointer can be plugged in.
+"""
+
+import asyncio
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, List, Optional, Sequence
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+from pydantic import BaseModel, Field
+
+from .note_index import INDEX_DIRECTORY
+
+CHECKPOINT_FILENAME = "checkpoints.sqlite"
+
+
+class ThreadInfo(BaseModel):
+    """A Pydantic model summarizing a checkpointed conversation thread."""
+    thread_id: str = Field(description="The id the thread was invoked with.")
+    updated_at: datetime = Field(description="Time of the thread's latest checkpoint.")
+    step: int = Field(description="Graph step of the thread's latest checkpoint.")
+    next: List[str] = Field(default_factory=list, description="Graph nodes still to run. Non-empty if the run was interrupted.")
+    message_count: Optional[int] = Field(default=None, description="Number of messages in the thread, if known.")
+
+
+class ThreadedSqliteSaver(SqliteSaver):
+    """SQLite checkpointer for sync and async runs: the async methods run the sync ones in a worker thread."""
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator:
+        checkpoints = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in checkpoints:
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def sqlite_checkpointer(path: str) -> SqliteSaver:
+    """Create a SQLite checkpointer that may be shared between threads and event loops."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    saver = ThreadedSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+    saver.setup()
+    return saver
+
+
+def default_checkpointer(vault_directory: str) -> SqliteSaver:
+    """Create the SQLite checkpointer stored inside the vault."""
+    return sqlite_checkpointer(os.path.join(vault_directory, INDEX_DIRECTORY, CHECKPOINT_FILENAME))
+
+
+def list_threads(checkpointer: BaseCheckpointSaver) -> List[ThreadInfo]:
+    """List all threads of a checkpointer with their latest checkpoint, most recent first."""
+    latest: dict[str, ThreadInfo] = {}
+    for checkpoint_tuple in checkpointer.list(None):
+        configurable = checkpoint_tuple.config["configurable"]
+        if configurable.get("checkpoint_ns"):
+            continue
+        info = ThreadInfo(
+            thread_id=configurable["thread_id"],
+            updated_at=checkpoint_tuple.checkpoint["ts"],
+            step=(checkpoint_tuple.metadata or {}).get("step", -1),
+        )
+        current = latest.get(info.thread_id)
+        if current is None or info.updated_at > current.updated_at:
+            latest[info.thread_id] = info
+    return sorted(latest.values(), key=lambda info: info.updated_at, reverse=True)
+
+
+def prune_threads(
+        checkpointer: BaseCheckpointSaver,
+        older_than: Optional[timedelta] = None,
+        keep_latest: Optional[int] = None,
+    ) -> List[str]:
+    """
+    Delete threads whose latest checkpoint is older than `older_than`, and/or all but
+    the `keep_latest` most recently updated threads.
+
+    Returns:
+        The ids of the deleted threads
+    """
+    threads = list_threads(checkpointer)
+    now = datetime.now(timezone.utc)
+    deleted = []
+    for position, info in enumerate(threads):
+        too_old = older_than is not None and now - info.updated_at > older_than
+        beyond_limit = keep_latest is not None and position >= keep_latest
+        if too_old or beyond_limit:
+            checkpointer.delete_thread(info.thread_id)
+            deleted.append(info.thread_id)
+    return deleted
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import time
+
+
+def main():
+    """CLI entry point for source-digestion-agent."""
+    parser = argparse.ArgumentParser(description="Digest academic sources into an Obsidian vault")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="Digest a source live and record all model and tool calls")
+    record.add_argument("--vault", help="Path to Obsidian vault (or set OBSIDIAN_VAULT_PATH)")
+    source = record.add_mutually_exclusive_group(required=True)
+    source.add_argument("--doi", help="DOI of the paper to digest")
+    source.add_argument("--filename", help="Filename of a source already in the vault")
+    record.add_argument("--output", required=True, help="Path of the recording to write (JSON)")
+    record.add_argument("--model", default="gpt-5-mini", help="Model of the agent")
+    record.add_argument("--message", default="Digest this source", help="Message to start the run with")
+
+    benchmark = subparsers.add_parser("benchmark", help="Replay recordings offline and report performance numbers")
+    benchmark.add_argument("recordings", nargs="+", help="Recordings to replay")
+    benchmark.add_argument("--vault", required=True, help="Fixture vault containing the recorded sources (not modified)")
+    benchmark.add_argument("--repeat", type=int, default=1, help="Replay every recording this many times")
+
+    tools = subparsers.add_parser("benchmark-tools", help="Time the note tools on synthetic vaults of several sizes")
+    tools.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="Numbers of notes of the generated vaults")
+    tools.add_argument("--samples", type=int, default=20, help="Timed calls per tool and size")
+    tools.add_argument("--seed", type=int, default=0, help="Seed of the generated vaults")
+    tools.add_argument("--output", help="Write the results as JSON to this file instead of stdout")
+
+    relevance = subparsers.add_parser("benchmark-relevance", help="Compare the recall of relevance block sizes with the live model")
+    relevance.add_argument("--notes", type=int, default=1_000, help="Number of notes of the generated vault")
+    relevance.add_argument("--queries", type=int, default=10, help="Topic queries with known relevant notes")
+    relevance.add_argument("--block-tokens", type=int, nargs="+", default=[750, 6_000], help="Block budgets to compare with blocks of 30 paths")
+    relevance.add_argument("--seed", type=int, default=0, help="Seed of the generated vault")
+
+    startup = subparsers.add_parser("benchmark-import", help="Measure the cold-start import time against a budget")
+    startup.add_argument("--module", default="source_digestion_agent.agent", help="Module to import")
+    startup.add_argument("--runs", type=int, default=3, help="Fresh interpreters to import the module in")
+    startup.add_argument("--budget", type=float, default=2.0, help="Budget for the median import time in seconds")
+
+    enqueue = subparsers.add_parser("enqueue", help="Add DOIs to the vault's job queue")
+    enqueue.add_argument("dois", nargs="+", help="DOIs of the papers to digest")
+    enqueue.add_argument("--vault", help="Path to Obsidian vault (or set OBSIDIAN_VAULT_PATH)")
+
+    jobs = subparsers.add_parser("jobs", help="Show the jobs of the vault's job queue")
+    jobs.add_argument("--vault", help="Path to Obsidian vault (or set OBSIDIAN_VAULT_PATH)")
+    jobs.add_argument("--status", choices=["queued", "running", "done", "dead"], help="Only show jobs with this status")
+
+    requeue = subparsers.add_parser("requeue", help="Move dead jobs back into the queue")
+    requeue.add_argument("dois", nargs="*", help="DOIs to requeue (default: all dead jobs)")
+    requeue.add_argument("--vault", help="Path to Obsidian vault (or set OBSIDIAN_VAULT_PATH)")
+
+    work = subparsers.add_parser("work", help="Digest queued jobs with a pool of workers")
+    work.add_argument("--vault", help="Path to Obsidian vault (or set OBSIDIAN_VAULT_PATH)")
+    work.add_argument("--workers", type=int, default=4, help="Number of jobs digested at the same time")
+    work.add_argument("--model", default="gpt-5-mini", help="Model of the agent")
+    work.add_argument("--max-attempts", type=int, default=3, help="Attempts before a job is moved to the dead-letter list")
+    work.add_argument("--until-idle", action="store_true", help="Exit once no job is due instead of waiting for new jobs")
+
+    duplicates = subparsers.add_parser("duplicates", help="Find clusters of near-duplicate notes and write a merge report")
+    duplicates.add_argument("--vault", help="Path to Obsidian vault (or set OBSIDIAN_VAULT_PATH)")
+    duplicates.add_argument("--folder", default="p", help="Folder of the notes to compare")
+    duplicates.add_argument("--threshold", type=float, help="Title similarity from which notes count as duplicates (default: 0.7)")
+    duplicates.add_argument("--output", help="Write the report as JSON to this file (review or edit it, then pass it to merge-duplicates)")
+
+    merge = subparsers.add_parser("merge-duplicates", help="Merge the clusters of a duplicate report and rewrite links")
+    merge.add_argument("report", help="Report written by the duplicates command")
+    merge.add_argument("--vault", help="Path to Obsidian vault (or set OBSIDIAN_VAULT_PATH)")
+    # Merging deletes notes, so the clusters to merge are always chosen explicitly
+    selection = merge.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--clusters", type=int, nargs="+", help="Numbers of the clusters to merge, as listed by duplicates")
+    selection.add_argument("--all", action="store_true", help="Merge every cluster of the report")
+
+    args = parser.parse_args()
+
+    if args.command in ("enqueue", "jobs", "requeue", "work"):
+        return _jobs_command(args)
+
+    if args.command in ("duplicates", "merge-duplicates"):
+        return _duplicates_command(args)
+
+    if args.command == "benchmark-import":
+        from .import_benchmark import measure_import_time
+
+        result = measure_import_time(args.module, runs=args.runs, budget_seconds=args.budget)
+        print(result.model_dump_json(indent=2))
+        return 0 if result.within_budget else 1
+
+    if args.command == "benchmark-tools":
+        from .vault_benchmark import run_tool_benchmarks
+
+        results = [result.model_dump() for result in run_tool_benchmarks(args.sizes, samples=args.samples, seed=args.seed)]
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+        return 0
+
+    if args.command == "benchmark-relevance":
+        from .vault_benchmark import compare_block_recall
+
+        results = compare_block_recall(notes=args.notes, queries=args.queries, block_tokens=args.block_tokens, seed=args.seed)
+        print(json.dumps([result.model_dump() for result in results], indent=2))
+        return 0
+
+    # Imported here so that `--help` does not load the agent's dependencies
+    from .benchmark import record_run, run_benchmark
+
+    if args.command == "record":
+        vault_path = args.vault or os.getenv("OBSIDIAN_VAULT_PATH")
+        if not vault_path:
+            print("Error: Please specify vault path with --vault or set OBSIDIAN_VAULT_PATH")
+            return 1
+        recording = record_run(vault_path, args.output, message=args.message, doi=args.doi, filename=args.filename, model=args.model)
+        print(f"Recorded {len(recording.model_calls)} model calls and {len(recording.tool_calls)} tool calls to {args.output}")
+        return 0
+
+    failed = False
+    for recording in args.recordings:
+        for _ in range(args.repeat):
+            result = run_benchmark(recording, args.vault)
+            print(result)
+            failed = failed or result.error is not None
+    return 1 if failed else 0
+
+
+def _jobs_command(args) -> int:
+    from .jobs import JobQueue, WorkerPool
+
+    vault_path = args.vault or os.getenv("OBSIDIAN_VAULT_PATH")
+    if not vault_path:
+        print("Error: Please specify vault path with --vault or set OBSIDIAN_VAULT_PATH")
+        return 1
+    queue = JobQueue.for_vault(vault_path, **({"max_attempts": args.max_attempts} if args.command == "work" else {}))
+
+    if args.command == "enqueue":
+        added = queue.enqueue(args.dois)
+        print(f"Queued {len(added)} new jobs ({len(args.dois) - len(added)} already known)")
+    elif args.command == "requeue":
+        print(f"Requeued {len(queue.requeue(args.dois or None))} dead jobs")
+    elif args.command == "jobs":
+        for job in queue.jobs(status=args.status):
+            error = f"  {job.last_error}" if job.status != "done" and job.last_error else ""
+            print(f"{job.status:8} {job.stage or '-':10} attempts={job.attempts}  {job.doi}{error}")
+        print(json.dumps(queue.counts()))
+    else:
+        pool = WorkerPool(vault_path, workers=args.workers, queue=queue, model=args.model)
+        if args.until_idle:
+            print(json.dumps(pool.run_until_idle()))
+        else:
+            pool.start()
+            print(f"Working with {args.workers} workers, press Ctrl-C to stop")
+            try:
+                while True:
+                    time.sleep(60)
+            except KeyboardInterrupt:
+                print("Stopping after the current jobs...")
+                pool.stop()
+    return 0
+
+
+def _duplicates_command(args) -> int:
+    from .duplicates import DuplicateReport, find_duplicates, merge_cluster
+
+    vault_path = args.vault or os.getenv("OBSIDIAN_VAULT_PATH")
+    if not vault_path:
+        print("Error: Please specify vault path with --vault or set OBSIDIAN_VAULT_PATH")
+        return 1
+
+    if args.command == "duplicates":
+        report = find_duplicates(vault_path, folder=args.folder, **({"threshold": args.threshold} if args.threshold else {}))
+        for number, cluster in enumerate(report.clusters, start=1):
+            print(f"{number}. keep {cluster.keep} ({cluster.inlinks.get(cluster.keep, 0)} inlinks)")
+            for duplicate in cluster.duplicates:
+                print(f"   merge {duplicate.note_title} (similarity {duplicate.similarity:.2f}, {cluster.inlinks.get(duplicate.note_title, 0)} inlinks)")
+        print(f"{len(report.clusters)} clusters among {report.notes} notes ({report.candidate_pairs} pairs compared in {report.seconds:.1f}s)")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(report.model_dump_json(indent=2))
+        return 0
+
+    with open(args.report, "r", encoding="utf-8") as f:
+        report = DuplicateReport.model_validate_json(f.read())
+    for number, cluster in enumerate(report.clusters, start=1):
+        if args.all or number in args.clusters:
+            for result in merge_cluster(vault_path, cluster):
+                print(result)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
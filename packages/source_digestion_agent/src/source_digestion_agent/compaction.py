@@ -0,0 +1,104 @@
+"""
+Compaction of the agent's message history before each model call.
+
+Every tool result stays in the checkpointed history, but the model only sees a compacted
+view of it: outputs of earlier reads of a note that was read again later are replaced by a
+short marker, tool outputs of older turns are cut down, and if the history still exceeds
+the token budget, the oldest turns are dropped as a whole (an AI message together with the
+results of its tool calls, so tool calls and results stay paired).
+"""
+
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from pydantic import BaseModel, Field
+
+# Tools whose output is the content of notes, and the argument holding the note title(s)
+NOTE_READ_TOOLS = {"read_note": "note_title", "read_notes": "note_titles"}
+
+
+class CompactionPolicy(BaseModel):
+    """A Pydantic model configuring how the message history is compacted for the model."""
+    keep_recent_turns: int = Field(default=4, description="Tool outputs of this many latest model turns are kept in full.")
+    max_tool_output_chars: int = Field(default=500, description="Tool outputs of older turns are cut to this many characters.")
+    dedupe_note_reads: bool = Field(default=True, description="Replace earlier reads of a note by a marker once it is read again.")
+    max_tokens: Optional[int] = Field(default=80_000, description="Approximate token budget of the history. None disables it.")
+
+
+def _note_titles(tool_call: dict) -> List[str]:
+    value = tool_call["args"].get(NOTE_READ_TOOLS[tool_call["name"]], [])
+    titles = [value] if isinstance(value, str) else list(value)
+    return [title.removesuffix(".md") for title in titles]
+
+
+def compact_messages(messages: Sequence[BaseMessage], policy: CompactionPolicy) -> List[BaseMessage]:
+    """Return the compacted view of a message history. The input messages are not modified."""
+    tool_calls: dict[str, tuple[dict, int]] = {}
+    turn = 0
+    for message in messages:
+        if isinstance(message, AIMessage):
+            turn += 1
+            for tool_call in message.tool_calls:
+                tool_calls[tool_call["id"]] = (tool_call, turn)
+    first_recent_turn = turn - policy.keep_recent_turns + 1
+
+    compacted: List[BaseMessage] = []
+    read_later: set[str] = set()
+    for message in reversed(messages):
+        if isinstance(message, ToolMessage) and isinstance(message.content, str) and message.tool_call_id in tool_calls:
+            tool_call, call_turn = tool_calls[message.tool_call_id]
+            content = message.content
+
+            if policy.dedupe_note_reads and tool_call["name"] in NOTE_READ_TOOLS:
+                titles = _note_titles(tool_call)
+                if titles and all(title in read_later for title in titles):
+                    content = f"[Outdated: {', '.join(titles)} was read again later. Use the latest read.]"
+                read_later.update(titles)
+
+            if call_turn < first_recent_turn and len(content) > policy.max_tool_output_chars:
+                elided = len(content) - policy.max_tool_output_chars
+                content = f"{content[:policy.max_tool_output_chars]}\n[... {elided:,} more characters of this earlier tool output elided ...]"
+
+            if content != message.content:
+                message = message.model_copy(update={"content": content})
+        compacted.append(message)
+    compacted.reverse()
+
+    if policy.max_tokens is not None:
+        compacted = _fit_budget(compacted, policy.max_tokens)
+    return compacted
+
+
+def _fit_budget(messages: List[BaseMessage], max_tokens: int) -> List[BaseMessage]:
+    """Drop the oldest turns (after the first user message) until the history fits the budget."""
+    if count_tokens_approximately(messages) <= max_tokens:
+        return messages
+
+    head_end = next((i + 1 for i, m in enumerate(messages) if isinstance(m, HumanMessage)), 0)
+    head = messages[:head_end]
+
+    # A turn is an AI message with the tool results that follow it; user messages stand alone
+    turns: List[List[BaseMessage]] = []
+    for message in messages[head_end:]:
+        if isinstance(message, ToolMessage) and turns:
+            turns[-1].append(message)
+        else:
+            turns.append([message])
+
+    dropped = 0
+    tokens = count_tokens_approximately(messages)
+    while len(turns) > 1 and tokens > max_tokens:
+        tokens -= count_tokens_approximately(turns.pop(0))
+        dropped += 1
+
+    marker = SystemMessage(content=f"[{dropped} earlier turns were removed from the context to stay within its budget. The notes they changed are in the vault.]")
+    return [*head, marker, *(message for turn in turns for message in turn)]
+
+
+def compaction_hook(policy: CompactionPolicy) -> Callable[[dict], dict]:
+    """Create a `pre_model_hook` that shows the model a compacted history without changing the stored one."""
+    def pre_model_hook(state: dict) -> dict:
+        return {"llm_input_messages": compact_messages(state["messages"], policy)}
+
+    return pre_model_hook
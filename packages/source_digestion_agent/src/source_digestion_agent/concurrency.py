@@ -0,0 +1,373 @@
+"""
+Adaptive concurrency control for model calls.
+
+`AdaptiveLimiter` bounds the number of model calls in flight with an AIMD (additive
+increase, multiplicative decrease) limit, like TCP congestion control: every healthy call
+raises the limit by about one per "window" of calls, while a rate limit (429) or a latency
+spike cuts it by a factor, at most once per cooldown. Calls that fail are retried with
+exponential backoff and jitter. Sync callers (threads) and async callers (event loops) wait
+for the same slots, so one limiter can be shared by all model callers of the process
+(`shared_limiter`).
+
+`Hedger` cuts tail latency: when a call has not answered after a high percentile of recent
+latencies, a duplicate is issued and the first valid response wins. The extra requests are
+capped at a fraction of all calls.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional, TypeVar
+
+from pydantic import BaseModel, Field
+
+T = TypeVar("T")
+
+# Calls faster than this never count as latency spikes
+MIN_SPIKE_SECONDS = 0.05
+
+
+def is_rate_limit(error: BaseException) -> bool:
+    """Whether an error is a provider rate limit (HTTP 429)."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or "ratelimit" in type(error).__name__.lower() or "429" in str(error)
+
+
+class LimiterStats(BaseModel):
+    """A Pydantic model for the state of an adaptive limiter."""
+    limit: float = Field(description="Current concurrency limit.")
+    in_flight: int = Field(description="Calls in flight.")
+    waiting: int = Field(description="Callers waiting for a slot.")
+    successes: int = Field(description="Successful calls.")
+    rate_limits: int = Field(description="Calls that hit a rate limit.")
+    errors: int = Field(description="Calls that failed otherwise.")
+    decreases: int = Field(description="Times the limit was cut.")
+    latency_seconds: Optional[float] = Field(default=None, description="Moving average latency of successful calls.")
+
+
+class AdaptiveLimiter:
+    """An AIMD concurrency limit shared by sync and async callers."""
+
+    def __init__(
+            self,
+            initial: int = 8,
+            minimum: int = 1,
+            maximum: int = 64,
+            backoff: float = 0.5,
+            cooldown: float = 2.0,
+            latency_spike: float = 3.0,
+            attempts: int = 3,
+            retry_delay: float = 1.0,
+        ) -> None:
+        """
+        Args:
+            initial, minimum, maximum: Bounds of the concurrency limit
+            backoff: Factor the limit is multiplied with on rate limits and latency spikes
+            cooldown: Seconds after a cut in which further problems do not cut the limit again
+            latency_spike: A call slower than this multiple of the average latency counts as a spike
+            attempts: Attempts per call in `call` and `acall`
+            retry_delay: Backoff before the first retry (doubles per attempt, with jitter)
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.latency_spike = latency_spike
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+        self._last_decrease = 0.0
+        self._latency: Optional[float] = None
+        self._samples = 0
+        self._stats = {"successes": 0, "rate_limits": 0, "errors": 0, "decreases": 0}
+
+    @property
+    def limit(self) -> int:
+        return max(self.minimum, int(self._limit))
+
+    def stats(self) -> LimiterStats:
+        with self._lock:
+            return LimiterStats(
+                limit=self._limit, in_flight=self._in_flight, waiting=len(self._waiters), latency_seconds=self._latency, **self._stats,
+            )
+
+    def _try_acquire(self, waiter: Any) -> bool:
+        """Take a slot, or queue the waiter (woken with a slot already taken for it)."""
+        with self._lock:
+            if self._in_flight < self.limit and not self._waiters:
+                self._in_flight += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def _release(self, seconds: Optional[float] = None, error: Optional[BaseException] = None) -> None:
+        """Free a slot, recording the call's outcome (unless the slot went unused)."""
+        with self._lock:
+            self._in_flight -= 1
+            if seconds is not None:
+                self._record(seconds, error)
+            # Hand free slots to waiters in arrival order
+            while self._waiters and self._in_flight < self.limit:
+                waiter = self._waiters.popleft()
+                self._in_flight += 1
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                else:
+                    loop, future = waiter
+                    loop.call_soon_threadsafe(_grant, future, self)
+
+    def _record(self, seconds: float, error: Optional[BaseException]) -> None:
+        now = time.monotonic()
+        if error is not None:
+            rate_limited = is_rate_limit(error)
+            self._stats["rate_limits" if rate_limited else "errors"] += 1
+            if rate_limited:
+                self._decrease(now)
+            return
+
+        self._stats["successes"] += 1
+        self._samples += 1
+        # Jitter of near-instant calls (e.g. cache hits) is no sign of an overloaded provider
+        spike = (
+            self._latency is not None and self._samples > 10
+            and seconds > max(self.latency_spike * self._latency, MIN_SPIKE_SECONDS)
+        )
+        self._latency = seconds if self._latency is None else 0.9 * self._latency + 0.1 * seconds
+        if spike:
+            self._decrease(now)
+        else:
+            # Additive increase: about +1 per limit's worth of healthy calls
+            self._limit = min(self.maximum, self._limit + 1 / self._limit)
+
+    def _decrease(self, now: float) -> None:
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._limit = max(self.minimum, self._limit * self.backoff)
+        self._stats["decreases"] += 1
+
+    def _abandon(self, waiter: tuple) -> None:
+        """Forget an async waiter that was cancelled, returning its slot if it was granted one."""
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return
+        future = waiter[1]
+        if future.done() and not future.cancelled():
+            self._release()
+        # Otherwise the pending grant sees the cancelled future and returns the slot
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold a slot while the block runs; its duration and error are recorded."""
+        event = threading.Event()
+        if not self._try_acquire(event):
+            event.wait()
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            # Cancelled calls (e.g. hedging losers) say nothing about the provider's health
+            self._release(None if isinstance(e, asyncio.CancelledError) else time.perf_counter() - start, e)
+            raise
+        self._release(time.perf_counter() - start, None)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        """Async version of `slot`: waits on the event loop instead of blocking a thread."""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        if not self._try_acquire(waiter):
+            try:
+                await waiter[1]
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            # Cancelled calls (e.g. hedging losers) say nothing about the provider's health
+            self._release(None if isinstance(e, asyncio.CancelledError) else time.perf_counter() - start, e)
+            raise
+        self._release(time.perf_counter() - start, None)
+
+    def _delay(self, attempt: int) -> float:
+        return self.retry_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+    def call(self, func: Callable[[], T]) -> T:
+        """Call `func` in a slot, retrying failures. The last failure is raised."""
+        for attempt in range(1, self.attempts + 1):
+            try:
+                with self.slot():
+                    return func()
+            except Exception:
+                if attempt == self.attempts:
+                    raise
+            time.sleep(self._delay(attempt))
+
+    async def acall(self, func: Callable[[], Awaitable[T]]) -> T:
+        """Async version of `call`."""
+        for attempt in range(1, self.attempts + 1):
+            try:
+                async with self.aslot():
+                    return await func()
+            except Exception:
+                if attempt == self.attempts:
+                    raise
+            await asyncio.sleep(self._delay(attempt))
+
+
+def _grant(future: asyncio.Future, limiter: AdaptiveLimiter) -> None:
+    if future.cancelled():
+        # The waiter gave up before its slot arrived
+        limiter._release()
+    else:
+        future.set_result(None)
+
+
+_shared: Optional[AdaptiveLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def shared_limiter() -> AdaptiveLimiter:
+    """The limiter shared by all model callers of the process."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AdaptiveLimiter()
+        return _shared
+
+
+class HedgeStats(BaseModel):
+    """A Pydantic model for the counters of a hedger."""
+    calls: int = Field(description="Calls made through the hedger.")
+    hedges: int = Field(description="Duplicate requests issued.")
+    hedge_wins: int = Field(description="Calls answered by the duplicate request.")
+    delay_seconds: Optional[float] = Field(default=None, description="Current hedging delay (None until enough latencies are known).")
+
+
+class Hedger:
+    """Issues a duplicate of a slow call; the first valid response wins and the other is cancelled."""
+
+    def __init__(
+            self,
+            percentile: float = 0.95,
+            budget: float = 0.1,
+            min_samples: int = 20,
+            history: int = 200,
+            min_delay: float = 0.05,
+            workers: int = 64,
+        ) -> None:
+        """
+        Args:
+            percentile: A duplicate is issued once a call is slower than this percentile of recent calls
+            budget: At most this fraction of calls get a duplicate request
+            min_samples: Latencies to observe before hedging starts
+            history: Number of recent latencies the percentile is computed from
+            min_delay: Lower bound of the hedging delay in seconds
+            workers: Threads of the sync version (sync calls cannot be cancelled: the loser's result is dropped)
+        """
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies: deque = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+
+    def delay(self) -> Optional[float]:
+        """Seconds after which a call gets a duplicate, or None while too few latencies are known."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            cut = statistics.quantiles(self._latencies, n=100, method="inclusive")[min(98, max(0, int(self.percentile * 100) - 1))]
+        return max(self.min_delay, cut)
+
+    def stats(self) -> HedgeStats:
+        delay = self.delay()
+        with self._lock:
+            return HedgeStats(calls=self._calls, hedges=self._hedges, hedge_wins=self._hedge_wins, delay_seconds=delay)
+
+    def _start(self) -> Optional[float]:
+        with self._lock:
+            self._calls += 1
+        return self.delay()
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            if self._hedges + 1 > self.budget * self._calls:
+                return False
+            self._hedges += 1
+            return True
+
+    def _finish(self, seconds: float, hedge_won: bool) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+            self._hedge_wins += hedge_won
+
+    def call(self, func: Callable[[], T], valid: Callable[[T], bool] = lambda result: True) -> T:
+        """Call `func`, hedged. Results failing `valid` only win if no request returns a valid one."""
+        delay = self._start()
+        start = time.perf_counter()
+        # The caller's context (e.g. callbacks, cache scope) is copied into each request's thread
+        futures = [self._executor.submit(contextvars.copy_context().run, func)]
+        try:
+            if delay is not None:
+                done, _ = wait(futures, timeout=delay)
+                if not done and self._may_hedge():
+                    futures.append(self._executor.submit(contextvars.copy_context().run, func))
+            pending, finished, winner = set(futures), [], None
+            while winner is None:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                finished += done
+                winner = _pick(finished, valid, done=not pending)
+        finally:
+            for future in futures:
+                future.cancel()
+        self._finish(time.perf_counter() - start, winner is not futures[0])
+        return winner.result()
+
+    async def acall(self, func: Callable[[], Awaitable[T]], valid: Callable[[T], bool] = lambda result: True) -> T:
+        """Async version of `call`; the losing request is cancelled."""
+        delay = self._start()
+        start = time.perf_counter()
+        tasks = [asyncio.ensure_future(func())]
+        try:
+            # Inside the try: if the caller is cancelled while waiting, no request is left running
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self._may_hedge():
+                    tasks.append(asyncio.ensure_future(func()))
+            pending, finished, winner = set(tasks), [], None
+            while winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                finished += done
+                winner = _pick(finished, valid, done=not pending)
+        finally:
+            for task in tasks:
+                task.cancel()
+        self._finish(time.perf_counter() - start, winner is not tasks[0])
+        return winner.result()
+
+
+def _pick(finished: list, valid: Callable[[Any], bool], done: bool):
+    """The first finished request with a valid result; once all are done, the best one there is."""
+    for future in finished:
+        if future.exception() is None and valid(future.result()):
+            return future
+    if done:
+        return next((future for future in finished if future.exception() is None), finished[0])
+    return None
@@ -0,0 +1,262 @@
+"""
+Vault-wide search for near-duplicate notes, and guided merging of them.
+
+`find_duplicates` compares the titles of all notes in a folder (by default the propositions in
+`p/`) with the measure of `create_note`'s near-duplicate guard: the cosine similarity of their
+character trigrams, without folder, confidence suffix and case, for titles that are
+`comparable` (e.g. not of opposite polarity). Comparing all pairs would be quadratic, so
+candidate pairs are found with MinHash signatures and locality-sensitive hashing (vectorized
+with NumPy), and only the candidate pairs are compared exactly. Similar notes are clustered
+with union-find, and every cluster is split so that each of its notes is at least `threshold`
+similar to the note it is merged into. The clusters form a `DuplicateReport`, which can be
+saved, reviewed and edited; `merge_cluster` then merges a cluster into the note to keep: the
+other notes' lines are appended to it, links to them are rewritten and they are deleted.
+"""
+
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from .note_index import INDEX_DIRECTORY, INDEX_FILENAME, NoteIndex, split_frontmatter
+from .similarity import DUPLICATE_THRESHOLD, SimilarNote, comparable, ngrams, title_key
+from .tools.change_note_title import _update_wikilinks_in_vault
+from .vault_io import atomic_write, note_lock
+
+# 32 bands of 3 MinHash rows: pairs with a trigram Jaccard similarity of 0.5 (a cosine of
+# about 0.7) share a band with 98% probability, pairs below 0.2 with less than 25%
+BANDS = 32
+ROWS = 3
+# Longer titles are compared by their start
+MAX_TITLE_CHARS = 200
+PAIRS_PER_CHUNK = 200_000
+_PRIME = (1 << 31) - 1
+
+_WIKILINK_TARGET = re.compile(rb"\[\[([^\]|#]+)")
+
+
+class DuplicateCluster(BaseModel):
+    """A Pydantic model for notes that likely state the same claim."""
+    keep: str = Field(description="The note to merge the others into: the most linked one.")
+    duplicates: List[SimilarNote] = Field(description="The other notes, with their similarity to the note to keep.")
+    inlinks: Dict[str, int] = Field(default_factory=dict, description="Number of links from other notes to each note of the cluster.")
+
+
+class DuplicateReport(BaseModel):
+    """A Pydantic model for the near-duplicate notes of a vault folder."""
+    folder: str = Field(description="The folder that was searched, e.g. 'p'.")
+    threshold: float = Field(description="Title similarity from which notes count as duplicates.")
+    notes: int = Field(description="Number of notes compared.")
+    candidate_pairs: int = Field(description="Pairs proposed by locality-sensitive hashing and compared exactly.")
+    clusters: List[DuplicateCluster] = Field(default_factory=list, description="Clusters of likely duplicates, largest first.")
+    seconds: float = Field(description="Duration of the search.")
+
+
+class _Trigrams:
+    """The trigram counts of many titles as padded arrays: one row of trigram ids (-1: none) and counts per title."""
+
+    def __init__(self, grams: Sequence[Counter]) -> None:
+        vocabulary: Dict[str, int] = {}
+        width = max(len(g) for g in grams)
+        self.ids = np.full((len(grams), width), -1, dtype=np.int64)
+        self.counts = np.zeros((len(grams), width), dtype=np.float64)
+        for i, note_grams in enumerate(grams):
+            self.ids[i, : len(note_grams)] = [vocabulary.setdefault(gram, len(vocabulary)) for gram in note_grams]
+            self.counts[i, : len(note_grams)] = list(note_grams.values())
+        self.vocabulary_size = len(vocabulary)
+        self.norms = np.sqrt((self.counts ** 2).sum(axis=1))
+
+    def signatures(self, seed: int) -> np.ndarray:
+        """MinHash signatures of the titles' trigram sets, one row per title."""
+        rng = np.random.default_rng(seed)
+        terms = np.arange(self.vocabulary_size, dtype=np.uint64)
+        signatures = np.empty((len(self.ids), BANDS * ROWS), dtype=np.uint64)
+        for k in range(BANDS * ROWS):
+            a, b = rng.integers(1, _PRIME, dtype=np.uint64), rng.integers(0, _PRIME, dtype=np.uint64)
+            # Hash every trigram once; padding hashes to the maximum, so it never is a minimum
+            hashed = np.append((a * terms + b) % np.uint64(_PRIME), np.uint64(np.iinfo(np.uint64).max))
+            signatures[:, k] = hashed[self.ids].min(axis=1)
+        return signatures
+
+    def cosines(self, pairs: np.ndarray) -> np.ndarray:
+        """Exact cosine similarities of pairs of titles (rows of indices)."""
+        result = np.empty(len(pairs))
+        for start in range(0, len(pairs), PAIRS_PER_CHUNK):
+            chunk = pairs[start : start + PAIRS_PER_CHUNK]
+            # Key every trigram by (pair, trigram id); after sorting, shared trigrams of a pair are adjacent
+            keys, values = [], []
+            for side in (0, 1):
+                ids = self.ids[chunk[:, side]]
+                present = ids >= 0
+                keys.append((np.arange(len(chunk))[:, None] * self.vocabulary_size + ids)[present])
+                values.append(self.counts[chunk[:, side]][present])
+            keys, values = np.concatenate(keys), np.concatenate(values)
+            order = np.argsort(keys, kind="stable")
+            keys, values = keys[order], values[order]
+            shared = keys[1:] == keys[:-1]
+            dots = np.bincount(
+                keys[:-1][shared] // self.vocabulary_size, weights=values[:-1][shared] * values[1:][shared], minlength=len(chunk)
+            )
+            result[start : start + len(chunk)] = dots / (self.norms[chunk[:, 0]] * self.norms[chunk[:, 1]])
+        return result
+
+
+def _candidate_pairs(signatures: np.ndarray, seed: int) -> np.ndarray:
+    """Pairs of titles (i < j) that share all MinHash rows of at least one band."""
+    rng = np.random.default_rng(seed)
+    pairs = []
+    for band in range(BANDS):
+        rows = signatures[:, band * ROWS : (band + 1) * ROWS]
+        keys = rows[:, 0].copy()
+        for row in range(1, ROWS):
+            keys = keys * np.uint64(1_000_003) ^ rows[:, row]
+        # Neighbours within a bucket, in a random order per band: linear in the bucket size,
+        # while the bands together pair up most members of small buckets
+        order = np.lexsort((rng.permutation(len(keys)), keys))
+        same = keys[order][1:] == keys[order][:-1]
+        pairs.append(np.stack([order[:-1][same], order[1:][same]], axis=1))
+    pairs_array = np.sort(np.concatenate(pairs), axis=1)
+    return np.unique(pairs_array, axis=0)
+
+
+def _cluster(count: int, edges: Sequence[Tuple[int, int]]) -> List[List[int]]:
+    """Connected components (of more than one title) of a similarity graph, with union-find."""
+    parent = list(range(count))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in edges:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    components: Dict[int, List[int]] = {}
+    for i in {node for edge in edges for node in edge}:
+        components.setdefault(find(i), []).append(i)
+    return [sorted(members) for members in components.values()]
+
+
+def count_inlinks(vault_directory: str, note_titles: Sequence[str]) -> Dict[str, int]:
+    """Number of notes linking to each of the given notes, in one pass over the vault."""
+    counts = {title: 0 for title in note_titles}
+    # Links may omit the folder
+    targets = {**{title.rsplit("/", 1)[-1]: title for title in note_titles}, **{title: title for title in note_titles}}
+
+    def links_in(paths: List[str]) -> List[str]:
+        linked_titles = []
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    found = _WIKILINK_TARGET.findall(f.read())
+            except OSError:
+                continue
+            own_title = os.path.relpath(path, vault_directory)[:-3].replace(os.sep, "/")
+            linked = {targets.get(target.decode("utf-8", "replace").strip().removesuffix(".md")) for target in found}
+            linked_titles += [title for title in linked if title is not None and title != own_title]
+        return linked_titles
+
+    paths = []
+    for root, dirs, files in os.walk(vault_directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        paths += [os.path.join(root, name) for name in files if name.endswith(".md")]
+    with ThreadPoolExecutor() as executor:
+        for linked in executor.map(links_in, [paths[i : i + 500] for i in range(0, len(paths), 500)]):
+            for title in linked:
+                counts[title] += 1
+    return counts
+
+
+def find_duplicates(vault_directory: str, folder: str = "p", threshold: float = DUPLICATE_THRESHOLD, seed: int = 0) -> DuplicateReport:
+    """Cluster the notes of a vault folder whose titles are at least `threshold` similar."""
+    start = time.perf_counter()
+    directory = os.path.join(vault_directory, folder)
+    names = sorted(f[:-3] for f in os.listdir(directory) if f.endswith(".md")) if os.path.isdir(directory) else []
+    titles, keys, grams = [], [], []
+    for name in names:
+        key = title_key(name)
+        note_grams = ngrams(key[:MAX_TITLE_CHARS])
+        if note_grams:
+            titles.append(f"{folder}/{name}")
+            keys.append(key)
+            grams.append(note_grams)
+
+    pairs = np.empty((0, 2), dtype=np.int64)
+    edges: List[Tuple[int, int]] = []
+    if len(titles) > 1:
+        trigrams = _Trigrams(grams)
+        pairs = _candidate_pairs(trigrams.signatures(seed), seed)
+        edges = [(int(i), int(j)) for i, j in pairs[trigrams.cosines(pairs) >= threshold] if comparable(keys[i], keys[j])]
+    components = _cluster(len(titles), edges)
+    inlinks = count_inlinks(vault_directory, [titles[i] for members in components for i in members]) if components else {}
+
+    clusters = []
+    for members in components:
+        # Chains (A~B~C) connect notes that are not duplicates of each other, so a component is
+        # split around notes to keep: each takes the remaining notes that are duplicates of it
+        remaining = list(members)
+        while len(remaining) > 1:
+            # Keep the most linked note (then the shortest title), so the fewest links have to change
+            keep = min(remaining, key=lambda i: (-inlinks[titles[i]], len(titles[i]), titles[i]))
+            others = np.array([i for i in remaining if i != keep])
+            similarities = trigrams.cosines(np.stack([np.full(len(others), keep), others], axis=1))
+            duplicates = sorted(
+                ((float(score), int(i)) for score, i in zip(similarities, others) if score >= threshold and comparable(keys[keep], keys[i])),
+                key=lambda item: -item[0],
+            )
+            remaining = [i for i in remaining if i != keep and i not in {i for _, i in duplicates}]
+            if duplicates:
+                clusters.append(DuplicateCluster(
+                    keep=titles[keep],
+                    duplicates=[SimilarNote(note_title=titles[i], similarity=round(score, 3)) for score, i in duplicates],
+                    inlinks={titles[i]: inlinks[titles[i]] for i in [keep] + [i for _, i in duplicates]},
+                ))
+    clusters.sort(key=lambda c: (-len(c.duplicates), c.keep))
+    return DuplicateReport(
+        folder=folder, threshold=threshold, notes=len(titles), candidate_pairs=len(pairs),
+        clusters=clusters, seconds=round(time.perf_counter() - start, 3),
+    )
+
+
+def merge_cluster(vault_directory: str, cluster: DuplicateCluster) -> List[str]:
+    """
+    Merge the duplicates of a cluster into its note to keep: append their lines that the kept
+    note lacks (not their title line), point all links at the kept note and delete them.
+
+    Returns:
+        One result message per duplicate
+    """
+    keep_path = os.path.join(vault_directory, cluster.keep + ".md")
+    if not os.path.exists(keep_path):
+        return [f"Note {cluster.keep} not found; nothing merged."]
+    index_exists = os.path.exists(os.path.join(vault_directory, INDEX_DIRECTORY, INDEX_FILENAME))
+
+    results = []
+    for duplicate in cluster.duplicates:
+        title = duplicate.note_title
+        path = os.path.join(vault_directory, title + ".md")
+        if not os.path.exists(path):
+            results.append(f"Note {title} not found; skipped.")
+            continue
+        updated = _update_wikilinks_in_vault(vault_directory, title, cluster.keep)
+        with note_lock(keep_path, path):
+            with open(keep_path, "r", encoding="utf-8") as f:
+                kept = f.read()
+            with open(path, "r", encoding="utf-8") as f:
+                _, body = split_frontmatter(f.read())
+            existing = {line.strip() for line in kept.splitlines()}
+            moved = [line for line in body.splitlines() if line.strip() and not line.startswith("# ") and line.strip() not in existing]
+            if moved:
+                atomic_write(keep_path, kept.rstrip("\n") + "\n" + "\n".join(moved) + "\n")
+            os.remove(path)
+        if index_exists:
+            NoteIndex.for_vault(vault_directory).forget(title)
+        results.append(f"Merged {title} into {cluster.keep}: moved {len(moved)} lines, updated links in {len(updated)} files")
+    return results
@@ -0,0 +1,170 @@
+"""
+Typed progress events of a streamed agent run.
+
+`SourceDigestionAgent.stream` and `astream` yield these events while the run is going on:
+the ingestion stages of the source, the start and end of every model turn (with its token
+usage), every tool call with its arguments and a summary of its result, every note the run
+created, edited, renamed or deleted, and finally the run's answer. They are derived from
+LangGraph's "tasks" stream mode, in which every graph node run (a model turn, a tool call)
+is reported when it starts and when it finishes.
+"""
+
+import json
+from typing import Any, Dict, List, Literal, Optional, Union
+
+from langchain_core.messages import AIMessage, ToolMessage
+from pydantic import BaseModel, Field
+
+from .telemetry import RunSummary
+from .usage import TurnUsage, turn_usage
+
+RESULT_SUMMARY_CHARS = 300
+
+# Tools that change notes: the argument with the changed notes, and the action
+_NOTE_CHANGES = {
+    "create_note": ("created", None),
+    "create_notes": ("created", "notes"),
+    "edit_note": ("edited", None),
+    "edit_notes": ("edited", "edits"),
+    "change_note_title": ("renamed", None),
+    "delete_note": ("deleted", None),
+}
+
+
+class SourceStage(BaseModel):
+    """A Pydantic model for a finished ingestion stage of the source."""
+    type: Literal["source_stage"] = "source_stage"
+    stage: str = Field(description="'metadata', 'downloaded', 'extracted', 'written' (when a DOI is added) or 'ready'.")
+    filename: str = Field(description="The source's filename in the vault.")
+
+
+class ModelTurnStarted(BaseModel):
+    """A Pydantic model for the start of a model turn."""
+    type: Literal["model_turn_started"] = "model_turn_started"
+    turn: int = Field(description="Number of the turn in this run (1-based).")
+
+
+class ModelTurnFinished(BaseModel):
+    """A Pydantic model for a finished model turn."""
+    type: Literal["model_turn_finished"] = "model_turn_finished"
+    turn: int = Field(description="Number of the turn in this run (1-based).")
+    usage: Optional[TurnUsage] = Field(default=None, description="Token usage of the turn, if the model reported it.")
+    tool_calls: List[str] = Field(default_factory=list, description="Names of the tools the model called.")
+    error: Optional[str] = Field(default=None, description="The error, if the turn failed.")
+
+
+class ToolCallStarted(BaseModel):
+    """A Pydantic model for the start of a tool call."""
+    type: Literal["tool_call_started"] = "tool_call_started"
+    tool: str = Field(description="The tool's name.")
+    call_id: str = Field(description="The id of the tool call.")
+    args: Dict[str, Any] = Field(default_factory=dict, description="The arguments of the call.")
+
+
+class ToolCallFinished(BaseModel):
+    """A Pydantic model for a finished tool call."""
+    type: Literal["tool_call_finished"] = "tool_call_finished"
+    tool: str = Field(description="The tool's name.")
+    call_id: str = Field(description="The id of the tool call.")
+    summary: str = Field(description=f"The start of the result (at most {RESULT_SUMMARY_CHARS} characters).")
+    error: Optional[str] = Field(default=None, description="The error, if the call failed.")
+
+
+class NoteChanged(BaseModel):
+    """A Pydantic model for a note the run created, edited, renamed or deleted."""
+    type: Literal["note_changed"] = "note_changed"
+    action: Literal["created", "edited", "renamed", "deleted"] = Field(description="What happened to the note.")
+    note_title: str = Field(description="The note's title (the new title of a renamed note).")
+    previous_title: Optional[str] = Field(default=None, description="The old title of a renamed note.")
+
+
+class RunFinished(BaseModel):
+    """A Pydantic model for the end of a run."""
+    type: Literal["run_finished"] = "run_finished"
+    answer: str = Field(description="The agent's final answer.")
+    summary: RunSummary = Field(description="Telemetry summary of the run.")
+
+
+StreamEvent = Union[SourceStage, ModelTurnStarted, ModelTurnFinished, ToolCallStarted, ToolCallFinished, NoteChanged, RunFinished]
+
+
+class TaskEvents:
+    """Turns the chunks of LangGraph's "tasks" stream mode of one run into stream events."""
+
+    def __init__(self) -> None:
+        self.turns = 0
+        self._calls: Dict[str, dict] = {}
+
+    def __call__(self, chunk: Dict[str, Any]) -> List[StreamEvent]:
+        name = chunk.get("name")
+        started = "input" in chunk
+        if name == "agent":
+            return self._model_turn(chunk, started)
+        if name == "tools":
+            return self._tool_call(chunk, started)
+        return []
+
+    def _model_turn(self, chunk: Dict[str, Any], started: bool) -> List[StreamEvent]:
+        if started:
+            self.turns += 1
+            return [ModelTurnStarted(turn=self.turns)]
+        messages = (chunk.get("result") or {}).get("messages", [])
+        message = next((m for m in reversed(messages) if isinstance(m, AIMessage)), None)
+        usage = turn_usage([message]) if message is not None else []
+        return [ModelTurnFinished(
+            turn=self.turns,
+            usage=usage[0].model_copy(update={"turn": self.turns}) if usage else None,
+            tool_calls=[call["name"] for call in getattr(message, "tool_calls", None) or []],
+            error=_error(chunk),
+        )]
+
+    def _tool_call(self, chunk: Dict[str, Any], started: bool) -> List[StreamEvent]:
+        if started:
+            call = (chunk["input"] or {}).get("tool_call") or {}
+            self._calls[chunk["id"]] = call
+            return [ToolCallStarted(tool=call.get("name", "unknown"), call_id=call.get("id") or "", args=call.get("args") or {})]
+
+        call = self._calls.pop(chunk["id"], {})
+        messages = (chunk.get("result") or {}).get("messages", [])
+        message = next((m for m in messages if isinstance(m, ToolMessage)), None)
+        content = message.content if message is not None and isinstance(message.content, str) else str(getattr(message, "content", ""))
+        error = _error(chunk) or (content if message is not None and message.status == "error" else None)
+        events: List[StreamEvent] = [ToolCallFinished(
+            tool=call.get("name", "unknown"),
+            call_id=call.get("id") or "",
+            summary=content[:RESULT_SUMMARY_CHARS],
+            error=error,
+        )]
+        if error is None:
+            events += note_changes(call.get("name", ""), call.get("args") or {}, content)
+        return events
+
+
+def note_changes(tool: str, args: Dict[str, Any], content: str) -> List[NoteChanged]:
+    """The notes a successful call of a note tool changed, from its arguments and result."""
+    if tool not in _NOTE_CHANGES:
+        return []
+    action, batch_argument = _NOTE_CHANGES[tool]
+    if batch_argument is None:
+        if not content.startswith("Successfully"):
+            return []
+        if action == "renamed":
+            return [NoteChanged(action=action, note_title=args.get("new_title", ""), previous_title=args.get("note_title"))]
+        return [NoteChanged(action=action, note_title=args.get("note_title", ""))]
+
+    # Batch tools return one result per item, in order
+    try:
+        results = json.loads(content)
+    except json.JSONDecodeError:
+        return []
+    changed = []
+    for item, result in zip(args.get(batch_argument) or [], results):
+        title = item.get("note_title", "") if isinstance(item, dict) else ""
+        if isinstance(result, str) and result.startswith("Successfully") and title not in changed:
+            changed.append(title)
+    return [NoteChanged(action=action, note_title=title) for title in changed]
+
+
+def _error(chunk: Dict[str, Any]) -> Optional[str]:
+    error = chunk.get("error")
+    return f"{type(error).__name__}: {error}" if error is not None else None
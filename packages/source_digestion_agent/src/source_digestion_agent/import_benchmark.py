@@ -0,0 +1,73 @@
+"""
+Cold-start benchmark: how long importing a module takes in a fresh interpreter.
+
+Every run imports the module in a new Python process with `-X importtime`, so nothing is
+cached in `sys.modules`. The result reports the median import time against a budget, the
+slowest imported modules, and whether heavy optional dependencies were loaded.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+from pydantic import BaseModel, Field
+
+DEFAULT_MODULE = "source_digestion_agent.agent"
+DEFAULT_BUDGET_SECONDS = 2.0
+# Dependencies that should only be imported when they are used
+HEAVY_MODULES = ("mlflow", "langchain_openai", "openai", "rich", "pymupdf4llm")
+
+_PROBE = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "seconds = time.perf_counter() - start\n"
+    "print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))\n"
+)
+
+
+class ImportTime(BaseModel):
+    """A Pydantic model for the cold-start import time of a module."""
+    module: str = Field(description="The imported module.")
+    runs: int = Field(description="Number of fresh interpreters the module was imported in.")
+    seconds: float = Field(description="Median import time.")
+    budget_seconds: float = Field(description="The import time budget.")
+    within_budget: bool = Field(description="Whether the median import time is within the budget.")
+    heavy_modules_loaded: List[str] = Field(default_factory=list, description="Heavy dependencies imported as a side effect.")
+    slowest: Dict[str, float] = Field(default_factory=dict, description="Import seconds of the slowest top-level packages, including their submodules (last run).")
+
+
+def measure_import_time(module: str = DEFAULT_MODULE, runs: int = 3, budget_seconds: float = DEFAULT_BUDGET_SECONDS) -> ImportTime:
+    """Import `module` in `runs` fresh interpreters and compare the median time to the budget."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    timings = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True, env=env, check=True,
+        )
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        timings.append(probe["seconds"])
+
+    slowest: Dict[str, float] = {}
+    for line in completed.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        package = parts[2].strip().split(".")[0]
+        slowest[package] = slowest.get(package, 0.0) + int(parts[0]) / 1_000_000
+
+    seconds = statistics.median(timings)
+    return ImportTime(
+        module=module,
+        runs=runs,
+        seconds=seconds,
+        budget_seconds=budget_seconds,
+        within_budget=seconds <= budget_seconds,
+        heavy_modules_loaded=probe["loaded"],
+        slowest=dict(sorted(slowest.items(), key=lambda item: -item[1])[:10]),
+    )
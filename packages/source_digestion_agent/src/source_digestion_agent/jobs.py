@@ -0,0 +1,372 @@
+"""
+Durable job queue and worker pool for digesting many sources.
+
+`JobQueue` is stored in `<vault>/.fasterscience/jobs.sqlite`. Every DOI is one job, which
+records the last finished stage (metadata, downloaded, extracted, written, ready, digested),
+its attempts and its last error. Failed jobs are retried with exponential backoff; jobs that
+fail `max_attempts` times are moved to the dead-letter list, from where they can be requeued.
+
+`WorkerPool` runs worker threads around one shared `SourceDigestionAgent`, so the graph,
+tools, model client and vault index stay warm across jobs. A claimed job is leased to its
+process, which renews the lease while it works on the job. Jobs whose lease expired (or whose
+process on this host is gone) are requeued on start, and their digestion resumes from its
+last checkpoint; jobs of live workers in other processes are left alone. An abandoned job
+counts as a failed attempt, so a job that keeps killing its worker ends up dead as well.
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from .note_index import INDEX_DIRECTORY
+
+JOBS_FILENAME = "jobs.sqlite"
+
+JobStatus = Literal["queued", "running", "done", "dead"]
+
+
+class Job(BaseModel):
+    """A Pydantic model for one digestion job."""
+    doi: str = Field(description="DOI of the source.")
+    status: JobStatus = Field(description="'queued', 'running', 'done' or 'dead' (failed too often).")
+    stage: Optional[str] = Field(default=None, description="The last finished stage, e.g. 'extracted' or 'digested'.")
+    filename: Optional[str] = Field(default=None, description="The source's filename in the vault, once known.")
+    attempts: int = Field(default=0, description="Attempts so far.")
+    next_attempt_at: float = Field(default=0.0, description="Unix time before which the job is not retried.")
+    last_error: Optional[str] = Field(default=None, description="The error of the last failed attempt.")
+    answer: Optional[str] = Field(default=None, description="The agent's final answer, once digested.")
+    owner: Optional[str] = Field(default=None, description="'host:pid' of the process working on the job, while running.")
+    lease_expires_at: Optional[float] = Field(default=None, description="Unix time after which a running job counts as abandoned.")
+    updated_at: datetime = Field(description="Time of the job's last change.")
+
+
+class JobQueue:
+    """A SQLite-backed queue of digestion jobs, safe to share between threads and processes."""
+
+    def __init__(
+            self,
+            path: str,
+            max_attempts: int = 3,
+            retry_delay: float = 30.0,
+            max_retry_delay: float = 3600.0,
+            lease_seconds: float = 300.0,
+        ) -> None:
+        """
+        Args:
+            lease_seconds: How long a claimed job stays with its process without a renewal
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "doi TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT, filename TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL DEFAULT 0, "
+                "last_error TEXT, answer TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "owner TEXT, lease_expires_at REAL)"
+            )
+            # Queues created before leases existed lack their columns
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_expires_at", "REAL")):
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, next_attempt_at)")
+
+    @classmethod
+    def for_vault(cls, vault_directory: str, **kwargs) -> "JobQueue":
+        """Open the job queue stored inside a vault."""
+        return cls(os.path.join(vault_directory, INDEX_DIRECTORY, JOBS_FILENAME), **kwargs)
+
+    def enqueue(self, dois: List[str]) -> List[str]:
+        """Add jobs for DOIs that have no job yet. Returns the DOIs that were added."""
+        added = []
+        now = time.time()
+        with self._lock:
+            for doi in dict.fromkeys(dois):
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO jobs (doi, status, created_at, updated_at) VALUES (?, 'queued', ?, ?)",
+                    (doi, now, now),
+                )
+                if cursor.rowcount:
+                    added.append(doi)
+        return added
+
+    def claim(self) -> Optional[Job]:
+        """Mark the oldest job that is due as running, leased to this process, and return it (None if no job is due)."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT doi FROM jobs WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY created_at LIMIT 1", (now,)
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_expires_at = ?, updated_at = ? "
+                        "WHERE doi = ?",
+                        (self.owner, now + self.lease_seconds, now, row[0]),
+                    )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def renew(self) -> int:
+        """Extend the leases of the running jobs of this process. Returns the number of renewed jobs."""
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE status = 'running' AND owner = ?",
+                (time.time() + self.lease_seconds, self.owner),
+            )
+        return cursor.rowcount
+
+    def record_stage(self, doi: str, stage: str, filename: Optional[str] = None) -> None:
+        """Record that a job finished a stage."""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET stage = ?, filename = COALESCE(?, filename), updated_at = ? WHERE doi = ?",
+                (stage, filename, time.time(), doi),
+            )
+
+    def complete(self, doi: str, answer: str) -> None:
+        """Mark a job as digested."""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = 'done', stage = 'digested', answer = ?, last_error = NULL, owner = NULL, "
+                "lease_expires_at = NULL, updated_at = ? WHERE doi = ?",
+                (answer, time.time(), doi),
+            )
+
+    def fail(self, doi: str, error: str) -> Job:
+        """Record a failed attempt: retry the job after a backoff, or move it to the dead-letter list."""
+        with self._lock:
+            attempts = self._connection.execute("SELECT attempts FROM jobs WHERE doi = ?", (doi,)).fetchone()[0]
+            now = time.time()
+            if attempts >= self.max_attempts:
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'dead', last_error = ?, owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE doi = ?",
+                    (error, now, doi),
+                )
+            else:
+                delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'queued', last_error = ?, next_attempt_at = ?, owner = NULL, lease_expires_at = NULL, "
+                    "updated_at = ? WHERE doi = ?",
+                    (error, now + delay, now, doi),
+                )
+        return self.get(doi)
+
+    def requeue(self, dois: Optional[List[str]] = None) -> List[str]:
+        """Move dead jobs (all, or the given ones) back into the queue with fresh attempts."""
+        with self._lock:
+            rows = self._connection.execute("SELECT doi FROM jobs WHERE status = 'dead'").fetchall()
+            requeued = [doi for (doi,) in rows if dois is None or doi in dois]
+            for doi in requeued:
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'queued', attempts = 0, next_attempt_at = 0, updated_at = ? WHERE doi = ?",
+                    (time.time(), doi),
+                )
+        return requeued
+
+    def recover(self) -> List[str]:
+        """
+        Requeue running jobs that were abandoned: their lease expired, or their process on this
+        host is gone. A job that was abandoned on its last attempt (e.g. because it keeps killing
+        its worker) is moved to the dead-letter list instead. Returns the requeued DOIs.
+        """
+        now = time.time()
+        recovered = []
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._connection.execute(
+                    "SELECT doi, owner, lease_expires_at, attempts FROM jobs WHERE status = 'running'"
+                ).fetchall()
+                for doi, owner, expires_at, attempts in rows:
+                    if expires_at is not None and expires_at >= now and _alive(owner):
+                        continue
+                    if attempts >= self.max_attempts:
+                        print(f"Moving {doi} to the dead-letter list: its worker died in attempt {attempts}")
+                        self._connection.execute(
+                            "UPDATE jobs SET status = 'dead', last_error = ?, owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                            "WHERE doi = ?",
+                            (f"Worker died (owner {owner}, attempt {attempts})", now, doi),
+                        )
+                    else:
+                        self._connection.execute(
+                            "UPDATE jobs SET status = 'queued', owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE doi = ?",
+                            (now, doi),
+                        )
+                        recovered.append(doi)
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return recovered
+
+    def get(self, doi: str) -> Optional[Job]:
+        """Return the job of a DOI, or None if there is none."""
+        jobs = self.jobs(doi=doi)
+        return jobs[0] if jobs else None
+
+    def jobs(self, status: Optional[JobStatus] = None, doi: Optional[str] = None) -> List[Job]:
+        """List jobs, optionally only those with a status, oldest first."""
+        query = (
+            "SELECT doi, status, stage, filename, attempts, next_attempt_at, last_error, answer, owner, lease_expires_at, updated_at FROM jobs"
+        )
+        conditions, parameters = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            parameters.append(status)
+        if doi is not None:
+            conditions.append("doi = ?")
+            parameters.append(doi)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY created_at", parameters).fetchall()
+        return [
+            Job(
+                doi=row[0], status=row[1], stage=row[2], filename=row[3], attempts=row[4], next_attempt_at=row[5],
+                last_error=row[6], answer=row[7], owner=row[8], lease_expires_at=row[9],
+                updated_at=datetime.fromtimestamp(row[10], timezone.utc),
+            )
+            for row in rows
+        ]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        with self._lock:
+            rows = self._connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def _alive(owner: Optional[str]) -> bool:
+    """Whether the process of an owner ('host:pid') may still be running. Processes on other hosts are assumed alive."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit() or os.name != "posix":
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class WorkerPool:
+    """Worker threads digesting the jobs of a queue with one shared agent."""
+
+    def __init__(
+            self,
+            vault_directory: str,
+            workers: int = 4,
+            queue: Optional[JobQueue] = None,
+            message: str = "Digest this source",
+            poll_interval: float = 1.0,
+            agent=None,
+            **agent_kwargs,
+        ) -> None:
+        """
+        Args:
+            workers: Number of jobs digested at the same time
+            queue: The job queue (default: the vault's)
+            agent: The agent to share between the workers (default: a new `SourceDigestionAgent(**agent_kwargs)`)
+        """
+        if agent is None:
+            from .agent import SourceDigestionAgent
+
+            agent = SourceDigestionAgent(vault_directory=vault_directory, **agent_kwargs)
+        self.agent = agent
+        self.queue = queue if queue is not None else JobQueue.for_vault(vault_directory)
+        self.message = message
+        self.poll_interval = poll_interval
+        self._workers = workers
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._idle = threading.Semaphore(0)
+
+    def run_job(self, job: Job) -> None:
+        """Digest one claimed job and record its stages and outcome."""
+        thread_id = f"digest-{job.doi}"
+        try:
+            # Interrupted runs (earlier attempts or processes) resume from their last checkpoint
+            thread = self.agent.get_thread(thread_id)
+            if thread and thread.next:
+                events = self.agent.stream(None, thread_id=thread_id)
+            else:
+                events = self.agent.stream(self.message, thread_id=thread_id, doi=job.doi)
+            answer = ""
+            for event in events:
+                if event.type == "source_stage":
+                    self.queue.record_stage(job.doi, event.stage, event.filename)
+                elif event.type == "run_finished":
+                    answer = event.answer
+            self.queue.complete(job.doi, answer)
+            print(f"Digested {job.doi}")
+        except Exception as e:
+            failed = self.queue.fail(job.doi, f"{type(e).__name__}: {e}")
+            print(f"Digestion of {job.doi} failed (attempt {failed.attempts}, now {failed.status}): {e}")
+
+    def _heartbeat(self) -> None:
+        # Renew well before the leases expire, so live jobs are never recovered by another process
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            self.queue.renew()
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self._idle.release()
+                self._stop.wait(self.poll_interval)
+                continue
+            self.run_job(job)
+
+    def start(self) -> None:
+        """Requeue abandoned jobs and start the workers (and the renewal of their leases)."""
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"Requeued {len(recovered)} interrupted jobs")
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._work, name=f"digest-worker-{i}", daemon=True) for i in range(self._workers)]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="digest-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """Stop the workers after their current job."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def run_until_idle(self) -> Dict[str, int]:
+        """Start the workers, digest all jobs that are due, stop and return the job counts."""
+        self.start()
+        try:
+            while True:
+                self._idle.acquire()
+                counts = self.queue.counts()
+                if not counts.get("running") and not self._due():
+                    break
+        finally:
+            self.stop()
+        return self.queue.counts()
+
+    def _due(self) -> bool:
+        return any(job.next_attempt_at <= time.time() for job in self.queue.jobs(status="queued"))
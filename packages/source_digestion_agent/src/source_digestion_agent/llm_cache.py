@@ -0,0 +1,154 @@
+"""
+Persistent cache for model responses.
+
+`LLMCache` is a LangChain cache stored in `<vault>/.fasterscience/llm_cache.sqlite`. LangChain
+keys every chat model call by its serialized messages and a string of the model's name,
+parameters and bound tools, so identical calls (e.g. the same relevance query over the same
+block of notes) are answered from disk instead of the provider.
+
+Calls whose answer depends on more than their messages can add a scope to the key with
+`LLMCache.scoped`: `list_relevant_notes` scopes each block by the notes' modification times
+and sizes, so a block's cached answer is dropped as soon as one of its notes changes. A scope
+can also say which answers are valid: invalid ones (e.g. without the expected tool call) are
+neither stored nor served, so retrying the call asks the model again.
+The cache evicts the least recently used entries once it exceeds its size limit.
+"""
+
+import contextlib
+import contextvars
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+from .note_index import INDEX_DIRECTORY
+
+CACHE_FILENAME = "llm_cache.sqlite"
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+# Only model outputs are revived from the cache file
+_CACHED_TYPES = [AIMessage, ChatGeneration, Generation]
+
+_scope: contextvars.ContextVar[str] = contextvars.ContextVar("llm_cache_scope", default="")
+_valid: contextvars.ContextVar[Optional[Callable[[Any], bool]]] = contextvars.ContextVar("llm_cache_valid", default=None)
+
+
+def fingerprint_files(paths: Sequence[str]) -> str:
+    """Fingerprint files by path, modification time and size (missing files included)."""
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode("utf-8"))
+        except FileNotFoundError:
+            digest.update(f"{path}\0missing\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class LLMCache(BaseCache):
+    """
+    A SQLite-backed LangChain cache with least-recently-used eviction.
+
+    Use `LLMCache.for_vault` to share one instance between all models of a vault.
+    """
+
+    _instances: dict[str, "LLMCache"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @classmethod
+    def for_vault(cls, vault_directory: str) -> "LLMCache":
+        """Return the shared cache instance of a vault directory."""
+        path = os.path.join(vault_directory, INDEX_DIRECTORY, CACHE_FILENAME)
+        key = os.path.realpath(path)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(path)
+            return cls._instances[key]
+
+    @staticmethod
+    @contextlib.contextmanager
+    def scoped(scope: str, valid: Optional[Callable[[Any], bool]] = None) -> Iterator[None]:
+        """
+        Add `scope` to the keys of all lookups and updates in this context. With `valid`, only
+        responses (messages) passing it are stored or served.
+        """
+        token, valid_token = _scope.set(scope), _valid.set(valid)
+        try:
+            yield
+        finally:
+            _scope.reset(token)
+            _valid.reset(valid_token)
+
+    @staticmethod
+    def _is_valid(return_val: RETURN_VAL_TYPE) -> bool:
+        valid = _valid.get()
+        return valid is None or all(valid(getattr(generation, "message", generation)) for generation in return_val)
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{_scope.get()}\0{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self._connection:
+                self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        try:
+            return_val = loads(row[0], allowed_objects=_CACHED_TYPES)
+        except Exception:
+            # Entries written by an incompatible LangChain version are treated as misses
+            return None
+        return return_val if self._is_valid(return_val) else None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if not self._is_valid(return_val):
+            return
+        value = dumps(list(return_val))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (self._key(prompt, llm_string), value, len(value), time.time()),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the cache fits `max_bytes`."""
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
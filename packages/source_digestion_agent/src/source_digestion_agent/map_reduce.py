@@ -0,0 +1,176 @@
+"""
+Map-reduce extraction of a source's propositions.
+
+The map step extracts candidate propositions with their pro and con arguments from every
+section of a source in parallel model calls, so the wall-clock time is bounded by the
+slowest section. The reduce step merges candidates that state the same thing into one
+digestion plan, which the note-writing agent then works through.
+
+Plans are cached in `<vault>/.fasterscience/plans/<filename>.json`, so resumed or repeated
+runs of the same source see the same plan without extracting it again. Plans with sections
+that could not be extracted are not cached, so the next run extracts them again.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel, Field
+
+from .concurrency import shared_limiter
+from .note_index import INDEX_DIRECTORY
+from .source_text import SourceDocument
+from .vault_io import atomic_write
+
+PLAN_DIRECTORY = "plans"
+
+
+class CandidateProposition(BaseModel):
+    """A Pydantic model for a proposition extracted from a source, with its arguments."""
+    statement: str = Field(description="The proposition as one self-contained sentence, understandable without the source.")
+    pro: List[str] = Field(default_factory=list, description="Arguments or evidence from the source supporting the proposition.")
+    con: List[str] = Field(default_factory=list, description="Arguments or evidence from the source contradicting the proposition.")
+    sections: List[int] = Field(default_factory=list, description="Table-of-contents indices of the sections the proposition was found in.")
+
+
+class PropositionList(BaseModel):
+    """A Pydantic model for the propositions extracted from one section, or merged from all."""
+    propositions: List[CandidateProposition] = Field(default_factory=list, description="The propositions.")
+
+
+class IncompleteExtractionError(RuntimeError):
+    """Raised when sections of a source could not be extracted, even after retries."""
+
+    def __init__(self, message: str, propositions: List[CandidateProposition], failed_sections: Sequence[int]) -> None:
+        super().__init__(message)
+        self.propositions = propositions
+        self.failed_sections = list(failed_sections)
+
+
+MAP_PROMPT = (
+    "Extract every statement (proposition) the following section of a source makes, together with "
+    "the supporting (pro) and contradicting (con) arguments the section gives for it. "
+    "Phrase each proposition as one self-contained sentence. Only use information from the section. "
+    "Sections without propositions of their own (e.g. references, acknowledgements) yield an empty list."
+)
+
+REDUCE_PROMPT = (
+    "The following propositions were extracted section by section from the same source. "
+    "Merge propositions that state the same thing into one: keep the clearest phrasing, combine their "
+    "pro and con arguments without repeating any, and combine their section indices. "
+    "Keep all other propositions unchanged. Do not add anything that is not in the list."
+)
+
+
+def extract_section(llm: BaseChatModel, document: SourceDocument, index: int, filename: str) -> List[CandidateProposition]:
+    """Map step: extract the candidate propositions of one section."""
+    section = document.sections[index - 1]
+    response = llm.with_structured_output(PropositionList).invoke([
+        SystemMessage(content=MAP_PROMPT),
+        HumanMessage(content=f"Source: {filename}\nSection [{section.index}] {section.title}\n\n{document.section(index)}"),
+    ])
+    for proposition in response.propositions:
+        proposition.sections = [index]
+    return response.propositions
+
+
+def merge_propositions(llm: BaseChatModel, candidates: List[CandidateProposition]) -> List[CandidateProposition]:
+    """Reduce step: merge candidates that state the same thing."""
+    if len(candidates) <= 1:
+        return candidates
+    response = llm.with_structured_output(PropositionList).invoke([
+        SystemMessage(content=REDUCE_PROMPT),
+        HumanMessage(content=PropositionList(propositions=candidates).model_dump_json(indent=1)),
+    ])
+    return response.propositions
+
+
+def extract_propositions(
+        llm: BaseChatModel,
+        document: SourceDocument,
+        filename: str,
+        concurrency: int = 8,
+    ) -> List[CandidateProposition]:
+    """
+    Extract the propositions of a whole source: all sections in parallel, then one merge.
+
+    Raises:
+        IncompleteExtractionError: If sections failed; it carries the merged propositions of
+            the other sections, so one bad section does not cost the whole source
+    """
+    indices = [section.index for section in document.sections]
+    failed: List[int] = []
+
+    def extract(index: int) -> List[CandidateProposition]:
+        try:
+            # Model calls share the process-wide adaptive limit and are retried on failure
+            return shared_limiter().call(lambda: extract_section(llm, document, index, filename))
+        except Exception as e:
+            print(f"Extraction of section {index} of {filename} failed: {e}")
+            failed.append(index)
+            return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(indices)))) as executor:
+        # map keeps the section order, so the merged plan follows the source
+        candidates = [proposition for propositions in executor.map(extract, indices) for proposition in propositions]
+
+    if len(failed) == len(indices) and indices:
+        raise IncompleteExtractionError(f"No section of {filename} could be extracted.", [], failed)
+    propositions = merge_propositions(llm, candidates)
+    if failed:
+        raise IncompleteExtractionError(
+            f"{len(failed)} of {len(indices)} sections of {filename} could not be extracted: {sorted(failed)}",
+            propositions,
+            sorted(failed),
+        )
+    return propositions
+
+
+def render_plan(propositions: List[CandidateProposition]) -> str:
+    """Render a digestion plan as compact Markdown."""
+    lines = []
+    for number, proposition in enumerate(propositions, start=1):
+        sections = ", ".join(f"[{index}]" for index in proposition.sections)
+        lines.append(f"{number}. {proposition.statement} (sections {sections})" if sections else f"{number}. {proposition.statement}")
+        lines.extend(f"    - Pro: {argument}" for argument in proposition.pro)
+        lines.extend(f"    - Con: {argument}" for argument in proposition.con)
+    return "\n".join(lines)
+
+
+def plan_path(vault_directory: str, filename: str) -> str:
+    """Return the path of a source's cached digestion plan."""
+    return os.path.join(vault_directory, INDEX_DIRECTORY, PLAN_DIRECTORY, f"{filename}.json")
+
+
+def load_or_extract_plan(
+        llm: BaseChatModel,
+        vault_directory: str,
+        filename: str,
+        document: Optional[SourceDocument] = None,
+        concurrency: int = 8,
+    ) -> List[CandidateProposition]:
+    """
+    Load a source's cached digestion plan, or extract and cache it.
+
+    If some sections could not be extracted, the plan of the others is returned but not
+    cached. If no propositions could be extracted, IncompleteExtractionError is raised.
+    """
+    path = plan_path(vault_directory, filename)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return PropositionList.model_validate(json.load(f)).propositions
+
+    document = document or SourceDocument.from_vault(vault_directory, filename)
+    try:
+        propositions = extract_propositions(llm, document, filename, concurrency=concurrency)
+    except IncompleteExtractionError as e:
+        if not e.propositions:
+            raise
+        print(f"{e} The plan is not cached, so the next run extracts it again.")
+        return e.propositions
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write(path, PropositionList(propositions=propositions).model_dump_json(indent=2))
+    return propositions
@@ -0,0 +1,215 @@
+"""
+Stable note identity for Obsidian vault integration.
+
+Notes can carry a frontmatter `id` and a list of `aliases` (their former titles).
+The `NoteIndex` keeps a persistent map from ids and old titles to the current note
+title, so renaming a note (e.g. a confidence update) only rewrites that note and the
+index instead of every note linking to it.
+"""
+
+import json
+import os
+import re
+import threading
+import uuid
+
+INDEX_DIRECTORY = ".fasterscience"
+INDEX_FILENAME = "note_index.json"
+
+_FRONTMATTER_PATTERN = re.compile(r"\A---\n(.*?)\n---\n?", re.DOTALL)
+
+
+def normalize_title(note_title: str) -> str:
+    """Strip a trailing '.md' and surrounding whitespace from a note title."""
+    note_title = note_title.strip()
+    return note_title[:-3] if note_title.endswith(".md") else note_title
+
+
+def split_frontmatter(content: str) -> tuple[dict[str, str], str]:
+    """
+    Split a note into its frontmatter fields (raw string values) and its body.
+
+    Only flat `key: value` lines are understood, which is all the vault tooling writes.
+    """
+    match = _FRONTMATTER_PATTERN.match(content)
+    if not match:
+        return {}, content
+    fields: dict[str, str] = {}
+    for line in match.group(1).splitlines():
+        key, sep, value = line.partition(":")
+        if sep and key.strip() and not key.startswith((" ", "\t", "-")):
+            fields[key.strip()] = value.strip()
+    return fields, content[match.end():]
+
+
+def set_frontmatter_fields(content: str, updates: dict[str, str]) -> str:
+    """Set raw frontmatter values on a note, keeping all other lines untouched."""
+    match = _FRONTMATTER_PATTERN.match(content)
+    lines = match.group(1).splitlines() if match else []
+    body = content[match.end():] if match else content
+    remaining = dict(updates)
+    for i, line in enumerate(lines):
+        key = line.partition(":")[0].strip()
+        if key in remaining:
+            lines[i] = f"{key}: {remaining.pop(key)}"
+    lines.extend(f"{key}: {value}" for key, value in remaining.items())
+    return "---\n" + "\n".join(lines) + "\n---\n" + body
+
+
+def parse_aliases(raw: str | None) -> list[str]:
+    """Parse a frontmatter `aliases` value written as a flow list or a single title."""
+    if not raw:
+        return []
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw.strip("[]").split(",")
+    if isinstance(value, str):
+        value = [value]
+    return [str(alias).strip().strip("\"'") for alias in value if str(alias).strip()]
+
+
+def new_note_id() -> str:
+    """Generate a new stable note id."""
+    return uuid.uuid4().hex[:12]
+
+
+class NoteIndex:
+    """
+    Persistent title index mapping note ids and former titles to current titles.
+
+    The index lives at `<vault>/.fasterscience/note_index.json` and is only a cache:
+    it is rebuilt from the notes' frontmatter whenever it is missing or stale.
+    Use `NoteIndex.for_vault` to share one instance between all tools of a vault.
+    """
+
+    _instances: dict[str, "NoteIndex"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, vault_directory: str) -> None:
+        self.vault_directory = vault_directory
+        self.path = os.path.join(vault_directory, INDEX_DIRECTORY, INDEX_FILENAME)
+        self._lock = threading.RLock()
+        self._ids: dict[str, str] = {}
+        self._aliases: dict[str, str] = {}
+        self._load()
+
+    @classmethod
+    def for_vault(cls, vault_directory: str) -> "NoteIndex":
+        """Return the shared index instance for a vault directory."""
+        key = os.path.realpath(vault_directory)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(vault_directory)
+            return cls._instances[key]
+
+    def _note_exists(self, note_title: str) -> bool:
+        return os.path.exists(os.path.join(self.vault_directory, note_title + ".md"))
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._ids = dict(data.get("ids", {}))
+            self._aliases = dict(data.get("aliases", {}))
+        except (OSError, ValueError):
+            self.rebuild()
+
+    def save(self) -> None:
+        """Write the index to disk atomically."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"ids": self._ids, "aliases": self._aliases}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def rebuild(self) -> None:
+        """Rebuild the index by scanning the frontmatter of every note in the vault."""
+        ids: dict[str, str] = {}
+        aliases: dict[str, str] = {}
+        for root, dirs, files in os.walk(self.vault_directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for filename in files:
+                if not filename.endswith(".md"):
+                    continue
+                file_path = os.path.join(root, filename)
+                try:
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        fields, _ = split_frontmatter(f.read())
+                except (OSError, UnicodeDecodeError):
+                    continue
+                note_id = fields.get("id")
+                if not note_id:
+                    continue
+                title = normalize_title(os.path.relpath(file_path, self.vault_directory).replace(os.sep, "/"))
+                folder = title.rpartition("/")[0]
+                ids[note_id] = title
+                for alias in parse_aliases(fields.get("aliases")):
+                    aliases[f"{folder}/{alias}" if folder and "/" not in alias else alias] = note_id
+        with self._lock:
+            self._ids, self._aliases = ids, aliases
+        self.save()
+
+    def resolve(self, note_title: str) -> str:
+        """
+        Return the current title for a title that may be a former title (alias).
+
+        Titles that exist or are unknown to the index are returned unchanged.
+        """
+        note_title = normalize_title(note_title)
+        if self._note_exists(note_title):
+            return note_title
+        with self._lock:
+            note_id = self._aliases.get(note_title)
+            current = self._ids.get(note_id) if note_id else None
+        if current and self._note_exists(current):
+            return current
+        if note_id:
+            # The index is stale (e.g. the vault was edited in Obsidian); rebuild once.
+            self.rebuild()
+            with self._lock:
+                current = self._ids.get(self._aliases.get(note_title, ""))
+            if current and self._note_exists(current):
+                return current
+        return note_title
+
+    def aliases_of(self, note_title: str) -> list[str]:
+        """Return the former titles that resolve to the given note."""
+        note_title = normalize_title(note_title)
+        with self._lock:
+            ids = {note_id for note_id, title in self._ids.items() if title == note_title}
+            return [alias for alias, note_id in self._aliases.items() if note_id in ids]
+
+    def register(self, note_title: str, note_id: str) -> None:
+        """Register a (new) note id under its current title."""
+        with self._lock:
+            self._ids[note_id] = normalize_title(note_title)
+        self.save()
+
+    def rename(self, note_id: str, old_title: str, new_title: str) -> None:
+        """Point a note id at its new title and keep the old title as an alias."""
+        old_title, new_title = normalize_title(old_title), normalize_title(new_title)
+        with self._lock:
+            self._ids[note_id] = new_title
+            self._aliases[old_title] = note_id
+            self._aliases.pop(new_title, None)
+        self.save()
+
+    def forget(self, note_title: str) -> None:
+        """Drop a deleted note and its aliases from the index."""
+        note_title = normalize_title(note_title)
+        with self._lock:
+            ids = {note_id for note_id, title in self._ids.items() if title == note_title}
+            self._ids = {k: v for k, v in self._ids.items() if k not in ids}
+            self._aliases = {k: v for k, v in self._aliases.items() if v not in ids}
+        self.save()
+
+
+def ensure_note_id(content: str) -> tuple[str, str]:
+    """Return the note's id and its content, adding a new frontmatter id if it has none."""
+    fields, _ = split_frontmatter(content)
+    if fields.get("id"):
+        return fields["id"], content
+    note_id = new_note_id()
+    return note_id, set_frontmatter_fields(content, {"id": note_id})
@@ -0,0 +1,107 @@
+"""
+One-line summaries of notes, for judging relevance beyond the title.
+
+`SummaryStore` keeps a summary per note in `<vault>/.fasterscience/note_summaries.sqlite`,
+keyed by the note's path and fingerprinted by its modification time and size, so only
+notes that changed since the last call are read and summarized again. By default the
+summary is extracted locally from the note: its first line that says more than the title
+(a proposition's caveat or first argument, a concept's definition, a source's title); any
+other summarizer (e.g. a model) can be plugged in and its results are cached the same way.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from typing import Callable, Dict, Sequence
+
+from .note_index import INDEX_DIRECTORY, split_frontmatter
+from .similarity import title_key
+
+SUMMARIES_FILENAME = "note_summaries.sqlite"
+MAX_SUMMARY_CHARS = 120
+# Bumped whenever `extract_summary` changes, so stores of older versions are summarized again
+SUMMARY_VERSION = 2
+
+_WIKILINK = re.compile(r"\[\[([^\]|]+)(?:\|([^\]]+))?\]\]")
+
+
+def extract_summary(note_title: str, content: str) -> str:
+    """
+    The first meaningful line of a note, with links flattened to their text. A line repeating
+    the title (as propositions start with their claim) tells nothing beyond the path and is skipped.
+    """
+    _, body = split_frontmatter(content)
+    title = title_key(note_title)
+    for line in body.splitlines():
+        line = line.strip().lstrip("#=-").strip()
+        if not line:
+            continue
+        line = _WIKILINK.sub(lambda m: m.group(2) or m.group(1).rsplit("/", 1)[-1], line)
+        line = " ".join(line.split())
+        if title_key(line) == title:
+            continue
+        return line if len(line) <= MAX_SUMMARY_CHARS else line[:MAX_SUMMARY_CHARS - 1] + "…"
+    return ""
+
+
+class SummaryStore:
+    """Cached one-line summaries of the notes of a vault. Safe to share between threads."""
+
+    _instances: dict[str, "SummaryStore"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, vault_directory: str, path: str, summarize: Callable[[str, str], str] = extract_summary) -> None:
+        self.vault_directory = vault_directory
+        self.summarize = summarize
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries (note TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, summary TEXT)"
+            )
+            if summarize is extract_summary and self._connection.execute("PRAGMA user_version").fetchone()[0] != SUMMARY_VERSION:
+                self._connection.execute("DELETE FROM summaries")
+                self._connection.execute(f"PRAGMA user_version = {SUMMARY_VERSION}")
+            rows = self._connection.execute("SELECT note, mtime_ns, size, summary FROM summaries").fetchall()
+        self._memory: Dict[str, tuple] = {note: (mtime_ns, size, summary) for note, mtime_ns, size, summary in rows}
+
+    @classmethod
+    def for_vault(cls, vault_directory: str) -> "SummaryStore":
+        """Return the shared store of a vault directory (with the local summarizer)."""
+        path = os.path.join(vault_directory, INDEX_DIRECTORY, SUMMARIES_FILENAME)
+        key = os.path.realpath(path)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(vault_directory, path)
+            return cls._instances[key]
+
+    def get(self, notes: Sequence[str]) -> Dict[str, str]:
+        """Summaries of notes (paths relative to the vault, e.g. 'p/Note.md'), updating stale ones."""
+        summaries: Dict[str, str] = {}
+        updates = []
+        for note in notes:
+            path = os.path.join(self.vault_directory, note)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            cached = self._memory.get(note)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                summaries[note] = cached[2]
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    summary = self.summarize(note.removesuffix(".md"), f.read())
+            except (OSError, UnicodeDecodeError):
+                continue
+            summaries[note] = summary
+            updates.append((note, stat.st_mtime_ns, stat.st_size, summary))
+
+        if updates:
+            with self._lock, self._connection:
+                self._connection.executemany("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)", updates)
+                for note, mtime_ns, size, summary in updates:
+                    self._memory[note] = (mtime_ns, size, summary)
+        return summaries
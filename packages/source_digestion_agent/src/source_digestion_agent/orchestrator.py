@@ -0,0 +1,113 @@
+"""
+Concurrent digestion of several sources into one Obsidian vault.
+
+All runs share one `SourceDigestionAgent`, so the graph, tools and model client are built
+once; each run only loads its own source. All runs share the vault's coordination state,
+which is process-wide: the per-note locks of `vault_io` and the `NoteIndex` of the vault.
+Conflicting writes (e.g. two runs creating the same proposition) are detected by the note
+tools and reported back to the run's agent so it can integrate its content into the
+existing note instead.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Union
+
+from .agent import SourceDigestionAgent
+
+
+def digest_many(
+        vault_directory: str,
+        dois: list[str],
+        concurrency: int = 4,
+        message: str = "Digest this source",
+        max_attempts: int = 2,
+        retry_delay: float = 5.0,
+        **agent_kwargs,
+    ) -> dict[str, Union[str, Exception]]:
+    """
+    Digest several sources concurrently into the same vault.
+
+    Args:
+        vault_directory: Path to the Obsidian vault directory
+        dois: DOIs of the sources to digest (duplicates are digested once)
+        concurrency: Maximum number of agent runs in flight at the same time
+        message: The message every agent run is started with
+        max_attempts: How often a failed run is attempted before giving up
+        retry_delay: Seconds to wait before retrying a failed run (doubles per attempt)
+        **agent_kwargs: Passed on to the shared `SourceDigestionAgent` (e.g. `model`, `stable_ids`)
+
+    Returns:
+        Maps each DOI to the agent's final answer, or to the exception of its last attempt
+    """
+    unique_dois = list(dict.fromkeys(dois))
+    agent = SourceDigestionAgent(vault_directory=vault_directory, **agent_kwargs)
+
+    def digest(doi: str) -> str:
+        thread_id = f"digest-{doi}"
+        for attempt in range(1, max_attempts + 1):
+            try:
+                # Interrupted runs (earlier attempts or processes) resume from their last checkpoint
+                thread = agent.get_thread(thread_id)
+                if thread and thread.next:
+                    return agent.invoke(None, thread_id=thread_id)
+                return agent.invoke(message, thread_id=thread_id, doi=doi)
+            except Exception as e:
+                if attempt == max_attempts:
+                    raise
+                print(f"Digestion of {doi} failed (attempt {attempt}/{max_attempts}): {e}")
+                time.sleep(retry_delay * 2 ** (attempt - 1))
+
+    results: dict[str, Union[str, Exception]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(unique_dois)))) as executor:
+        futures = {executor.submit(digest, doi): doi for doi in unique_dois}
+        for future in as_completed(futures):
+            doi = futures[future]
+            try:
+                results[doi] = future.result()
+                print(f"Digested {doi} ({len(results)}/{len(unique_dois)})")
+            except Exception as e:
+                results[doi] = e
+                print(f"Failed to digest {doi} ({len(results)}/{len(unique_dois)}): {e}")
+
+    return {doi: results[doi] for doi in unique_dois}
+
+
+async def adigest_many(
+        vault_directory: str,
+        dois: list[str],
+        concurrency: int = 16,
+        message: str = "Digest this source",
+        max_attempts: int = 2,
+        retry_delay: float = 5.0,
+        **agent_kwargs,
+    ) -> dict[str, Union[str, Exception]]:
+    """
+    Async version of `digest_many`: all runs share one event loop instead of a thread each,
+    so many more runs (and their model calls) can be in flight at the same time.
+    """
+    unique_dois = list(dict.fromkeys(dois))
+    agent = SourceDigestionAgent(vault_directory=vault_directory, **agent_kwargs)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def digest(doi: str) -> str:
+        thread_id = f"digest-{doi}"
+        async with semaphore:
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    thread = await agent.aget_thread(thread_id)
+                    if thread and thread.next:
+                        return await agent.ainvoke(None, thread_id=thread_id)
+                    return await agent.ainvoke(message, thread_id=thread_id, doi=doi)
+                except Exception as e:
+                    if attempt == max_attempts:
+                        raise
+                    print(f"Digestion of {doi} failed (attempt {attempt}/{max_attempts}): {e}")
+                    await asyncio.sleep(retry_delay * 2 ** (attempt - 1))
+
+    outcomes = await asyncio.gather(*(digest(doi) for doi in unique_dois), return_exceptions=True)
+    for doi, outcome in zip(unique_dois, outcomes):
+        status = "Failed to digest" if isinstance(outcome, Exception) else "Digested"
+        print(f"{status} {doi}")
+    return dict(zip(unique_dois, outcomes))
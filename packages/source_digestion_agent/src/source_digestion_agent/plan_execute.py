@@ -0,0 +1,136 @@
+"""
+Plan-then-execute digestion.
+
+Instead of one model turn per file operation, the model sees the source and the relevant
+existing notes once and returns a `DigestionPlan`: the notes to create, the edits of
+existing notes, and the entries of the source note. A local executor applies the plan in
+one transaction through the regular note tools. The model is only called again if the plan
+conflicts with the vault (e.g. a note already exists or an edit does not match), with the
+errors and the current content of the affected notes.
+"""
+
+from typing import List, Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from pydantic import BaseModel, Field
+
+from .tools.create_notes import NoteDraft, create_notes_outer
+from .tools.delete_note import delete_note_outer
+from .tools.edit_notes import NoteEdit, edit_notes_outer
+from .tools.list_relevant_notes import list_relevant_notes_outer
+from .tools.read_notes import read_notes_outer
+
+# Most existing notes shown to the planner
+MAX_CONTEXT_NOTES = 40
+
+PLAN_REQUEST = (
+    "Digest the source in a single step: instead of calling tools, return a plan with all changes to the vault.\n"
+    "- `new_notes`: every new concept and proposition note, with its complete content.\n"
+    "- `edits`: find/replace edits of the existing notes below. Copy `old` exactly from the note's content.\n"
+    "- `source_notes`: the list that goes under '## Notes' of the source note.\n"
+    "Follow all instructions above. Only create a note if no existing note below has the same meaning.\n\n"
+    "## Existing notes relevant to this source\n"
+)
+
+
+class DigestionPlan(BaseModel):
+    """A Pydantic model for all vault changes of one source."""
+    new_notes: List[NoteDraft] = Field(default_factory=list, description="New concept and proposition notes, each with its complete content.")
+    edits: List[NoteEdit] = Field(default_factory=list, description="Find/replace edits of existing notes, e.g. new arguments on an existing proposition.")
+    source_notes: str = Field(description="Markdown list for the '## Notes' section of the source note, linking every claim to its proposition note.")
+
+
+class ExecutionResult(BaseModel):
+    """A Pydantic model for the outcome of applying a digestion plan."""
+    applied: bool = Field(description="Whether the plan was applied. Failed plans leave the vault unchanged.")
+    messages: List[str] = Field(default_factory=list, description="One result per note operation, in order.")
+
+
+def render_notes(notes: dict) -> str:
+    """Render notes read with `read_notes` as Markdown for the planner."""
+    sections = []
+    for title, note in notes.items():
+        if isinstance(note, str):
+            continue
+        sections.append(f"### {title.removesuffix('.md')}\n``````md\n{note.content}\n``````")
+    return "\n\n".join(sections) or "(none)"
+
+
+def execute_plan(plan: DigestionPlan, vault_directory: str, filename: str, stable_ids: bool = False) -> ExecutionResult:
+    """
+    Apply a plan all-or-nothing: create the new notes, then apply all edits including the
+    source note's entries. If the edits fail, the created notes are deleted again.
+    """
+    tool_kwargs = {"vault_directory": vault_directory, "stable_ids": stable_ids}
+    create_notes = create_notes_outer(**tool_kwargs)
+    edit_notes = edit_notes_outer(**tool_kwargs)
+    delete_note = delete_note_outer(**tool_kwargs)
+
+    created = create_notes(plan.new_notes) if plan.new_notes else []
+    if not all(message.startswith("Successfully") for message in created):
+        return ExecutionResult(applied=False, messages=created)
+
+    source_edit = NoteEdit(note_title=f"s/{filename}", old="## Notes", new=f"## Notes\n{plan.source_notes.strip()}")
+    edited = edit_notes([*plan.edits, source_edit])
+    if not all(message.startswith("Successfully") for message in edited):
+        for draft in plan.new_notes:
+            delete_note(draft.note_title)
+        return ExecutionResult(
+            applied=False,
+            messages=[f"Not created: {draft.note_title} (an edit in this plan failed)" for draft in plan.new_notes] + edited,
+        )
+
+    return ExecutionResult(applied=True, messages=created + edited)
+
+
+def plan_and_execute(
+        llm: BaseChatModel,
+        prompt: Sequence[BaseMessage],
+        vault_directory: str,
+        filename: str,
+        query: str,
+        stable_ids: bool = False,
+        max_repairs: int = 2,
+    ) -> ExecutionResult:
+    """
+    Digest a source with one planning call, plus one call per conflicting plan.
+
+    Args:
+        llm: The model producing the plan
+        prompt: The agent's instructions and source context
+        vault_directory: Path to the Obsidian vault directory
+        filename: The source's filename (its source note is `s/<filename>.md`)
+        query: Description of the notes the planner needs to see, passed to `list_relevant_notes`
+        stable_ids: Give new notes a frontmatter id and resolve former titles
+        max_repairs: How often a conflicting plan is sent back to the model
+
+    Returns:
+        The result of the last plan that was executed
+    """
+    tool_kwargs = {"vault_directory": vault_directory, "stable_ids": stable_ids}
+    read_notes = read_notes_outer(**tool_kwargs)
+    relevant = list_relevant_notes_outer(**tool_kwargs)(query)[:MAX_CONTEXT_NOTES]
+
+    planner = llm.with_structured_output(DigestionPlan)
+    messages = [*prompt, HumanMessage(content=PLAN_REQUEST + render_notes(read_notes(relevant) if relevant else {}))]
+
+    for attempt in range(max_repairs + 1):
+        plan = planner.invoke(messages)
+        result = execute_plan(plan, vault_directory, filename, stable_ids=stable_ids)
+        if result.applied or attempt == max_repairs:
+            return result
+
+        affected = [draft.note_title for draft in plan.new_notes] + [edit.note_title for edit in plan.edits]
+        print(f"Plan for {filename} conflicts with the vault (attempt {attempt + 1}/{max_repairs + 1}), asking for a corrected plan")
+        messages += [
+            AIMessage(content=plan.model_dump_json()),
+            HumanMessage(content=(
+                "The plan could not be applied, so nothing was changed. Errors:\n"
+                + "\n".join(f"- {message}" for message in result.messages)
+                + "\n\nCurrent content of the affected notes:\n"
+                + render_notes(read_notes(affected) if affected else {})
+                + "\n\nReturn the corrected complete plan."
+            )),
+        ]
+    return result
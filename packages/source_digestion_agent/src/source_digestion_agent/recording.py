@@ -0,0 +1,183 @@
+"""
+Recording and replay of agent runs.
+
+A `Recorder` is a callback handler that captures every model call (response, duration) and
+every tool call (arguments, output, duration) of a `SourceDigestionAgent.invoke`. A saved
+`Recording` can be replayed without network access: `ReplayChatModel` serves the recorded
+model responses in order, and `replay_tools` serves the recorded outputs of tools that call
+models themselves (`list_relevant_notes` and its batched variant). All other tools run for real, so replays measure
+the current tools against a fixture vault.
+"""
+
+import functools
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult, LLMResult
+from pydantic import BaseModel, Field, PrivateAttr
+
+# Tools that call models themselves and are therefore replayed from the recording
+REPLAYED_TOOLS = ("list_relevant_notes", "list_relevant_notes_batch")
+
+
+class ReplayExhaustedError(RuntimeError):
+    """The replayed run asked for more model responses than were recorded."""
+
+
+class ModelCall(BaseModel):
+    """A Pydantic model for one recorded model call."""
+    response: str = Field(description="The model's response message, serialized with LangChain's `dumps`.")
+    input_messages: int = Field(description="Number of messages sent to the model.")
+    node: Optional[str] = Field(default=None, description="The graph node that made the call ('agent' for the agent's own turns).")
+    seconds: float = Field(description="Duration of the call.")
+    error: Optional[str] = Field(default=None, description="The error, if the call failed.")
+
+
+class ToolCall(BaseModel):
+    """A Pydantic model for one recorded tool call."""
+    name: str = Field(description="The tool's name.")
+    args: Dict[str, Any] = Field(default_factory=dict, description="The arguments the tool was called with.")
+    output: str = Field(default="", description="The tool's output as sent to the model.")
+    seconds: float = Field(description="Duration of the call.")
+    error: Optional[str] = Field(default=None, description="The error, if the call failed.")
+
+
+class Recording(BaseModel):
+    """A Pydantic model for a recorded agent run."""
+    filename: str = Field(description="Filename of the digested source.")
+    message: Optional[str] = Field(default=None, description="The message the run was started with.")
+    model_calls: List[ModelCall] = Field(default_factory=list, description="Model calls in the order they finished.")
+    tool_calls: List[ToolCall] = Field(default_factory=list, description="Tool calls in the order they finished.")
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.model_dump_json(indent=1))
+
+    @classmethod
+    def load(cls, path: str) -> "Recording":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.model_validate_json(f.read())
+
+    def responses(self) -> List[AIMessage]:
+        """Return the agent's recorded model responses of successful calls, in order."""
+        return [
+            loads(call.response, allowed_objects=[AIMessage])
+            for call in self.model_calls
+            if call.error is None and call.node in (None, "agent")
+        ]
+
+
+class Recorder(BaseCallbackHandler):
+    """Callback handler recording all model and tool calls of a run. Safe for parallel tool calls."""
+
+    def __init__(self, filename: str, message: Optional[str] = None) -> None:
+        self.recording = Recording(filename=filename, message=message)
+        self._lock = threading.Lock()
+        self._started: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(
+            self,
+            serialized: Dict[str, Any],
+            messages: List[List[BaseMessage]],
+            *,
+            run_id: UUID,
+            metadata: Optional[Dict[str, Any]] = None,
+            **kwargs: Any,
+        ) -> None:
+        with self._lock:
+            self._started[run_id] = (time.perf_counter(), sum(len(batch) for batch in messages), (metadata or {}).get("langgraph_node"))
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            started, input_messages, node = self._started.pop(run_id, (time.perf_counter(), 0, None))
+            message = response.generations[0][0].message
+            self.recording.model_calls.append(ModelCall(
+                response=dumps(message),
+                input_messages=input_messages,
+                node=node,
+                seconds=time.perf_counter() - started,
+            ))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            started, input_messages, node = self._started.pop(run_id, (time.perf_counter(), 0, None))
+            self.recording.model_calls.append(ModelCall(
+                response="", input_messages=input_messages, node=node, seconds=time.perf_counter() - started, error=str(error),
+            ))
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, inputs: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        with self._lock:
+            self._started[run_id] = (time.perf_counter(), serialized.get("name", ""), inputs or {})
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            started, name, args = self._started.pop(run_id, (time.perf_counter(), "", {}))
+            content = output.content if isinstance(output, ToolMessage) else output
+            self.recording.tool_calls.append(ToolCall(
+                name=name,
+                args=args,
+                output=content if isinstance(content, str) else json.dumps(content, default=str),
+                seconds=time.perf_counter() - started,
+            ))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            started, name, args = self._started.pop(run_id, (time.perf_counter(), "", {}))
+            self.recording.tool_calls.append(ToolCall(
+                name=name, args=args, seconds=time.perf_counter() - started, error=str(error),
+            ))
+
+
+class ReplayChatModel(BaseChatModel):
+    """A chat model answering with recorded responses, in order. Tool binding is a no-op."""
+    responses: List[AIMessage]
+    _position: int = PrivateAttr(default=0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "ReplayChatModel":
+        return self
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        with self._lock:
+            if self._position >= len(self.responses):
+                raise ReplayExhaustedError(f"All {len(self.responses)} recorded responses were used; the run diverged from the recording.")
+            message = self.responses[self._position]
+            self._position += 1
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def replay_tools(recording: Recording, names: Sequence[str] = REPLAYED_TOOLS) -> Dict[str, Callable[[Callable], Callable]]:
+    """
+    Create `tool_wrappers` for `SourceDigestionAgent` that answer the given tools from the
+    recording: by exact arguments where possible, otherwise in recorded order.
+    """
+    def wrapper_for(name: str) -> Callable[[Callable], Callable]:
+        calls = [call for call in recording.tool_calls if call.name == name and call.error is None]
+        lock = threading.Lock()
+
+        def wrap(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def replayed(*args, **kwargs):
+                with lock:
+                    if not calls:
+                        raise ReplayExhaustedError(f"No recorded calls of {name} left; the run diverged from the recording.")
+                    match = next((call for call in calls if call.args == kwargs), calls[0])
+                    calls.remove(match)
+                return match.output
+
+            return replayed
+
+        return wrap
+
+    return {name: wrapper_for(name) for name in names}
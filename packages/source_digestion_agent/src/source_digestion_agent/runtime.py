@@ -0,0 +1,37 @@
+"""
+Process-wide setup that used to happen at import time.
+
+Loading `.env` and MLflow autologging are done on first use instead, so importing the
+package has no side effects. Tracing is opt-in: pass `tracing=True` to the agent or set
+the `FASTERSCIENCE_TRACING` environment variable to `1`.
+"""
+
+import functools
+import os
+from typing import Optional
+
+TRACING_ENV_VAR = "FASTERSCIENCE_TRACING"
+
+
+@functools.cache
+def load_environment() -> None:
+    """Load environment variables (e.g. `OPENAI_API_KEY`) from a `.env` file, once."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+def tracing_requested(tracing: Optional[bool] = None) -> bool:
+    """Resolve an explicit tracing flag, falling back to the environment variable."""
+    if tracing is not None:
+        return tracing
+    return os.getenv(TRACING_ENV_VAR, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+@functools.cache
+def enable_tracing() -> None:
+    """Turn on MLflow autologging of OpenAI and LangChain calls, once per process."""
+    import mlflow
+
+    mlflow.openai.autolog()
+    mlflow.langchain.autolog()
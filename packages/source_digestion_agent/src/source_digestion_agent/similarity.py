@@ -0,0 +1,203 @@
+"""
+Local similarity of note titles, for catching near-duplicate notes without a model call.
+
+Titles are compared by the cosine similarity of their character trigrams, after stripping
+the folder, a proposition's confidence suffix (e.g. " (70%)") and case, and after mapping
+verbs of direction to one word each, so "Sleep improves memory (70%)" and "sleep increases
+memory (65%)" come out the same. Some titles state different claims however close their
+characters are, and never count as similar (`comparable`): titles of opposite polarity
+("increases" vs "decreases", or one of them negated), so a counter-proposition is not a
+duplicate, and titles that each have a word the other lacks ("Sleep impairs memory" vs
+"Stress impairs memory"), while a qualifier on one side only ("... is very bad") is still
+a duplicate.
+
+`TitleIndex` keeps an inverted index of the titles of a vault folder and follows the
+folder's changes (created, renamed and deleted notes) by its modification time, so a
+lookup takes about a millisecond (a few in a folder of 100k notes).
+"""
+
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+NGRAM = 3
+DUPLICATE_THRESHOLD = 0.7
+# Candidates scored exactly per lookup, from the best partial scores of the inverted index
+MAX_CANDIDATES = 50
+COMMON_POSTINGS = 100
+# Folder modification times are only trusted once they are this old, since they have a coarse resolution
+RACY_SECONDS = 2.0
+
+_CONFIDENCE = re.compile(r"\s*\(\d+(?:\.\d+)?%\)\s*$")
+_NON_WORD = re.compile(r"[^\w]+")
+_CONTRACTED_NOT = re.compile(r"n['’]t\b")
+
+_INCREASING = ("increase", "raise", "boost", "improve", "enhance", "promote", "elevate", "strengthen", "amplify", "accelerate", "facilitate")
+_DECREASING = ("decrease", "reduce", "lower", "impair", "worsen", "inhibit", "suppress", "diminish", "weaken", "hinder", "prevent", "harm", "attenuate")
+_NEGATIONS = frozenset({"not", "no", "never", "without", "cannot", "nor", "neither"})
+_STOPWORDS = frozenset({"the", "and", "for", "with", "are", "was", "its", "their", "that", "this", "than", "from", "into", "has", "have"})
+
+
+def _verb_forms(verb: str) -> set:
+    if verb.endswith("e"):
+        return {f"{verb}s", f"{verb}d", f"{verb[:-1]}ing"}
+    if verb.endswith("y"):
+        return {f"{verb[:-1]}ies", f"{verb[:-1]}ied", f"{verb}ing"}
+    return {f"{verb}s", f"{verb}ed", f"{verb}ing"}
+
+
+# Verbs of direction and the word they are compared as ("lower" and "harm" only when inflected: bare, they are an adjective and a noun)
+_DIRECTIONS = {
+    **{form: "increases" for verb in _INCREASING for form in _verb_forms(verb) | {verb}},
+    **{form: "decreases" for verb in _DECREASING for form in _verb_forms(verb) | ({verb} - {"lower", "harm"})},
+}
+
+
+class SimilarNote(BaseModel):
+    """A Pydantic model for an existing note similar to a new one."""
+    note_title: str = Field(description="Title of the existing note (including its folder).")
+    similarity: float = Field(description="Cosine similarity of the titles' trigram counts, from 0 to 1.")
+
+
+def strip_confidence(title: str) -> str:
+    """The title without its confidence suffix, e.g. 'p/X increases Y (70%)' -> 'p/X increases Y'."""
+    return _CONFIDENCE.sub("", title.removesuffix(".md"))
+
+
+def title_key(title: str) -> str:
+    """
+    The part of a title that is compared: without folder, confidence, case and punctuation,
+    with verbs of direction as 'increases' or 'decreases' and contracted negations spelled out.
+    """
+    name = _CONTRACTED_NOT.sub(" not", strip_confidence(title).rsplit("/", 1)[-1].lower())
+    return " ".join(_DIRECTIONS.get(word, word) for word in _NON_WORD.sub(" ", name).split())
+
+
+def polarity(key: str) -> Tuple[FrozenSet[str], bool]:
+    """The directions a title key states ('increases', 'decreases') and whether it is negated (an odd number of negations)."""
+    words = key.split()
+    return frozenset(word for word in words if word in ("increases", "decreases")), sum(word in _NEGATIONS for word in words) % 2 == 1
+
+
+def _stem(word: str) -> str:
+    for suffix, replacement in (("ies", "y"), ("es", ""), ("s", ""), ("ing", ""), ("ed", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[: -len(suffix)] + replacement
+    return word
+
+
+def content_words(key: str) -> FrozenSet[str]:
+    """The stemmed words of a title key that carry meaning (no short words, stopwords or negations)."""
+    return frozenset(_stem(word) for word in key.split() if len(word) > 2 and word not in _STOPWORDS and word not in _NEGATIONS)
+
+
+def comparable(key: str, other: str) -> bool:
+    """Whether two title keys can state the same claim: the same polarity, and no word of one replaced by another in the other."""
+    if polarity(key) != polarity(other):
+        return False
+    words, other_words = content_words(key), content_words(other)
+    return not (words - other_words and other_words - words)
+
+
+def ngrams(text: str, n: int = NGRAM) -> Counter:
+    """Character n-grams of a title key, with its word boundaries marked."""
+    padded = f" {text} "
+    return Counter(padded[i : i + n] for i in range(len(padded) - n + 1))
+
+
+def _norm(grams: Counter) -> float:
+    return math.sqrt(sum(count * count for count in grams.values())) or 1.0
+
+
+class TitleIndex:
+    """An inverted trigram index of the note titles in one folder of a vault. Safe to share between threads."""
+
+    _instances: dict[str, "TitleIndex"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, vault_directory: str, folder: str) -> None:
+        self.vault_directory = vault_directory
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._mtime_ns: Optional[int] = None
+        self._grams: Dict[str, Counter] = {}
+        self._norms: Dict[str, float] = {}
+        self._keys: Dict[str, str] = {}
+        self._postings: Dict[str, set] = defaultdict(set)
+
+    @classmethod
+    def for_folder(cls, vault_directory: str, folder: str) -> "TitleIndex":
+        """Return the shared index of a vault folder (e.g. 'p')."""
+        key = os.path.realpath(os.path.join(vault_directory, folder))
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(vault_directory, folder)
+            return cls._instances[key]
+
+    def _refresh(self) -> None:
+        # Creating, renaming or deleting a note changes its folder's modification time
+        directory = os.path.join(self.vault_directory, self.folder)
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if mtime_ns == self._mtime_ns and (mtime_ns is None or time.time_ns() - mtime_ns > RACY_SECONDS * 1e9):
+            return
+        names = {f[:-3] for f in os.listdir(directory) if f.endswith(".md")} if mtime_ns is not None else set()
+        titles = {f"{self.folder}/{name}" for name in names}
+        for title in self._grams.keys() - titles:
+            for gram in self._grams.pop(title):
+                self._postings[gram].discard(title)
+            del self._norms[title]
+            del self._keys[title]
+        for title in titles - self._grams.keys():
+            key = title_key(title)
+            grams = ngrams(key)
+            self._grams[title] = grams
+            self._norms[title] = _norm(grams)
+            self._keys[title] = key
+            for gram in grams:
+                self._postings[gram].add(title)
+        self._mtime_ns = mtime_ns
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._grams)
+
+    def similar(self, text: str, threshold: float = DUPLICATE_THRESHOLD, limit: int = 5, exclude: Optional[str] = None) -> List[SimilarNote]:
+        """
+        Notes of the folder whose titles are at least `threshold` similar to `text` (a title or a
+        claim) and `comparable` to it, best first.
+        """
+        with self._lock:
+            self._refresh()
+            key = title_key(text)
+            query = ngrams(key)
+            query_norm = _norm(query)
+            # Partial dot products from the postings, then exact cosines for the best candidates
+            # Trigrams shared by a large share of the titles (e.g. " in") are skipped here: near-duplicates also share rare ones
+            common = max(COMMON_POSTINGS, len(self._grams) // 20)
+            partial: Dict[str, float] = defaultdict(float)
+            for gram, count in query.items():
+                postings = self._postings.get(gram, ())
+                if len(postings) <= common:
+                    for title in postings:
+                        partial[title] += count
+            candidates = sorted(partial, key=partial.__getitem__, reverse=True)[:MAX_CANDIDATES]
+            scored: List[Tuple[float, str]] = []
+            for title in candidates:
+                if title == exclude or not comparable(key, self._keys[title]):
+                    continue
+                grams = self._grams[title]
+                score = sum(count * grams[gram] for gram, count in query.items()) / (query_norm * self._norms[title])
+                if score >= threshold:
+                    scored.append((score, title))
+        scored.sort(reverse=True)
+        return [SimilarNote(note_title=title, similarity=round(score, 3)) for score, title in scored[:limit]]
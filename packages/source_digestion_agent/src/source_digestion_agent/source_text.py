@@ -0,0 +1,136 @@
+"""
+Sectioning of extracted source text for on-demand reading.
+
+Sources are stored as PyMuPDF4LLM Markdown in `<vault>/sources/<filename>.txt`, with
+`--- end of page=N ---` separators after every page. A `SourceDocument` splits that text
+into sections (from Markdown headings, falling back to fixed-size parts) and pages, so an
+agent can read the source piece by piece instead of carrying all of it in its context.
+"""
+
+import bisect
+import os
+import re
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+# Longest section handed out in one piece; longer sections are split into parts
+MAX_SECTION_CHARS = 12_000
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+_PAGE_SEPARATOR_PATTERN = re.compile(r"^--- end of page=(\d+) ---$", re.MULTILINE)
+
+
+class SourceSection(BaseModel):
+    """A Pydantic model for one entry of a source's table of contents."""
+    index: int = Field(description="Position of the section in the table of contents, starting at 1.")
+    title: str = Field(description="The section heading.")
+    level: int = Field(description="Heading level (1 for '#').")
+    start: int = Field(description="Offset of the section's first character in the source text.")
+    end: int = Field(description="Offset just past the section's last character.")
+    start_page: Optional[int] = Field(default=None, description="First page of the section (1-based), if known.")
+    end_page: Optional[int] = Field(default=None, description="Last page of the section (1-based), if known.")
+
+
+def source_text_path(vault_directory: str, filename: str) -> str:
+    """Return the path of a source's extracted text inside the vault."""
+    return os.path.join(vault_directory, "sources", f"{filename}.txt")
+
+
+class SourceDocument:
+    """A source's extracted text, split into sections and pages."""
+
+    def __init__(self, text: str, max_section_chars: int = MAX_SECTION_CHARS) -> None:
+        self.text = text
+        self.max_section_chars = max_section_chars
+        # Offsets just past each page's separator line; the last page ends at the end of the text
+        self._page_ends = [m.end() for m in _PAGE_SEPARATOR_PATTERN.finditer(text)]
+        self.sections = self._split_sections()
+
+    @classmethod
+    def from_vault(cls, vault_directory: str, filename: str) -> "SourceDocument":
+        """Load a source's extracted text from the vault."""
+        with open(source_text_path(vault_directory, filename), "r", encoding="utf-8") as f:
+            return cls(f.read())
+
+    @property
+    def page_count(self) -> Optional[int]:
+        """Number of pages, or None if the text has no page separators."""
+        if not self._page_ends:
+            return None
+        trailing = self.text[self._page_ends[-1]:].strip()
+        return len(self._page_ends) + (1 if trailing else 0)
+
+    def page_at(self, offset: int) -> Optional[int]:
+        """Return the (1-based) page containing a text offset, if pages are known."""
+        if not self._page_ends:
+            return None
+        return min(bisect.bisect_right(self._page_ends, offset) + 1, self.page_count)
+
+    def _split_sections(self) -> List[SourceSection]:
+        headings = [(m.start(), len(m.group(1)), m.group(2).strip()) for m in _HEADING_PATTERN.finditer(self.text)]
+        if not headings or headings[0][0] > 0:
+            headings.insert(0, (0, 1, "Front matter" if headings else "Full text"))
+
+        spans = []
+        for i, (start, level, title) in enumerate(headings):
+            end = headings[i + 1][0] if i + 1 < len(headings) else len(self.text)
+            if not self.text[start:end].strip():
+                continue
+            spans.extend(self._split_long(start, end, level, title))
+
+        return [
+            SourceSection(
+                index=index,
+                title=title,
+                level=level,
+                start=start,
+                end=end,
+                start_page=self.page_at(start),
+                end_page=self.page_at(start + max(0, len(self.text[start:end].rstrip()) - 1)),
+            )
+            for index, (start, end, level, title) in enumerate(spans, start=1)
+        ]
+
+    def _split_long(self, start: int, end: int, level: int, title: str) -> list[tuple[int, int, int, str]]:
+        """Split a span into parts of at most `max_section_chars`, preferring paragraph breaks."""
+        if end - start <= self.max_section_chars:
+            return [(start, end, level, title)]
+        cuts = [start]
+        while end - cuts[-1] > self.max_section_chars:
+            limit = cuts[-1] + self.max_section_chars
+            cut = self.text.rfind("\n\n", cuts[-1] + self.max_section_chars // 2, limit)
+            cuts.append(cut + 2 if cut != -1 else limit)
+        cuts.append(end)
+        parts = len(cuts) - 1
+        return [(cuts[i], cuts[i + 1], level, f"{title} (part {i + 1}/{parts})") for i in range(parts)]
+
+    def table_of_contents(self) -> str:
+        """Render the sections as a compact Markdown table of contents."""
+        lines = []
+        for section in self.sections:
+            pages = ""
+            if section.start_page is not None:
+                pages = f"p. {section.start_page}" if section.start_page == section.end_page else f"pp. {section.start_page}-{section.end_page}"
+                pages += ", "
+            indent = "  " * (section.level - 1)
+            lines.append(f"{indent}- [{section.index}] {section.title} ({pages}{section.end - section.start:,} chars)")
+        return "\n".join(lines)
+
+    def section(self, index: int) -> str:
+        """Return the text of a section by its table-of-contents index."""
+        if not 1 <= index <= len(self.sections):
+            raise IndexError(f"Section {index} does not exist. Valid sections: 1-{len(self.sections)}.")
+        section = self.sections[index - 1]
+        return self.text[section.start:section.end]
+
+    def pages(self, start_page: int, end_page: Optional[int] = None) -> str:
+        """Return the text of an inclusive (1-based) page range."""
+        page_count = self.page_count
+        if page_count is None:
+            raise ValueError("This source has no page information. Read it by section instead.")
+        end_page = start_page if end_page is None else end_page
+        if not 1 <= start_page <= end_page <= page_count:
+            raise IndexError(f"Invalid page range {start_page}-{end_page}. Valid pages: 1-{page_count}.")
+        bounds = [0, *self._page_ends, len(self.text)]
+        return self.text[bounds[start_page - 1]:bounds[end_page]]
@@ -0,0 +1,204 @@
+"""
+Telemetry of agent runs: tokens, latency and cost per model call and tool call.
+
+`Telemetry` is a callback handler that turns every finished model and tool call into a
+`TelemetryEvent`, passes it to its exporters (any callable, e.g. a `JsonlExporter`) and sums
+the events of a run into a `RunSummary`. It needs no tracking server. Costs are estimated
+from `MODEL_PRICES`; calls of unknown models have no cost estimate.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel, Field
+
+# USD per million tokens: (input, cached input, output)
+MODEL_PRICES: Dict[str, tuple[float, float, float]] = {
+    "gpt-5": (1.25, 0.125, 10.00),
+    "gpt-5-mini": (0.25, 0.025, 2.00),
+    "gpt-5-nano": (0.05, 0.005, 0.40),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+
+def estimate_cost(model: Optional[str], input_tokens: int, cached_input_tokens: int, output_tokens: int) -> Optional[float]:
+    """Estimate the cost of a model call in USD, or None for models without known prices."""
+    model = model or ""
+    # Dated snapshots (e.g. gpt-5-mini-2025-08-07) are priced like their model
+    prices = MODEL_PRICES.get(model) or next((p for name, p in MODEL_PRICES.items() if model.startswith(name + "-20")), None)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    uncached = input_tokens - cached_input_tokens
+    return (uncached * input_price + cached_input_tokens * cached_price + output_tokens * output_price) / 1_000_000
+
+
+class TelemetryEvent(BaseModel):
+    """A Pydantic model for one finished model call or tool call."""
+    kind: str = Field(description="'model' or 'tool'.")
+    name: str = Field(description="The model's or the tool's name.")
+    thread_id: Optional[str] = Field(default=None, description="The thread the call belongs to.")
+    node: Optional[str] = Field(default=None, description="The graph node that made the call ('agent' or 'tools').")
+    started_at: datetime = Field(description="Start time of the call.")
+    seconds: float = Field(description="Duration of the call.")
+    input_tokens: int = Field(default=0, description="Input tokens of a model call.")
+    cached_input_tokens: int = Field(default=0, description="Input tokens served from the prompt cache.")
+    output_tokens: int = Field(default=0, description="Output tokens of a model call.")
+    cost_usd: Optional[float] = Field(default=None, description="Estimated cost of a model call.")
+    error: Optional[str] = Field(default=None, description="The error, if the call failed.")
+
+
+class RunSummary(BaseModel):
+    """A Pydantic model summing up the telemetry of one run."""
+    thread_id: Optional[str] = Field(default=None, description="The thread of the run.")
+    wall_seconds: float = Field(default=0.0, description="Duration of the run.")
+    model_calls: int = Field(default=0, description="Model calls, including those made inside tools.")
+    tool_calls: int = Field(default=0, description="Tool calls.")
+    errors: int = Field(default=0, description="Failed model and tool calls.")
+    model_seconds: float = Field(default=0.0, description="Summed duration of the model calls.")
+    tool_seconds: float = Field(default=0.0, description="Summed duration of the tool calls (parallel calls overlap).")
+    input_tokens: int = Field(default=0, description="Input tokens of all model calls.")
+    cached_input_tokens: int = Field(default=0, description="Input tokens served from the prompt cache.")
+    output_tokens: int = Field(default=0, description="Output tokens of all model calls.")
+    cost_usd: Optional[float] = Field(default=None, description="Estimated cost, if all models have known prices.")
+    tool_seconds_by_name: Dict[str, float] = Field(default_factory=dict, description="Summed duration per tool.")
+    slowest: List[TelemetryEvent] = Field(default_factory=list, description="The slowest calls of the run.")
+
+    def __str__(self) -> str:
+        cost = f"${self.cost_usd:.4f}" if self.cost_usd is not None else "unknown"
+        tools = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in sorted(self.tool_seconds_by_name.items(), key=lambda item: -item[1]))
+        return (
+            f"Run {self.thread_id}: {self.wall_seconds:.1f}s, {self.model_calls} model calls ({self.model_seconds:.1f}s), "
+            f"{self.tool_calls} tool calls ({self.tool_seconds:.1f}s), {self.errors} errors\n"
+            f"  tokens: {self.input_tokens:,} input ({self.cached_input_tokens:,} cached), {self.output_tokens:,} output; cost: {cost}\n"
+            f"  tools: {tools or 'none'}"
+        )
+
+
+class JsonlExporter:
+    """Appends telemetry events to a JSONL file, one event per line."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event: TelemetryEvent) -> None:
+        line = event.model_dump_json()
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class Telemetry(BaseCallbackHandler):
+    """Callback handler collecting telemetry events of a run. Safe for parallel tool calls."""
+
+    def __init__(
+            self,
+            thread_id: Optional[str] = None,
+            exporters: Sequence[Callable[[TelemetryEvent], None]] = (),
+            slowest: int = 5,
+        ) -> None:
+        self.thread_id = thread_id
+        self.exporters = list(exporters)
+        self.events: List[TelemetryEvent] = []
+        self._slowest = slowest
+        self._lock = threading.Lock()
+        self._started: Dict[UUID, tuple] = {}
+        self._created = time.perf_counter()
+
+    def _start(self, run_id: UUID, kind: str, name: str, metadata: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._started[run_id] = (kind, name, (metadata or {}).get("langgraph_node"), datetime.now(timezone.utc), time.perf_counter())
+
+    def _finish(self, run_id: UUID, **fields: Any) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        kind, name, node, started_at, start = started
+        event = TelemetryEvent(
+            kind=kind, name=name, thread_id=self.thread_id, node=node,
+            started_at=started_at, seconds=time.perf_counter() - start, **fields,
+        )
+        with self._lock:
+            self.events.append(event)
+        for exporter in self.exporters:
+            try:
+                exporter(event)
+            except Exception as e:
+                print(f"Telemetry exporter failed: {e}")
+
+    def on_chat_model_start(
+            self,
+            serialized: Dict[str, Any],
+            messages: List[List[BaseMessage]],
+            *,
+            run_id: UUID,
+            metadata: Optional[Dict[str, Any]] = None,
+            invocation_params: Optional[Dict[str, Any]] = None,
+            **kwargs: Any,
+        ) -> None:
+        params = invocation_params or {}
+        name = params.get("model") or params.get("model_name") or (serialized or {}).get("name", "unknown")
+        self._start(run_id, "model", name, metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        message = getattr(response.generations[0][0], "message", None) if response.generations and response.generations[0] else None
+        usage = getattr(message, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", 0)
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        output_tokens = usage.get("output_tokens", 0)
+        with self._lock:
+            name = self._started.get(run_id, (None, None))[1]
+        self._finish(
+            run_id,
+            input_tokens=input_tokens,
+            cached_input_tokens=cached,
+            output_tokens=output_tokens,
+            cost_usd=estimate_cost(name, input_tokens, cached, output_tokens),
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error=f"{type(error).__name__}: {error}")
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self._start(run_id, "tool", (serialized or {}).get("name", "unknown"), metadata)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error=f"{type(error).__name__}: {error}")
+
+    def summary(self) -> RunSummary:
+        """Sum up the events collected so far."""
+        with self._lock:
+            events = list(self.events)
+        models = [e for e in events if e.kind == "model"]
+        tools = [e for e in events if e.kind == "tool"]
+        tool_seconds: Dict[str, float] = {}
+        for event in tools:
+            tool_seconds[event.name] = tool_seconds.get(event.name, 0.0) + event.seconds
+        costs = [e.cost_usd for e in models]
+        return RunSummary(
+            thread_id=self.thread_id,
+            wall_seconds=time.perf_counter() - self._created,
+            model_calls=len(models),
+            tool_calls=len(tools),
+            errors=sum(1 for e in events if e.error),
+            model_seconds=sum(e.seconds for e in models),
+            tool_seconds=sum(e.seconds for e in tools),
+            input_tokens=sum(e.input_tokens for e in models),
+            cached_input_tokens=sum(e.cached_input_tokens for e in models),
+            output_tokens=sum(e.output_tokens for e in models),
+            cost_usd=sum(costs) if costs and all(c is not None for c in costs) else (0.0 if not costs else None),
+            tool_seconds_by_name=tool_seconds,
+            slowest=sorted(events, key=lambda e: -e.seconds)[:self._slowest],
+        )
@@ -1,17 +1,69 @@
 """
-Auto-import all `*_outer` callables from Python modules in this package and subpackages.
+Registry of the agent's tools: maps every `*_outer` factory to the module defining it.
+
+Tool modules are only imported when their factory is first accessed, so importing the
+package stays cheap. Register new tools here.
+
+Every tool also has an async version (`coroutine_of`). Factories that support native async
+(e.g. `list_relevant_notes_outer`, which fans out its model calls with `ainvoke`) attach a
+coroutine function sharing the tool's state as its `coroutine` attribute (or return it when
+called with `asynchronous=True`); the blocking file tools run in a worker thread of the
+event loop's executor.
 """
 
+import asyncio
+import functools
+import inspect
 from importlib import import_module
-from pkgutil import walk_packages
-
-__all__: list[str] = []
-
-for mod in walk_packages(__path__, prefix=__name__ + "."):
-    if mod.ispkg:
-        continue
-    module = import_module(mod.name)
-    for name, obj in vars(module).items():
-        if name.endswith("_outer") and callable(obj):
-            globals()[name] = obj
-            __all__.append(name)
\ No newline at end of file
+from typing import Awaitable, Callable
+
+_TOOL_MODULES = {
+    "change_note_title_outer": "change_note_title",
+    "create_note_outer": "create_note",
+    "create_notes_outer": "create_notes",
+    "delete_note_outer": "delete_note",
+    "edit_note_outer": "edit_note",
+    "edit_notes_outer": "edit_notes",
+    "list_relevant_notes_outer": "list_relevant_notes",
+    "list_relevant_notes_batch_outer": "list_relevant_notes_batch",
+    "read_note_outer": "note_reader",
+    "read_notes_outer": "read_notes",
+    "read_source_outer": "read_source",
+}
+
+__all__: list[str] = list(_TOOL_MODULES)
+
+
+def to_async(func: Callable) -> Callable[..., Awaitable]:
+    """Async version of a blocking tool function, run in a worker thread with the caller's context."""
+    @functools.wraps(func)
+    async def wrapped(*args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    wrapped.__signature__ = inspect.signature(func)
+    return wrapped
+
+
+def coroutine_of(func: Callable) -> Callable[..., Awaitable]:
+    """The async version of a tool function built by a factory, without building the tool again."""
+    # functools.wraps copies the attribute, but a wrapper's async version must run the wrapper
+    coroutine = None if hasattr(func, "__wrapped__") else getattr(func, "coroutine", None)
+    return coroutine or to_async(func)
+
+
+def async_tool(name: str, **kwargs) -> Callable[..., Awaitable]:
+    """Build the async version of the tool of the factory `name` (e.g. "read_note_outer")."""
+    factory = globals().get(name) or __getattr__(name)
+    return coroutine_of(factory(**kwargs))
+
+
+def __getattr__(name: str):
+    if name not in _TOOL_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    factory = getattr(import_module(f"{__name__}.{_TOOL_MODULES[name]}"), name)
+    globals()[name] = factory
+    return factory
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -2,10 +2,14 @@
 Note title changing tool for Obsidian vault integration.
 """
 
+import json
 import os
 import re
 from pydantic import Field
 
+from ..note_index import NoteIndex, ensure_note_id, normalize_title, parse_aliases, set_frontmatter_fields, split_frontmatter
+from ..vault_io import atomic_write, exclusive_create, note_lock, record_io
+
 
 def change_note_title_outer(*args, **kwargs):
     """
@@ -13,11 +17,13 @@ def change_note_title_outer(*args, **kwargs):
     
     Args:
         vault_directory (str): Path to the Obsidian vault directory
+        stable_ids (bool): Keep the old title as an alias instead of rewriting links in the vault
         
     Returns:
         callable: A function that can rename notes in the vault
     """
     VAULT_DIRECTORY = kwargs["vault_directory"]
+    STABLE_IDS = kwargs.get("stable_ids", False)
     
     def change_note_title(
             note_title: str = Field(description="The title of the note to change."),
@@ -26,6 +32,9 @@ def change_note_title_outer(*args, **kwargs):
         """
         Changes the title of a note and updates all wikilinks in other notes.
         """
+        if STABLE_IDS:
+            note_title = NoteIndex.for_vault(VAULT_DIRECTORY).resolve(note_title)
+        note_title, new_title = normalize_title(note_title), normalize_title(new_title)
         old_file_path = os.path.join(VAULT_DIRECTORY, note_title + ".md")
         new_file_path = os.path.join(VAULT_DIRECTORY, new_title + ".md")
         
@@ -35,12 +44,19 @@ def change_note_title_outer(*args, **kwargs):
         if os.path.exists(new_file_path):
             return f"Note {new_title} already exists."
 
+        if STABLE_IDS:
+            return _rename_with_alias(VAULT_DIRECTORY, note_title, new_title)
+
         try:
             # Update wikilinks in all other notes first
             updated_files = _update_wikilinks_in_vault(VAULT_DIRECTORY, note_title, new_title)
             
-            # Rename the actual file
-            os.rename(old_file_path, new_file_path)
+            # Rename the actual file, unless another call renamed or created one of them meanwhile
+            with note_lock(old_file_path, new_file_path):
+                if os.path.exists(new_file_path):
+                    return f"Note {new_title} already exists."
+                os.rename(old_file_path, new_file_path)
+                record_io(writes=1)
             
             if updated_files:
                 return f"Successfully renamed {note_title} to {new_title}. Updated links in {len(updated_files)} files: {', '.join(updated_files)}"
@@ -53,6 +69,49 @@ def change_note_title_outer(*args, **kwargs):
     return change_note_title
 
 
+def _rename_with_alias(vault_directory: str, note_title: str, new_title: str) -> str:
+    """
+    Renames a note and records its old title as an alias, leaving all other notes untouched.
+    """
+    old_file_path = os.path.join(vault_directory, note_title + ".md")
+    new_file_path = os.path.join(vault_directory, new_title + ".md")
+    try:
+        with note_lock(old_file_path, new_file_path):
+            return _rename_locked(vault_directory, note_title, new_title)
+    except FileNotFoundError:
+        return f"Note {note_title} not found."
+    except FileExistsError:
+        return f"Note {new_title} already exists."
+    except Exception as e:
+        return f"Error renaming note {note_title}: {str(e)}"
+
+
+def _rename_locked(vault_directory: str, note_title: str, new_title: str) -> str:
+    """Performs an alias-keeping rename while the locks of both note paths are held."""
+    old_file_path = os.path.join(vault_directory, note_title + ".md")
+    new_file_path = os.path.join(vault_directory, new_title + ".md")
+    with open(old_file_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    record_io(reads=1)
+
+    note_id, content = ensure_note_id(content)
+    fields, _ = split_frontmatter(content)
+    old_folder, _, old_name = note_title.rpartition("/")
+    alias = old_name if old_folder == new_title.rpartition("/")[0] else note_title
+    aliases = [a for a in parse_aliases(fields.get("aliases")) if a != new_title.rpartition("/")[2]]
+    if alias not in aliases:
+        aliases.append(alias)
+    content = set_frontmatter_fields(content, {"aliases": json.dumps(aliases, ensure_ascii=False)})
+
+    os.makedirs(os.path.dirname(new_file_path), exist_ok=True)
+    exclusive_create(new_file_path, content)
+    os.remove(old_file_path)
+    record_io(writes=1)
+    NoteIndex.for_vault(vault_directory).rename(note_id, note_title, new_title)
+
+    return f"Successfully renamed {note_title} to {new_title}. Links to {note_title} resolve through its alias."
+
+
 def _update_wikilinks_in_vault(vault_directory: str, old_title: str, new_title: str) -> list[str]:
     """
     Updates all wikilinks in the vault that reference the old title.
@@ -70,32 +129,39 @@ def _update_wikilinks_in_vault(vault_directory: str, old_title: str, new_title:
     # Pattern to match wikilinks: [[old_title]] or [[old_title|display_text]]
     pattern = rf'\[\[{re.escape(old_title)}(\|[^\]]+)?\]\]'
     
-    for filename in os.listdir(vault_directory):
-        if not filename.endswith('.md'):
-            continue
-            
-        file_path = os.path.join(vault_directory, filename)
+    for root, dirs, files in os.walk(vault_directory):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if not name.endswith('.md'):
+                continue
+            file_path = os.path.join(root, name)
+            filename = os.path.relpath(file_path, vault_directory).replace(os.sep, '/')
         
-        # Skip the file we're renaming
-        if filename == old_title + '.md':
-            continue
-        try:
-            
+            # Skip the file we're renaming
+            if filename == old_title + '.md':
+                continue
+            if _update_wikilinks_in_file(file_path, pattern, new_title):
+                updated_files.append(filename)
+    
+    return updated_files
+
+
+def _update_wikilinks_in_file(file_path: str, pattern: str, new_title: str) -> bool:
+    """Rewrites matching wikilinks in one file. Returns whether the file changed."""
+    try:
+        with note_lock(file_path):
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
+            record_io(reads=1)
             
             # Replace wikilinks
             new_content = re.sub(pattern, rf'[[{new_title}\1]]', content)
             
             # Only write if content changed
             if new_content != content:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(new_content)
-                updated_files.append(filename)
-                
-        except Exception as e:
-            # Continue with other files if one fails
-            print(f"Warning: Could not update links in {filename}: {e}")
-            continue
-    
-    return updated_files 
\ No newline at end of file
+                atomic_write(file_path, new_content)
+                return True
+    except Exception as e:
+        # Continue with other files if one fails
+        print(f"Warning: Could not update links in {os.path.basename(file_path)}: {e}")
+    return False
@@ -4,6 +4,13 @@ Note creation tool for Obsidian vault integration.
 
 import os
 from pydantic import Field
+from typing import Annotated, List, Optional
+
+from ..note_index import NoteIndex, ensure_note_id, normalize_title, split_frontmatter
+from ..note_summaries import extract_summary
+from ..similarity import DUPLICATE_THRESHOLD, SimilarNote, TitleIndex
+from ..vault_io import exclusive_create
+from .note_reader import safe_read_file
 
 
 def create_note_outer(*args, **kwargs):
@@ -12,22 +19,31 @@ def create_note_outer(*args, **kwargs):
     
     Args:
         vault_directory (str): Path to the Obsidian vault directory
+        stable_ids (bool): Give new notes a frontmatter id and register them in the vault's note index
+        duplicate_threshold (float | None): Title similarity from which a note counts as a likely duplicate
+            (None, the default: no check)
         
     Returns:
         callable: A function that can create new notes in the vault
     """
     VAULT_DIRECTORY = kwargs["vault_directory"]
+    STABLE_IDS = kwargs.get("stable_ids", False)
+    SIMILARITY_THRESHOLD = kwargs.get("duplicate_threshold")
     
     def create_note(
             note_title: str = Field(description="Meaningful, concise, and self-contained title for the note. (including directories)"),
-            data: str = Field(description="The content of the note to create.")
+            data: str = Field(description="The content of the note to create."),
+            allow_similar: Annotated[bool, Field(description="Create the note even though notes with similar titles exist. Only set this after checking that they make a different claim.")] = False
             ) -> str:
         """
         Creates a new note with the provided content.
+        If the duplicate check is on, notes similar to existing ones are not created; the likely duplicates are returned instead.
         """
-        
-        if not (note_title.startswith("p/") or note_title.startswith("c/")):
-            return "Error: Notes can only be created in the 'p/' (propositions) or 'c/' (concepts) folders."
+        error = validate_new_note(VAULT_DIRECTORY, note_title)
+        if not error and not allow_similar:
+            error = duplicate_error(note_title, find_duplicates(VAULT_DIRECTORY, note_title, data, SIMILARITY_THRESHOLD))
+        if error:
+            return error
 
         file_path = os.path.join(
             VAULT_DIRECTORY,
@@ -37,18 +53,77 @@ def create_note_outer(*args, **kwargs):
         # Ensure parent directories exist when a path is provided in the title
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-        if os.path.exists(file_path):
-            return f"Note {note_title} already exists."
+        if STABLE_IDS:
+            note_id, data = ensure_note_id(data)
 
         try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(data)
+            exclusive_create(file_path, data)
+            if STABLE_IDS:
+                NoteIndex.for_vault(VAULT_DIRECTORY).register(normalize_title(note_title), note_id)
             return f"Successfully created {note_title}"
+        except FileExistsError:
+            # Another run (or a parallel tool call) created the same note after our check
+            return (
+                f"Note {note_title} was just created concurrently by another run. "
+                "Integrate your content into it with edit_note instead. Its current content:\n"
+                f"{safe_read_file(file_path)}"
+            )
         except Exception as e:
             return f"Error creating note {note_title}: {str(e)}"
     
     return create_note 
 
+
+def validate_new_note(vault_directory: str, note_title: str) -> str | None:
+    """
+    Checks whether a note with the given title may be created.
+
+    Returns:
+        An error message, or None if the note can be created
+    """
+    if not (note_title.startswith("p/") or note_title.startswith("c/")):
+        return "Error: Notes can only be created in the 'p/' (propositions) or 'c/' (concepts) folders."
+
+    file_path = os.path.join(
+        vault_directory,
+        note_title if note_title.endswith(".md") else note_title + ".md",
+    )
+    if os.path.exists(file_path):
+        return f"Note {note_title} already exists."
+    return None
+
+def find_duplicates(vault_directory: str, note_title: str, data: str, threshold: Optional[float] = DUPLICATE_THRESHOLD) -> List[SimilarNote]:
+    """
+    Existing notes in the folder of a new note whose titles are similar to its title or its claim
+    (the first heading of its body).
+
+    Returns:
+        The likely duplicates, most similar first (empty if `threshold` is None)
+    """
+    if threshold is None or "/" not in note_title:
+        return []
+    index = TitleIndex.for_folder(vault_directory, note_title.split("/", 1)[0])
+    title = note_title.removesuffix(".md")
+    matches: dict[str, SimilarNote] = {}
+    claim = next((line for line in split_frontmatter(data)[1].splitlines() if line.startswith("# ")), "")
+    for text in (title, extract_summary(title, claim)):
+        for match in index.similar(text, threshold=threshold, exclude=title) if text else []:
+            if match.note_title not in matches or match.similarity > matches[match.note_title].similarity:
+                matches[match.note_title] = match
+    return sorted(matches.values(), key=lambda m: m.similarity, reverse=True)
+
+
+def duplicate_error(note_title: str, duplicates: List[SimilarNote]) -> str | None:
+    """The message returned instead of creating a likely duplicate, or None if there are no duplicates."""
+    if not duplicates:
+        return None
+    listed = "\n".join(f"- {d.note_title} (similarity {d.similarity:.2f})" for d in duplicates)
+    return (
+        f"Not created: {note_title} looks like a duplicate of existing notes:\n{listed}\n"
+        "Integrate your content into one of them with edit_note, or create the note again with "
+        "allow_similar=true if it makes a different claim."
+    )
+
 if __name__ == "__main__":
     inner = create_note_outer(vault_directory="./example_vault")
     print(inner("proposition/test", "test"))
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+Batched note creation tool for Obsidian vault integration.
+"""
+
+from pydantic import BaseModel, Field
+from typing import List
+
+from .create_note import create_note_outer, duplicate_error, find_duplicates, validate_new_note
+from .delete_note import delete_note_outer
+
+
+class NoteDraft(BaseModel):
+    """A note to be created."""
+    note_title: str = Field(description="Meaningful, concise, and self-contained title for the note. (including directories)")
+    data: str = Field(description="The content of the note to create.")
+    allow_similar: bool = Field(default=False, description="Create the note even though notes with similar titles exist. Only set this after checking that they make a different claim.")
+
+
+def create_notes_outer(*args, **kwargs):
+    """
+    Factory function to create a batched note creation tool bound to a specific vault directory.
+    
+    Args:
+        vault_directory (str): Path to the Obsidian vault directory
+        stable_ids (bool): Give new notes a frontmatter id and register them in the vault's note index
+        duplicate_threshold (float | None): Title similarity from which a note counts as a likely duplicate
+            (None, the default: no check)
+        
+    Returns:
+        callable: A function that can create several notes in the vault atomically
+    """
+    VAULT_DIRECTORY = kwargs["vault_directory"]
+    SIMILARITY_THRESHOLD = kwargs.get("duplicate_threshold")
+    create_note = create_note_outer(**kwargs)
+    delete_note = delete_note_outer(**kwargs)
+
+    def create_notes(
+            notes: List[NoteDraft] = Field(description="The notes to create.")
+            ) -> List[str]:
+        """
+        Creates several new notes at once. Either all notes are created or none.
+        Returns one result per note, in order.
+        """
+        errors = []
+        seen = set()
+        for draft in notes:
+            key = draft.note_title.removesuffix(".md")
+            error = validate_new_note(VAULT_DIRECTORY, draft.note_title)
+            if not error and not draft.allow_similar:
+                error = duplicate_error(draft.note_title, find_duplicates(VAULT_DIRECTORY, draft.note_title, draft.data, SIMILARITY_THRESHOLD))
+            if not error and key in seen:
+                error = f"Note {draft.note_title} appears more than once in this batch."
+            seen.add(key)
+            errors.append(error)
+
+        if any(errors):
+            return [
+                error or f"Not created: {draft.note_title} (another note in this batch failed)"
+                for draft, error in zip(notes, errors)
+            ]
+
+        results = []
+        for i, draft in enumerate(notes):
+            # Already checked for duplicates above
+            result = create_note(draft.note_title, draft.data, allow_similar=True)
+            if not result.startswith("Successfully"):
+                # Roll back the notes created so far so the batch stays all-or-nothing
+                for created in notes[:i]:
+                    delete_note(created.note_title)
+                return (
+                    [f"Not created: {d.note_title} (another note in this batch failed)" for d in notes[:i]]
+                    + [result]
+                    + [f"Not created: {d.note_title} (another note in this batch failed)" for d in notes[i + 1:]]
+                )
+            results.append(result)
+        return results
+
+    return create_notes
@@ -5,6 +5,9 @@ Note deletion tool for Obsidian vault integration.
 import os
 from pydantic import Field
 
+from ..note_index import NoteIndex
+from ..vault_io import note_lock, record_io
+
 
 def delete_note_outer(*args, **kwargs):
     """
@@ -12,11 +15,13 @@ def delete_note_outer(*args, **kwargs):
     
     Args:
         vault_directory (str): Path to the Obsidian vault directory
+        stable_ids (bool): Resolve former note titles (aliases) through the vault's note index
         
     Returns:
         callable: A function that can delete notes from the vault
     """
     VAULT_DIRECTORY = kwargs["vault_directory"]
+    STABLE_IDS = kwargs.get("stable_ids", False)
     
     def delete_note(
             note_title: str = Field(description="The title of the note to delete.")
@@ -24,16 +29,21 @@ def delete_note_outer(*args, **kwargs):
         """
         Deletes a note.
         """
+        if STABLE_IDS:
+            note_title = NoteIndex.for_vault(VAULT_DIRECTORY).resolve(note_title)
         file_path = os.path.join(
             VAULT_DIRECTORY,
             note_title if note_title.endswith(".md") else note_title + ".md",
         )
         
-        if not os.path.exists(file_path):
-            return f"Note {note_title} not found."
-
         try:
-            os.remove(file_path)
+            with note_lock(file_path):
+                if not os.path.exists(file_path):
+                    return f"Note {note_title} not found."
+                os.remove(file_path)
+                record_io(writes=1)
+            if STABLE_IDS:
+                NoteIndex.for_vault(VAULT_DIRECTORY).forget(note_title)
             return f"Successfully deleted {note_title}"
         except Exception as e:
             return f"Error deleting note {note_title}: {str(e)}"
@@ -5,6 +5,12 @@ Note editing tool for Obsidian vault integration.
 import os
 from pydantic import Field
 
+from ..note_index import NoteIndex
+from ..vault_io import compare_and_swap, read_with_hash
+
+# How often an edit is re-applied when the note changes between reading and writing it
+MAX_EDIT_ATTEMPTS = 3
+
 
 def edit_note_outer(*args, **kwargs):
     """
@@ -12,11 +18,13 @@ def edit_note_outer(*args, **kwargs):
     
     Args:
         vault_directory (str): Path to the Obsidian vault directory
+        stable_ids (bool): Resolve former note titles (aliases) through the vault's note index
         
     Returns:
         callable: A function that can edit notes using find/replace
     """
     VAULT_DIRECTORY = kwargs["vault_directory"]
+    STABLE_IDS = kwargs.get("stable_ids", False)
     
     def edit_note(
             note_title: str = Field(description="The title of the note to edit."),
@@ -26,6 +34,8 @@ def edit_note_outer(*args, **kwargs):
         """
         Finds and replaces a string in a note with a new string.
         """
+        if STABLE_IDS:
+            note_title = NoteIndex.for_vault(VAULT_DIRECTORY).resolve(note_title)
         file_path = os.path.join(
             VAULT_DIRECTORY,
             note_title if note_title.endswith(".md") else note_title + ".md",
@@ -35,18 +45,22 @@ def edit_note_outer(*args, **kwargs):
             return f"Note {note_title} not found."
 
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                
-            if old not in content:
-                return f"No string '{old}' found in {note_title}"
+            for _ in range(MAX_EDIT_ATTEMPTS):
+                try:
+                    content, expected_hash = read_with_hash(file_path)
+                except FileNotFoundError:
+                    return f"Note {note_title} not found."
+                    
+                if old not in content:
+                    return f"No string '{old}' found in {note_title}"
+                    
+                new_content = content.replace(old, new)
                 
-            new_content = content.replace(old, new)
-            
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(new_content)
+                # Only write if nobody changed the note since we read it; otherwise re-apply the edit
+                if compare_and_swap(file_path, expected_hash, new_content):
+                    return f"Successfully edited {note_title}"
                 
-            return f"Successfully edited {note_title}"
+            return f"Error editing note {note_title}: the note was changed concurrently. Read it again and retry."
         except Exception as e:
             return f"Error editing note {note_title}: {str(e)}"
     
@@ -0,0 +1,112 @@
+"""
+Batched note editing tool for Obsidian vault integration.
+"""
+
+import os
+from pydantic import BaseModel, Field
+from typing import List
+
+from ..note_index import NoteIndex
+from ..vault_io import atomic_write, content_hash, note_lock, read_with_hash
+from .edit_note import MAX_EDIT_ATTEMPTS
+
+
+class NoteEdit(BaseModel):
+    """A find/replace edit of one note."""
+    note_title: str = Field(description="The title of the note to edit.")
+    old: str = Field(description="The exact string to replace. (if it exists multiple times, all will be replaced)")
+    new: str = Field(description="The new string to replace the old string with.")
+
+
+def edit_notes_outer(*args, **kwargs):
+    """
+    Factory function to create a batched note editing tool bound to a specific vault directory.
+    
+    Args:
+        vault_directory (str): Path to the Obsidian vault directory
+        stable_ids (bool): Resolve former note titles (aliases) through the vault's note index
+        
+    Returns:
+        callable: A function that can apply several find/replace edits across notes atomically
+    """
+    VAULT_DIRECTORY = kwargs["vault_directory"]
+    STABLE_IDS = kwargs.get("stable_ids", False)
+
+    def edit_notes(
+            edits: List[NoteEdit] = Field(description="The edits to apply, in order. Several edits may target the same note.")
+            ) -> List[str]:
+        """
+        Applies several find/replace edits across notes at once. Either all edits are applied or none.
+        Returns one result per edit, in order.
+        """
+        for _ in range(MAX_EDIT_ATTEMPTS):
+            originals, contents, results = apply_in_memory(edits)
+            if not all(ok for ok, _ in results):
+                return [
+                    message if not ok else f"Not applied: {message.removeprefix('Successfully edited ')} (another edit in this batch failed)"
+                    for ok, message in results
+                ]
+
+            changed = [file_path for file_path, content in contents.items() if content != originals[file_path]]
+            with note_lock(*changed):
+                # Compare-and-swap: re-apply the batch if any note changed since it was read
+                if any(_current_hash(file_path) != content_hash(originals[file_path]) for file_path in changed):
+                    continue
+
+                written = []
+                try:
+                    for file_path in changed:
+                        atomic_write(file_path, contents[file_path])
+                        written.append(file_path)
+                except Exception as e:
+                    # Restore the notes written so far so the batch stays all-or-nothing
+                    for file_path in written:
+                        atomic_write(file_path, originals[file_path])
+                    return [f"Error applying edits: {str(e)}. No edits were applied."] * len(edits)
+
+            return [message for _, message in results]
+
+        return ["Error applying edits: the notes were changed concurrently. Read them again and retry."] * len(edits)
+
+    def apply_in_memory(edits: List[NoteEdit]) -> tuple[dict[str, str], dict[str, str], list[tuple[bool, str]]]:
+        """Applies the edits to in-memory copies of the notes and records one result per edit."""
+        originals: dict[str, str] = {}
+        contents: dict[str, str] = {}
+        results = []
+
+        for edit in edits:
+            note_title = edit.note_title
+            if STABLE_IDS:
+                note_title = NoteIndex.for_vault(VAULT_DIRECTORY).resolve(note_title)
+            file_path = os.path.join(
+                VAULT_DIRECTORY,
+                note_title if note_title.endswith(".md") else note_title + ".md",
+            )
+
+            if file_path not in contents:
+                if not os.path.exists(file_path):
+                    results.append((False, f"Note {note_title} not found."))
+                    continue
+                try:
+                    originals[file_path] = contents[file_path] = read_with_hash(file_path)[0]
+                except Exception as e:
+                    results.append((False, f"Error editing note {note_title}: {str(e)}"))
+                    continue
+
+            if edit.old not in contents[file_path]:
+                results.append((False, f"No string '{edit.old}' found in {note_title}"))
+                continue
+            contents[file_path] = contents[file_path].replace(edit.old, edit.new)
+            results.append((True, f"Successfully edited {note_title}"))
+
+        return originals, contents, results
+
+    return edit_notes
+
+
+def _current_hash(file_path: str) -> str | None:
+    """Return the content hash of a note, or None if it no longer exists."""
+    try:
+        return read_with_hash(file_path)[1]
+    except FileNotFoundError:
+        return None
@@ -1,14 +1,43 @@
+import asyncio
 import os
 import json
-from typing import List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+from concurrent.futures import as_completed
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langchain_core.tools import tool
 from pydantic import Field
 
-load_dotenv()
+from ..concurrency import shared_limiter
+from ..llm_cache import LLMCache, fingerprint_files
+from ..note_summaries import SummaryStore
+from ..runtime import load_environment
+
+# Blocks are packed up to a token budget: a share of the model's context, but never more than
+# MAX_BLOCK_TOKENS. That is about 30 summarized notes, as many as the fixed blocks of paths held;
+# models overlook relevant notes in long lists, so compare the recall of larger budgets
+# (`block_tokens=`) with `compare_block_recall` first.
+MAX_BLOCK_TOKENS = 750
+CONTEXT_SHARE = 16
+DEFAULT_CONTEXT_TOKENS = 32_000
+MODEL_CONTEXT_TOKENS: Dict[str, int] = {
+    "gpt-5": 400_000,
+    "gpt-5-mini": 400_000,
+    "gpt-5-nano": 400_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4.1-mini": 1_047_576,
+    "gpt-4o-mini": 128_000,
+}
+# Same estimate as langchain's count_tokens_approximately
+CHARS_PER_TOKEN = 4
+
+T = TypeVar("T")
+# Threads of the sync version; how many calls are in flight is decided by the adaptive limiter
+MAX_BLOCK_WORKERS = 32
+
+
+class IncompleteRelevanceError(RuntimeError):
+    """Raised when blocks of notes could not be judged, even after retries."""
 
 
 def get_note_list(directory: str) -> List[str]:
@@ -24,10 +53,194 @@ def get_note_list(directory: str) -> List[str]:
     return sorted(notes)
 
 
-def list_relevant_notes_outer(*args, **kwargs):
-    vault_directory = kwargs["vault_directory"]
-    llm = ChatOpenAI(model="gpt-5-mini", temperature=0, reasoning_effort="low")
+def block_token_budget(llm) -> int:
+    """Token budget of one block of notes for a model (by its `model_name`)."""
+    model = getattr(llm, "model_name", None) or ""
+    context = MODEL_CONTEXT_TOKENS.get(model) or next(
+        (tokens for name, tokens in MODEL_CONTEXT_TOKENS.items() if model.startswith(name + "-20")), DEFAULT_CONTEXT_TOKENS
+    )
+    return min(MAX_BLOCK_TOKENS, context // CONTEXT_SHARE)
+
+
+def _line(note: str, summaries: Dict[str, str]) -> str:
+    summary = summaries.get(note)
+    return f"- {note} | {summary}" if summary else f"- {note}"
+
+
+def _blocks(notes: List[str], summaries: Dict[str, str], budget: int, max_notes: Optional[int] = None) -> List[List[str]]:
+    """Pack notes in order into blocks whose lines fit the token budget (and of at most `max_notes` notes)."""
+    blocks: List[List[str]] = []
+    block: List[str] = []
+    used = 0
+    for note in notes:
+        tokens = len(_line(note, summaries)) // CHARS_PER_TOKEN + 1
+        if block and (used + tokens > budget or len(block) == max_notes):
+            blocks.append(block)
+            block, used = [], 0
+        block.append(note)
+        used += tokens
+    if block:
+        blocks.append(block)
+    return blocks
+
+
+def _block_messages(query: str, block: List[str], summaries: Dict[str, str]) -> list:
+    system_prompt = (
+        "Call the log_relevant_notes tool and select only the note paths relevant to the query." 
+        "If the query consists of many parts, it's enough for a note to be relevant to one of the parts to be included." 
+        "If no notes are relevant to the query, return an empty list \n"
+        "## Query:\n" 
+        "```\n"
+        f"{query}\n"
+        "```\n\n"
+    )
+    lines = "\n".join(_line(note, summaries) for note in block)
+    user_prompt = (
+        "Choose strictly from these note paths (use the exact path; the text after ' | ' summarizes the note):\n"
+        f"{lines}\n\n"
+    )
+    return [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)] # TODO: Force tool use
+
+
+def _parse_block(resp, block: List[str]) -> List[str]:
+    """The notes of a block selected by a response. Raises ValueError for responses without a valid tool call."""
+    calls = getattr(resp, "tool_calls", None) or getattr(resp, "additional_kwargs", {}).get("tool_calls", [])
+    if not calls:
+        raise ValueError("No tool call in the relevance response")
+    args = (calls[0].get("args") or (json.loads(calls[0].get("function", {}).get("arguments", "{}")) if isinstance(calls[0].get("function", {}).get("arguments"), str) else {})) or {}
+    notes_list = args.get("notes")
+    if not isinstance(notes_list, list):
+        raise ValueError(f"Tool call missing 'notes' list. args={args}")
+    invalid = [n for n in notes_list if isinstance(n, str) and n not in block]
+    if invalid:
+        print(f"Invalid notes (not in provided block): {invalid}")
+    return [n for n in notes_list if isinstance(n, str) and n in block]
+
+
+def _parses(parse: Callable[[Any], Any]) -> Callable[[Any], bool]:
+    def valid(resp) -> bool:
+        try:
+            parse(resp)
+        except Exception:
+            return False
+        return True
+
+    return valid
+
+
+def _raise_if_incomplete(errors: List[Exception], blocks: int) -> None:
+    # Dropping a failed block would silently hide its notes; answered blocks are cached, so a retry is cheap
+    if errors:
+        raise IncompleteRelevanceError(
+            f"{len(errors)} of {blocks} blocks of notes could not be judged ({type(errors[0]).__name__}: {errors[0]}). "
+            "Call the tool again to retry them."
+        )
+
+
+def _dedupe(notes: List[str]) -> List[str]:
+    """Dedupe while preserving order."""
+    seen = set()
+    deduped = []
+    for n in notes:
+        if n not in seen:
+            seen.add(n)
+            deduped.append(n)
+    return deduped
+
+
+class BlockJudge:
+    """
+    The shared machinery of the relevance tools: the model and its limits, the vault's notes
+    packed into blocks, and the fan-out of one model call per block.
+    """
+
+    def __init__(self, log_tool, **kwargs) -> None:
+        self.vault_directory = kwargs["vault_directory"]
+        # Relevance answers are cached on disk, so repeated queries over unchanged notes cost nothing
+        cache = LLMCache.for_vault(self.vault_directory) if kwargs.get("llm_cache", True) else None
+        # Extra callback handlers (e.g. telemetry) for the relevance calls when the tool is used on its own.
+        # Inside an agent run, the run's callbacks reach these calls anyway.
+        callbacks = kwargs.get("callbacks")
+        self.config = {"callbacks": callbacks} if callbacks else None
+        # Concurrency of the block calls adapts to the provider's latency and rate limits
+        self.limiter = kwargs.get("limiter") or shared_limiter()
+        # Optional: a duplicate request for blocks slower than the hedger's latency percentile
+        self.hedger = kwargs.get("hedger")
+        llm = kwargs.get("llm")
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+
+            load_environment()
+            llm = ChatOpenAI(model="gpt-5-mini", temperature=0, reasoning_effort="low", cache=cache)
+        self.block_tokens = kwargs.get("block_tokens") or block_token_budget(llm)
+        # Optional: at most this many notes per block (e.g. 30, the fixed blocks before token budgets)
+        self.block_notes = kwargs.get("block_notes")
+        # One-line summaries let the model judge notes beyond their titles (False: paths only, or a custom SummaryStore)
+        summary_store: Optional[SummaryStore] = kwargs.get("summaries", True)
+        self.summary_store = SummaryStore.for_vault(self.vault_directory) if summary_store is True else summary_store
+        self.llm_with_tools = llm.bind_tools([log_tool], tool_choice=True)
+
+    def blocks(self) -> tuple[List[List[str]], Dict[str, str]]:
+        """The vault's notes packed into blocks, and their summaries."""
+        notes = get_note_list(self.vault_directory)
+        if not notes:
+            print("No notes in directory: ", self.vault_directory)
+        summaries = self.summary_store.get(notes) if self.summary_store else {}
+        return _blocks(notes, summaries, self.block_tokens, self.block_notes), summaries
+
+    def _scope(self, block: List[str], parse: Callable[[Any], T]):
+        # A block's cached answer is only valid while none of its notes changed, and only if it parses
+        return LLMCache.scoped(fingerprint_files([os.path.join(self.vault_directory, n) for n in block]), valid=_parses(parse))
+
+    def call(self, messages: list, block: List[str], parse: Callable[[Any], T]) -> T:
+        """The model's parsed answer for one block. Answers `parse` rejects (by raising) are retried."""
+        with self._scope(block, parse):
+            def request():
+                return self.limiter.call(lambda: parse(self.llm_with_tools.invoke(messages, config=self.config)))
 
+            return self.hedger.call(request) if self.hedger else request()
+
+    async def acall(self, messages: list, block: List[str], parse: Callable[[Any], T]) -> T:
+        """Async version of `call`."""
+        with self._scope(block, parse):
+            def request():
+                async def attempt():
+                    return parse(await self.llm_with_tools.ainvoke(messages, config=self.config))
+
+                return self.limiter.acall(attempt)
+
+            return await (self.hedger.acall(request) if self.hedger else request())
+
+    def map(self, process: Callable[[List[str]], T], blocks: List[List[str]]) -> List[T]:
+        """Run `process` on all blocks in threads. Raises IncompleteRelevanceError if blocks failed."""
+        results: List[T] = []
+        errors: List[Exception] = []
+        # The context is copied into the workers so the calling run's callbacks see every block's model call
+        with ContextThreadPoolExecutor(max_workers=max(1, min(len(blocks), MAX_BLOCK_WORKERS))) as executor:
+            futures = [executor.submit(process, b) for b in blocks]
+            for f in as_completed(futures):
+                try:
+                    results.append(f.result())
+                except Exception as exc:
+                    errors.append(exc)
+        _raise_if_incomplete(errors, len(blocks))
+        return results
+
+    async def amap(self, aprocess: Callable[[List[str]], Awaitable[T]], blocks: List[List[str]]) -> List[T]:
+        """Run `aprocess` on all blocks concurrently. Raises IncompleteRelevanceError if blocks failed."""
+        results: List[T] = []
+        errors: List[Exception] = []
+        # The block calls wait for the limiter's slots on the event loop, not in threads
+        for result in await asyncio.gather(*(aprocess(b) for b in blocks), return_exceptions=True):
+            if isinstance(result, Exception):
+                errors.append(result)
+            else:
+                results.append(result)
+        _raise_if_incomplete(errors, len(blocks))
+        return results
+
+
+def list_relevant_notes_outer(*args, **kwargs):
     @tool
     def log_relevant_notes(
             notes: list[str] = Field(description="List of exact note paths that are relevant to the query. (leave empty if no notes are relevant)")
@@ -36,71 +249,39 @@ def list_relevant_notes_outer(*args, **kwargs):
         Log notes relevant to the query.
         """
         print(f"Relevant notes: {notes}")
-    
-    llm_with_tools = llm.bind_tools([log_relevant_notes], tool_choice=True)
-    
+
+    judge = BlockJudge(log_relevant_notes, **kwargs)
+
     def list_relevant_notes(
             query: str = Field(description="Concise explanation of what notes you need. This can be in natural language and contain many different sub-topics.")
             ) -> list[str]:
         """
         Get titles of all notes that are relevant to the query. It's possible to call this tool with a long query, consisting of many parts.
         """
-        notes = get_note_list(vault_directory)
-        if not notes:
-            print("No notes in directory: ", vault_directory)
-            return []
-
-        block_size = 30
-        blocks = [notes[i : i + block_size] for i in range(0, len(notes), block_size)]
+        blocks, summaries = judge.blocks()
 
         def process_block(block: List[str]) -> List[str]:
-            system_prompt = (
-                "Call the log_relevant_notes tool and select only the note paths relevant to the query." 
-                "If the query consists of many parts, it's enough for a note to be relevant to one of the parts to be included." 
-                "If no notes are relevant to the query, return an empty list \n"
-                "## Query:\n" 
-                "```\n"
-                f"{query}\n"
-                "```\n\n"
-            )
-            user_prompt = (
-                "Choose strictly from this list (use exact strings):\n"
-                f"{block}\n\n"
-            )
-            resp = llm_with_tools.invoke([SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]) # TODO: Force tool use
-            calls = getattr(resp, "tool_calls", None) or getattr(resp, "additional_kwargs", {}).get("tool_calls", [])
-            if not calls:
-                print("Tool call failed: no tool_calls in response")
-                return []
-            args = (calls[0].get("args") or (json.loads(calls[0].get("function", {}).get("arguments", "{}")) if isinstance(calls[0].get("function", {}).get("arguments"), str) else {})) or {}
-            notes_list = args.get("notes")
-            if not isinstance(notes_list, list):
-                print(f"Tool call missing 'notes' list. args={args}")
-                return []
-            invalid = [n for n in notes_list if isinstance(n, str) and n not in block]
-            if invalid:
-                print(f"Invalid notes (not in provided block): {invalid}")
-            return [n for n in notes_list if isinstance(n, str) and n in block]
-
-        relevant_notes: List[str] = []
-        with ThreadPoolExecutor(max_workers=min(len(blocks), 10)) as executor:
-            futures = [executor.submit(process_block, b) for b in blocks]
-            for f in as_completed(futures):
-                try:
-                    relevant_notes.extend(f.result())
-                except Exception as exc:
-                    print(f"Block processing generated an exception: {exc}")
-
-        # dedupe while preserving order
-        seen = set()
-        deduped = []
-        for n in relevant_notes:
-            if n not in seen:
-                seen.add(n)
-                deduped.append(n)
-        return deduped
-
-    return list_relevant_notes
+            return judge.call(_block_messages(query, block, summaries), block, lambda resp: _parse_block(resp, block))
+
+        return _dedupe([note for notes in judge.map(process_block, blocks) for note in notes])
+
+    async def alist_relevant_notes(
+            query: str = Field(description="Concise explanation of what notes you need. This can be in natural language and contain many different sub-topics.")
+            ) -> list[str]:
+        """
+        Get titles of all notes that are relevant to the query. It's possible to call this tool with a long query, consisting of many parts.
+        """
+        blocks, summaries = await asyncio.to_thread(judge.blocks)
+
+        async def aprocess_block(block: List[str]) -> List[str]:
+            return await judge.acall(_block_messages(query, block, summaries), block, lambda resp: _parse_block(resp, block))
+
+        return _dedupe([note for notes in await judge.amap(aprocess_block, blocks) for note in notes])
+
+    # One judge (and model client) serves both versions
+    alist_relevant_notes.__name__ = "list_relevant_notes"
+    list_relevant_notes.coroutine = alist_relevant_notes
+    return alist_relevant_notes if kwargs.get("asynchronous") else list_relevant_notes
 
 if __name__ == "__main__":
     import mlflow
@@ -0,0 +1,138 @@
+"""
+Batched relevance tool: finds the relevant notes of many queries in one pass over the vault.
+"""
+
+import asyncio
+import json
+from typing import Dict, List
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.tools import tool
+from pydantic import BaseModel, Field
+
+from .list_relevant_notes import BlockJudge, _dedupe, _line
+
+# Queries judged together in one model call; more queries take more passes over the vault
+MAX_QUERIES_PER_PASS = 20
+
+
+class QueryNotes(BaseModel):
+    """A Pydantic model for the notes of one block relevant to one query."""
+    query: int = Field(description="Number of the query.")
+    notes: list[str] = Field(description="Exact note paths relevant to this query.")
+
+
+def _batch_messages(queries: List[str], block: List[str], summaries: Dict[str, str]) -> list:
+    numbered = "\n".join(f"{i}. {' '.join(query.split())}" for i, query in enumerate(queries, start=1))
+    system_prompt = (
+        "Call the log_relevant_notes_per_query tool and, for every query, select only the note paths relevant to it. "
+        "A note can be relevant to several queries. "
+        "If a query consists of many parts, it's enough for a note to be relevant to one of the parts. "
+        "Leave out queries to which no notes are relevant.\n"
+        "## Queries:\n"
+        "```\n"
+        f"{numbered}\n"
+        "```\n\n"
+    )
+    lines = "\n".join(_line(note, summaries) for note in block)
+    user_prompt = (
+        "Choose strictly from these note paths (use the exact path; the text after ' | ' summarizes the note):\n"
+        f"{lines}\n\n"
+    )
+    return [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
+
+
+def _parse_batch(resp, queries: List[str], block: List[str]) -> Dict[str, List[str]]:
+    """The notes of a block selected per query by a response. Raises ValueError for responses without a valid tool call."""
+    calls = getattr(resp, "tool_calls", None) or []
+    if not calls:
+        raise ValueError("No tool call in the relevance response")
+    args = calls[0].get("args") or {}
+    assignments = args.get("assignments")
+    if isinstance(assignments, str):
+        assignments = json.loads(assignments)
+    if not isinstance(assignments, list):
+        raise ValueError(f"Tool call missing 'assignments' list. args={args}")
+
+    relevant: Dict[str, List[str]] = {}
+    for assignment in assignments:
+        number = assignment.get("query") if isinstance(assignment, dict) else None
+        if not isinstance(number, int) or not 1 <= number <= len(queries):
+            print(f"Invalid query number: {number}")
+            continue
+        notes = assignment.get("notes") or []
+        invalid = [n for n in notes if isinstance(n, str) and n not in block]
+        if invalid:
+            print(f"Invalid notes (not in provided block): {invalid}")
+        relevant.setdefault(queries[number - 1], []).extend(n for n in notes if isinstance(n, str) and n in block)
+    return relevant
+
+
+def _merge(queries: List[str], results: List[Dict[str, List[str]]]) -> Dict[str, List[str]]:
+    merged: Dict[str, List[str]] = {query: [] for query in queries}
+    for result in results:
+        for query, notes in result.items():
+            merged[query].extend(notes)
+    return {query: _dedupe(notes) for query, notes in merged.items()}
+
+
+def list_relevant_notes_batch_outer(*args, **kwargs):
+    """
+    Factory function to create a tool that finds the relevant notes of several queries at once.
+
+    Accepts the same arguments as `list_relevant_notes_outer`. Every block of notes is judged
+    for all queries in one model call, so 20 queries cost one pass over the vault instead of 20.
+    """
+    @tool
+    def log_relevant_notes_per_query(
+            assignments: list[QueryNotes] = Field(description="For every query with relevant notes in this list: its number and the exact paths of its relevant notes.")
+            ):
+        """
+        Log notes relevant to each query.
+        """
+        print(f"Relevant notes per query: {assignments}")
+
+    judge = BlockJudge(log_relevant_notes_per_query, **kwargs)
+
+    def list_relevant_notes_batch(
+            queries: List[str] = Field(description="Concise explanations of what notes you need, e.g. one per proposition. Each can be in natural language and contain many sub-topics.")
+            ) -> Dict[str, List[str]]:
+        """
+        Get titles of the notes relevant to each of several queries in one pass over the vault.
+        Returns a mapping from each query to its relevant notes.
+        """
+        queries = list(dict.fromkeys(queries))
+        blocks, summaries = judge.blocks()
+        results = []
+        for start in range(0, len(queries), MAX_QUERIES_PER_PASS):
+            batch = queries[start : start + MAX_QUERIES_PER_PASS]
+
+            def process_block(block: List[str]) -> Dict[str, List[str]]:
+                return judge.call(_batch_messages(batch, block, summaries), block, lambda resp: _parse_batch(resp, batch, block))
+
+            results += judge.map(process_block, blocks)
+        return _merge(queries, results)
+
+    async def alist_relevant_notes_batch(
+            queries: List[str] = Field(description="Concise explanations of what notes you need, e.g. one per proposition. Each can be in natural language and contain many sub-topics.")
+            ) -> Dict[str, List[str]]:
+        """
+        Get titles of the notes relevant to each of several queries in one pass over the vault.
+        Returns a mapping from each query to its relevant notes.
+        """
+        queries = list(dict.fromkeys(queries))
+        blocks, summaries = await asyncio.to_thread(judge.blocks)
+        passes = []
+        for start in range(0, len(queries), MAX_QUERIES_PER_PASS):
+            batch = queries[start : start + MAX_QUERIES_PER_PASS]
+
+            async def aprocess_block(block: List[str], batch: List[str] = batch) -> Dict[str, List[str]]:
+                return await judge.acall(_batch_messages(batch, block, summaries), block, lambda resp: _parse_batch(resp, batch, block))
+
+            passes.append(judge.amap(aprocess_block, blocks))
+        return _merge(queries, [result for results in await asyncio.gather(*passes) for result in results])
+
+    # One judge (and model client) serves both versions
+    alist_relevant_notes_batch.__name__ = "list_relevant_notes_batch"
+    list_relevant_notes_batch.coroutine = alist_relevant_notes_batch
+    return alist_relevant_notes_batch if kwargs.get("asynchronous") else list_relevant_notes_batch
@@ -11,6 +11,9 @@ from typing import List, Union
 import mmap
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from ..note_index import NoteIndex
+from ..vault_io import record_io
+
 
 class Note(BaseModel):
     """A Pydantic model for a note."""
@@ -25,59 +28,94 @@ def safe_read_file(file_path: str) -> str:
             return f"Note not found at: {file_path}"
         
         with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+            content = f.read()
+        record_io(reads=1)
+        return content
     except Exception as e:
         return f"Error reading file {file_path}: {str(e)}"
 
+def _search_in_file(file_path: str, search_pattern: re.Pattern, name_to_titles: dict[bytes, set[str]]) -> set[str]:
+    """Return the titles of all notes linked from a file."""
+    try:
+        with open(file_path, 'rb', 0) as f, \
+             mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as s:
+            return {title for match in search_pattern.finditer(s) for title in name_to_titles[match.group(1)]}
+    except (IOError, ValueError):
+        return set()
+
+
+def find_inlinks(vault_directory: str, note_titles: dict[str, List[str]]) -> dict[str, List[str]]:
+    """
+    Finds the notes linking to each of the given notes in a single pass over the vault.
+    This is done by searching for "[[note_title]]" or "[[note_title|...]]" links efficiently,
+    with or without the note's folder prefix.
+
+    Args:
+        vault_directory: Path to the vault directory
+        note_titles: Maps each note title (e.g. 'p/Some claim (50%)') to its former titles (aliases)
+
+    Returns:
+        Maps each note title to the vault-relative paths of the notes linking to it, sorted
+    """
+    inlinks: dict[str, List[str]] = {title: [] for title in note_titles}
+    name_to_titles: dict[bytes, set[str]] = {}
+    for title, aliases in note_titles.items():
+        for name in [title, *aliases]:
+            for variant in (name, name.rpartition("/")[2]):
+                name_to_titles.setdefault(variant.encode("utf-8"), set()).add(title)
+    if not name_to_titles:
+        return inlinks
+    # Bytes pattern (when searching bytes); longest names first so prefixes don't shadow them
+    search_pattern = re.compile(
+        rb"\[\[(" + rb"|".join(re.escape(name) for name in sorted(name_to_titles, key=len, reverse=True)) + rb")(?:\]\]|\|)"
+    )
+
+    md_files = []
+    for root, _, files in os.walk(vault_directory):
+        for file in files:
+            if file.endswith(".md"):
+                md_files.append(os.path.join(root, file))
+
+    # Searched in worker threads, so the reads are counted here
+    record_io(reads=len(md_files))
+    with ThreadPoolExecutor() as executor:
+        future_to_file = {executor.submit(_search_in_file, md_file, search_pattern, name_to_titles): md_file for md_file in md_files}
+        for future in as_completed(future_to_file):
+            relpath = os.path.relpath(future_to_file[future], vault_directory)
+            own_title = os.path.splitext(relpath)[0].replace(os.sep, "/")
+            for title in future.result():
+                if title != own_title:
+                    inlinks[title].append(relpath)
+    # Files finish in any order; sorted output keeps tool results identical for the response
+    # cache, recordings and the prompt cache
+    for paths in inlinks.values():
+        paths.sort()
+    return inlinks
+
+
 def read_note_outer(*args, **kwargs):
     """
     Factory function to create a note reading tool bound to a specific vault directory.
     
     Args:
         vault_directory (str): Path to the Obsidian vault directory
+        stable_ids (bool): Resolve former note titles (aliases) through the vault's note index
         
     Returns:
         callable: A function that can read notes from the vault
     """
     VAULT_DIRECTORY = kwargs["vault_directory"]
+    STABLE_IDS = kwargs.get("stable_ids", False)
 
-    def search_in_file(file_path, search_pattern):
-        try:
-            with open(file_path, 'rb', 0) as f, \
-                 mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as s:
-                if re.search(search_pattern, s):
-                    return os.path.relpath(file_path, VAULT_DIRECTORY)
-        except (IOError, ValueError):
-            pass
-        return None
-
-    def list_inlinks(file_path: str) -> list[str]:
+    def list_inlinks(file_path: str, aliases: List[str] = ()) -> list[str]:
         """
-        Finds all notes in the vault that link to the given note.
-        This is done by searching for "[[note_title]]" or "[[note_title|...]]" links efficiently.
+        Finds all notes in the vault that link to the given note (or to one of its former titles).
         """
-        inlinks = []
         try:
-            note_title = os.path.splitext(os.path.basename(file_path))[0]
-            # Bytes pattern (when searching bytes)
-            search_pattern = re.compile(rb"\[\[" + re.escape(note_title).encode("utf-8") + rb"(?:\]\]|\|)")
-
-            md_files = []
-            for root, _, files in os.walk(VAULT_DIRECTORY):
-                for file in files:
-                    if file.endswith(".md") and os.path.join(root, file) != file_path:
-                        md_files.append(os.path.join(root, file))
-
-            with ThreadPoolExecutor() as executor:
-                future_to_file = {executor.submit(search_in_file, md_file, search_pattern): md_file for md_file in md_files}
-                for future in as_completed(future_to_file):
-                    result = future.result()
-                    if result:
-                        inlinks.append(result)
-
+            note_title = os.path.splitext(os.path.relpath(file_path, VAULT_DIRECTORY))[0].replace(os.sep, "/")
+            return find_inlinks(VAULT_DIRECTORY, {note_title: list(aliases)})[note_title]
         except Exception:
             return ["Error: Failed to list inlinks"]
-        return inlinks
     
     def read_note(
             note_title: str = Field(description="The title of the note to read.")
@@ -86,6 +124,9 @@ def read_note_outer(*args, **kwargs):
         Get the content of a note with the provided title and a list of other notes that link to it (inlinks).
         Returns a Note object on success, or an error string on failure.
         """
+        if STABLE_IDS:
+            note_title = NoteIndex.for_vault(VAULT_DIRECTORY).resolve(note_title)
+
         # Construct file path - vault directory is pre-validated by server
         file_path = os.path.join(
             VAULT_DIRECTORY,
@@ -97,7 +138,8 @@ def read_note_outer(*args, **kwargs):
         if "Note not found" in content or "Error reading file" in content:
             return content
 
-        inlinks = list_inlinks(file_path)
+        aliases = NoteIndex.for_vault(VAULT_DIRECTORY).aliases_of(note_title) if STABLE_IDS else []
+        inlinks = list_inlinks(file_path, aliases)
         
         return Note(content=content, inlinks=inlinks)
     
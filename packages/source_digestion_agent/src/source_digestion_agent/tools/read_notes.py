@@ -0,0 +1,63 @@
+"""
+Batched note reading tool for Obsidian vault integration.
+"""
+
+import os
+from pydantic import Field
+from typing import Dict, List, Union
+
+from ..note_index import NoteIndex
+from .note_reader import Note, find_inlinks, safe_read_file
+
+
+def read_notes_outer(*args, **kwargs):
+    """
+    Factory function to create a batched note reading tool bound to a specific vault directory.
+    
+    Args:
+        vault_directory (str): Path to the Obsidian vault directory
+        stable_ids (bool): Resolve former note titles (aliases) through the vault's note index
+        
+    Returns:
+        callable: A function that can read several notes from the vault in one call
+    """
+    VAULT_DIRECTORY = kwargs["vault_directory"]
+    STABLE_IDS = kwargs.get("stable_ids", False)
+
+    def read_notes(
+            note_titles: List[str] = Field(description="The titles of the notes to read.")
+            ) -> Dict[str, Union[Note, str]]:
+        """
+        Get the content and inlinks of several notes at once.
+        Returns a mapping from each requested title to its Note, or to an error string if it could not be read.
+        """
+        index = NoteIndex.for_vault(VAULT_DIRECTORY) if STABLE_IDS else None
+        results: Dict[str, Union[Note, str]] = {}
+        found: Dict[str, tuple[str, str]] = {}
+
+        for requested in note_titles:
+            note_title = index.resolve(requested) if index else requested
+            file_path = os.path.join(
+                VAULT_DIRECTORY,
+                note_title if note_title.endswith(".md") else note_title + ".md",
+            )
+            content = safe_read_file(file_path)
+            if "Note not found" in content or "Error reading file" in content:
+                results[requested] = content
+            else:
+                title = os.path.splitext(os.path.relpath(file_path, VAULT_DIRECTORY))[0].replace(os.sep, "/")
+                found[requested] = (title, content)
+
+        try:
+            inlinks = find_inlinks(
+                VAULT_DIRECTORY,
+                {title: index.aliases_of(title) if index else [] for title, _ in found.values()},
+            )
+        except Exception:
+            inlinks = {title: ["Error: Failed to list inlinks"] for title, _ in found.values()}
+
+        for requested, (title, content) in found.items():
+            results[requested] = Note(content=content, inlinks=inlinks[title])
+        return {requested: results[requested] for requested in note_titles}
+
+    return read_notes
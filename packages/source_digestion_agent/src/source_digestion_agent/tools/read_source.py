@@ -0,0 +1,67 @@
+"""
+Source reading tool for Obsidian vault integration.
+
+Lets the agent read a source's extracted text section by section or by page range,
+instead of carrying the full text in its prompt.
+"""
+
+import os
+from pydantic import Field
+from typing import Annotated, Optional
+
+from ..source_text import MAX_SECTION_CHARS, SourceDocument, source_text_path
+
+# Longest text returned by one call; larger page ranges are cut off with a notice
+MAX_READ_CHARS = 4 * MAX_SECTION_CHARS
+
+
+def read_source_outer(*args, **kwargs):
+    """
+    Factory function to create a source reading tool bound to a specific vault directory.
+    
+    Args:
+        vault_directory (str): Path to the Obsidian vault directory
+        
+    Returns:
+        callable: A function that can read sections or pages of a source's text
+    """
+    VAULT_DIRECTORY = kwargs["vault_directory"]
+    documents: dict[str, tuple[float, SourceDocument]] = {}
+
+    def load(source: str) -> SourceDocument:
+        path = source_text_path(VAULT_DIRECTORY, source)
+        mtime = os.path.getmtime(path)
+        cached = documents.get(path)
+        if cached is None or cached[0] != mtime:
+            documents[path] = (mtime, SourceDocument.from_vault(VAULT_DIRECTORY, source))
+        return documents[path][1]
+
+    def read_source(
+            source: str = Field(description="The filename of the source, as given in the prompt."),
+            section: Annotated[Optional[int], Field(description="Number of the section to read, from the table of contents.")] = None,
+            start_page: Annotated[Optional[int], Field(description="First page to read (1-based). Used if no section is given.")] = None,
+            end_page: Annotated[Optional[int], Field(description="Last page to read (inclusive). Defaults to start_page.")] = None,
+            ) -> str:
+        """
+        Read part of the current source: one section from its table of contents, or a range of pages.
+        """
+        try:
+            document = load(source)
+        except FileNotFoundError:
+            return f"Source {source} not found."
+
+        try:
+            if section is not None:
+                text = document.section(section)
+            elif start_page is not None:
+                text = document.pages(start_page, end_page)
+            else:
+                return "Error: Provide a section number or a start_page. Table of contents:\n" + document.table_of_contents()
+        except (IndexError, ValueError) as e:
+            return f"Error: {str(e)}"
+
+        if len(text) > MAX_READ_CHARS:
+            return text[:MAX_READ_CHARS] + "\n\n[Truncated. Read a smaller page range to see the rest.]"
+        return text
+
+    return read_source
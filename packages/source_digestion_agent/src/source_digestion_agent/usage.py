@@ -0,0 +1,63 @@
+"""
+Token accounting for agent runs.
+
+Reads the provider-reported usage of every model turn, including how many input tokens
+were served from the provider's prompt cache. The agent's prompt is laid out as a stable
+prefix (tool definitions and static instructions) followed by source-specific content, so
+across a batch of sources most instruction tokens should show up as cached.
+"""
+
+from typing import List, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage
+from pydantic import BaseModel, Field
+
+
+class TurnUsage(BaseModel):
+    """A Pydantic model for the token usage of one model turn."""
+    turn: int = Field(description="Position of the turn in the run, starting at 1.")
+    input_tokens: int = Field(description="All input tokens of the turn.")
+    cached_input_tokens: int = Field(description="Input tokens read from the provider's prompt cache.")
+    output_tokens: int = Field(description="Output tokens, including reasoning tokens.")
+
+    @property
+    def uncached_input_tokens(self) -> int:
+        return self.input_tokens - self.cached_input_tokens
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cached_input_tokens / self.input_tokens if self.input_tokens else 0.0
+
+    def __str__(self) -> str:
+        label = f"Turn {self.turn}" if self.turn else "Total"
+        return (
+            f"{label}: {self.input_tokens:,} input tokens "
+            f"({self.cached_input_tokens:,} cached, {self.uncached_input_tokens:,} uncached, {self.cache_hit_rate:.0%} hit), "
+            f"{self.output_tokens:,} output tokens"
+        )
+
+
+def turn_usage(messages: Sequence[BaseMessage]) -> List[TurnUsage]:
+    """Extract the usage of every model turn from a message history."""
+    turns = []
+    for message in messages:
+        usage = getattr(message, "usage_metadata", None) if isinstance(message, AIMessage) else None
+        if not usage:
+            continue
+        turns.append(TurnUsage(
+            turn=len(turns) + 1,
+            input_tokens=usage.get("input_tokens", 0),
+            cached_input_tokens=(usage.get("input_token_details") or {}).get("cache_read", 0) or 0,
+            output_tokens=usage.get("output_tokens", 0),
+        ))
+    return turns
+
+
+def total_usage(turns: Sequence[TurnUsage]) -> TurnUsage:
+    """Sum the usage of several turns (reported as turn 0, printed as "Total")."""
+    return TurnUsage(
+        turn=0,
+        input_tokens=sum(t.input_tokens for t in turns),
+        cached_input_tokens=sum(t.cached_input_tokens for t in turns),
+        output_tokens=sum(t.output_tokens for t in turns),
+    )
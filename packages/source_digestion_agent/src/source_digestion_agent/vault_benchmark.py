@@ -0,0 +1,265 @@
+"""
+Scaling benchmarks of the note tools on synthetic vaults.
+
+`generate_vault` writes a deterministic Obsidian vault with the structure of a real one:
+concept notes (`c/`), proposition notes (`p/`) linking to concepts and other propositions,
+and source notes (`s/`) linking to the propositions they make. `run_tool_benchmarks` times
+the vault-wide operations of the note tools on such vaults (the relevance model of
+`list_relevant_notes` is replaced by a local stub) and returns machine-readable results with
+throughput, latency percentiles and peak memory.
+
+`compare_block_recall` checks that larger relevance blocks do not cost recall: it asks a
+(live) relevance model for the notes about a topic word under several block budgets and
+compares the found notes with the known ones and with the fixed blocks of 30 paths.
+"""
+
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import BaseModel, Field
+
+from .tools.change_note_title import change_note_title_outer
+from .tools.list_relevant_notes import get_note_list, list_relevant_notes_outer
+from .tools.note_reader import read_note_outer
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+_WORDS = (
+    "aging health exercise sleep diet stress memory learning attention motivation habit reward "
+    "dopamine insulin protein sugar fasting inflammation immunity cancer heart brain muscle bone "
+    "risk evidence trial cohort dose effect model agent policy market growth energy climate"
+).split()
+_VERBS = ["increases", "decreases", "predicts", "causes", "improves", "impairs", "requires", "correlates with"]
+
+
+class ToolBenchmark(BaseModel):
+    """A Pydantic model for the measurements of one tool on one vault size."""
+    tool: str = Field(description="The measured operation.")
+    notes: int = Field(description="Number of notes in the vault.")
+    calls: int = Field(description="Number of timed calls.")
+    seconds: float = Field(description="Total duration of the timed calls.")
+    calls_per_second: float = Field(description="Throughput in calls.")
+    notes_per_second: float = Field(description="Throughput in notes scanned (each call scans the whole vault).")
+    p50_ms: float = Field(description="Median latency.")
+    p95_ms: float = Field(description="95th percentile latency.")
+    p99_ms: float = Field(description="99th percentile latency.")
+    peak_memory_mb: float = Field(description="Peak Python memory allocated during one traced call.")
+
+
+class BlockRecall(BaseModel):
+    """A Pydantic model for the relevance results of one block configuration."""
+    configuration: str = Field(description="The block configuration, e.g. 'summaries, 750 tokens'.")
+    block_tokens: Optional[int] = Field(description="Token budget of a block (None: at most 30 paths).")
+    summaries: bool = Field(description="Whether notes were listed with their summaries.")
+    queries: int = Field(description="Number of queries.")
+    calls_per_query: float = Field(description="Model calls (blocks) per query.")
+    recall: float = Field(description="Share of the known relevant notes that were found, over all queries.")
+    precision: float = Field(description="Share of the found notes that are known to be relevant, over all queries.")
+
+
+class _CallCounter(BaseCallbackHandler):
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def on_chat_model_start(self, serialized: Any, messages: Any, **kwargs: Any) -> None:
+        self.calls += 1
+
+
+class StubRelevanceModel(BaseChatModel):
+    """Local stand-in for the relevance model: selects the notes of a block containing a query word (per query when batched)."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-relevance"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "StubRelevanceModel":
+        return self
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        query = messages[0].content.split("```")[1].lower()
+        lines = messages[-1].content.split("\n")[1:]
+        block = [line[2:].split(" | ", 1)[0] for line in lines if line.startswith("- ")]
+
+        def select(query: str) -> List[str]:
+            words = [word for word in query.split() if len(word) > 3]
+            return [note for note in block if any(word in note.lower() for word in words)]
+
+        if "log_relevant_notes_per_query" in messages[0].content:
+            # Batched queries are numbered, one per line
+            queries = [line.split(". ", 1)[1] for line in query.strip().split("\n")]
+            assignments = [{"query": i, "notes": select(q)} for i, q in enumerate(queries, start=1) if select(q)]
+            call = {"name": "log_relevant_notes_per_query", "args": {"assignments": assignments}, "id": "stub", "type": "tool_call"}
+        else:
+            call = {"name": "log_relevant_notes", "args": {"notes": select(query)}, "id": "stub", "type": "tool_call"}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=[call]))])
+
+
+def _phrase(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize()
+
+
+def generate_vault(directory: str, notes: int, seed: int = 0, links_per_note: int = 6) -> List[str]:
+    """
+    Write a synthetic vault of `notes` notes: 30% concepts, 60% propositions, 10% sources.
+
+    Returns:
+        The titles of the proposition notes (e.g. `p/Sleep increases memory 17 (60%)`)
+    """
+    rng = random.Random(seed)
+    for folder in ("c", "p", "s"):
+        os.makedirs(os.path.join(directory, folder), exist_ok=True)
+
+    concept_count = max(1, notes * 3 // 10)
+    source_count = max(1, notes // 10)
+    proposition_count = max(1, notes - concept_count - source_count)
+
+    concepts = [f"c/{_phrase(rng, 2)} {i}" for i in range(concept_count)]
+    propositions = [
+        f"p/{_phrase(rng, 1)} {rng.choice(_VERBS)} {_phrase(rng, 1).lower()} {i} ({rng.randint(1, 99)}%)"
+        for i in range(proposition_count)
+    ]
+    sources = [f"s/{rng.randint(1990, 2025)}-{rng.choice(_WORDS)}-{'-'.join(rng.sample(_WORDS, 3))}-{i}" for i in range(source_count)]
+
+    def write(title: str, body: str) -> None:
+        with open(os.path.join(directory, title + ".md"), "w", encoding="utf-8") as f:
+            f.write(body)
+
+    for title in concepts:
+        related = rng.sample(concepts, min(2, len(concepts)))
+        write(title, f"= {_phrase(rng, 8)}\n" + "".join(f"- Related: [[{link}]]\n" for link in related))
+
+    for title in propositions:
+        used = rng.sample(concepts, min(2, len(concepts)))
+        arguments = rng.sample(propositions, min(links_per_note - 2, len(propositions)))
+        source = rng.choice(sources)
+        lines = [f"# [[{used[0]}]] {rng.choice(_VERBS)} [[{used[-1]}]]"]
+        lines += [f"- [{rng.choice('pc')}] [[{argument}]] [[{source}|(Source)]]" for argument in arguments]
+        write(title, "\n".join(lines) + "\n")
+
+    for title in sources:
+        claims = rng.sample(propositions, min(links_per_note * 2, len(propositions)))
+        body = f"---\nyear: {title[2:6]}\n---\n# {_phrase(rng, 6)}\n## Notes\n"
+        body += "".join(f"- {claim[2:].rsplit(' (', 1)[0]} [[{claim}|↗️]]\n" for claim in claims)
+        write(title, body)
+
+    return propositions
+
+
+def _measure(tool: str, notes: int, call: Callable[[int], Any], samples: int) -> ToolBenchmark:
+    latencies = []
+    for i in range(samples):
+        start = time.perf_counter()
+        call(i)
+        latencies.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate call, since tracing slows down the timed ones
+    tracemalloc.start()
+    try:
+        call(samples)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    seconds = sum(latencies)
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return ToolBenchmark(
+        tool=tool,
+        notes=notes,
+        calls=samples,
+        seconds=seconds,
+        calls_per_second=samples / seconds if seconds else 0.0,
+        notes_per_second=samples * notes / seconds if seconds else 0.0,
+        p50_ms=percentiles[49] * 1000,
+        p95_ms=percentiles[94] * 1000,
+        p99_ms=percentiles[98] * 1000,
+        peak_memory_mb=peak / 1024 / 1024,
+    )
+
+
+def run_tool_benchmarks(sizes: Sequence[int] = DEFAULT_SIZES, samples: int = 20, seed: int = 0) -> List[ToolBenchmark]:
+    """Generate a synthetic vault per size and time the note tools on it."""
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as vault:
+            propositions = generate_vault(vault, size, seed=seed)
+            read_note = read_note_outer(vault_directory=vault)
+            change_note_title = change_note_title_outer(vault_directory=vault)
+            list_relevant_notes = list_relevant_notes_outer(vault_directory=vault, llm=StubRelevanceModel(), llm_cache=False)
+            rng = random.Random(seed)
+            sample = rng.sample(propositions, min(len(propositions), samples + 1))
+            renamed = {}
+
+            def rename(i: int) -> None:
+                title = sample[i % len(sample)]
+                current = renamed.get(title, title)
+                renamed[title] = f"{current.rsplit(' (', 1)[0]} (renamed {i})"
+                change_note_title(current, renamed[title])
+
+            results += [
+                _measure("get_note_list", size, lambda i: get_note_list(vault), samples),
+                _measure("read_note", size, lambda i: read_note(sample[i % len(sample)]), samples),
+                _measure("change_note_title", size, rename, samples),
+                _measure("list_relevant_notes", size, lambda i: list_relevant_notes(f"notes about {rng.choice(_WORDS)}"), samples),
+            ]
+    return results
+
+
+def relevant_notes(notes: Sequence[str], word: str) -> List[str]:
+    """The notes of a synthetic vault about a topic word: those with the word in their title."""
+    return [note for note in notes if word in re.findall(r"[a-z]+", os.path.basename(note).lower())]
+
+
+def compare_block_recall(
+        llm: Optional[BaseChatModel] = None,
+        notes: int = 1_000,
+        queries: int = 10,
+        block_tokens: Sequence[int] = (750, 6_000),
+        seed: int = 0,
+    ) -> List[BlockRecall]:
+    """
+    Measure the recall of `list_relevant_notes` on a synthetic vault for the fixed blocks of
+    30 paths and for summarized blocks of each budget (`llm`: default the tool's model).
+    """
+    rng = random.Random(seed)
+    words = rng.sample(_WORDS, min(queries, len(_WORDS)))
+    configurations: List[tuple[str, Optional[int], bool, Dict[str, Any]]] = [
+        ("30 paths per block", None, False, {"block_tokens": 10**9, "block_notes": 30})
+    ]
+    configurations += [(f"summaries, {budget} tokens", budget, True, {"block_tokens": budget}) for budget in block_tokens]
+
+    results = []
+    with tempfile.TemporaryDirectory() as vault:
+        generate_vault(vault, notes, seed=seed)
+        all_notes = get_note_list(vault)
+        for configuration, budget, summaries, kwargs in configurations:
+            counter = _CallCounter()
+            tool = list_relevant_notes_outer(
+                vault_directory=vault, llm=llm, llm_cache=False, summaries=summaries, callbacks=[counter], **kwargs
+            )
+            found = relevant = hits = 0
+            for word in words:
+                expected = set(relevant_notes(all_notes, word))
+                selected = set(tool(f"Notes about {word}"))
+                found += len(selected)
+                relevant += len(expected)
+                hits += len(selected & expected)
+            results.append(BlockRecall(
+                configuration=configuration,
+                block_tokens=budget,
+                summaries=summaries,
+                queries=len(words),
+                calls_per_query=counter.calls / len(words),
+                recall=hits / relevant if relevant else 1.0,
+                precision=hits / found if found else 1.0,
+            ))
+    return results
@@ -0,0 +1,165 @@
+"""
+Concurrency-safe file operations for Obsidian vault integration.
+
+The note tools may run in parallel (several tool calls from one model turn, or several
+agents sharing a vault), so every write goes through this module:
+
+- `note_lock` serializes access to the same note paths within the process.
+- `atomic_write` never leaves a half-written note behind.
+- `exclusive_create` fails instead of overwriting a note that appeared concurrently.
+- `compare_and_swap` only writes if the note still has the content the edit was based on.
+
+`count_io` counts the reads and writes of these operations (and of the tools reporting
+theirs with `record_io`) for the code running in its context, e.g. one benchmarked run.
+"""
+
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+_locks: dict[str, threading.RLock] = {}
+_locks_guard = threading.Lock()
+
+
+class IOCounter:
+    """The number of note reads and writes (including renames and removals) in a `count_io` context."""
+
+    def __init__(self) -> None:
+        self.reads = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def add(self, reads: int = 0, writes: int = 0) -> None:
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+
+
+_io_counter: ContextVar[Optional[IOCounter]] = ContextVar("vault_io_counter", default=None)
+
+
+@contextmanager
+def count_io() -> Iterator[IOCounter]:
+    """
+    Count the vault I/O of the current context. Tool calls of an agent run inherit the
+    context, so runs in other threads or tasks are not counted.
+    """
+    counter = IOCounter()
+    token = _io_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _io_counter.reset(token)
+
+
+def record_io(reads: int = 0, writes: int = 0) -> None:
+    """Add file operations done outside this module to the current `count_io` context, if any."""
+    counter = _io_counter.get()
+    if counter is not None:
+        counter.add(reads, writes)
+
+
+def _lock_for(path: str) -> threading.RLock:
+    key = os.path.realpath(path)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def note_lock(*paths: str) -> Iterator[None]:
+    """
+    Hold the process-wide locks of all given paths.
+
+    Locks are always taken in sorted order, so callers locking overlapping sets of
+    notes cannot deadlock.
+    """
+    locks = [_lock_for(path) for path in sorted({os.path.realpath(p) for p in paths})]
+    for lock in locks:
+        lock.acquire()
+    try:
+        yield
+    finally:
+        for lock in reversed(locks):
+            lock.release()
+
+
+def content_hash(content: str) -> str:
+    """Return the hash used to detect concurrent modifications of a note."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _temp_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def read_with_hash(path: str) -> tuple[str, str]:
+    """Read a note and return its content together with its content hash."""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    record_io(reads=1)
+    return content, content_hash(content)
+
+
+def atomic_write(path: str, content: str) -> None:
+    """Replace a file's content atomically (readers see either the old or the new note)."""
+    tmp_path = _temp_path(path)
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        record_io(writes=1)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def exclusive_create(path: str, content: str) -> None:
+    """
+    Create a file with the given content, failing if it already exists.
+
+    Raises:
+        FileExistsError: If the file exists (e.g. it was created concurrently)
+    """
+    with note_lock(path):
+        tmp_path = _temp_path(path)
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            try:
+                # Hard-linking fails atomically if the target exists and never exposes a partial note
+                os.link(tmp_path, path)
+            except FileExistsError:
+                raise
+            except OSError:
+                # Filesystems without hard links still get exclusive-create semantics
+                with open(path, "x", encoding="utf-8") as f:
+                    f.write(content)
+            record_io(writes=1)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def compare_and_swap(path: str, expected_hash: str, content: str) -> bool:
+    """
+    Write a note only if its current content still has the expected hash.
+
+    Returns:
+        Whether the note was written
+    """
+    with note_lock(path):
+        try:
+            _, current_hash = read_with_hash(path)
+        except FileNotFoundError:
+            return False
+        if current_hash != expected_hash:
+            return False
+        atomic_write(path, content)
+        return True
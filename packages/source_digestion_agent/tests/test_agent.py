@@ -0,0 +1,848 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from source_digestion_agent import orchestrator
+
+
+class FakeAgent:
+    """Stand-in for SourceDigestionAgent that records concurrency and fails on request."""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    failures: dict[str, int] = {}
+
+    instances = 0
+
+    def __init__(self, vault_directory, **kwargs):
+        FakeAgent.instances += 1
+
+    def get_thread(self, thread_id):
+        return None
+
+    def invoke(self, message, thread_id, doi=None):
+        with FakeAgent.lock:
+            if FakeAgent.failures.get(doi, 0) > 0:
+                FakeAgent.failures[doi] -= 1
+                raise RuntimeError(f"transient failure for {doi}")
+            FakeAgent.in_flight += 1
+            FakeAgent.max_in_flight = max(FakeAgent.max_in_flight, FakeAgent.in_flight)
+        threading.Event().wait(0.05)
+        with FakeAgent.lock:
+            FakeAgent.in_flight -= 1
+        return f"digested {doi} in {thread_id}"
+
+
+@pytest.fixture
+def fake_agent(monkeypatch):
+    """Replace the real agent in the orchestrator."""
+    FakeAgent.in_flight = FakeAgent.max_in_flight = FakeAgent.instances = 0
+    FakeAgent.failures = {}
+    monkeypatch.setattr(orchestrator, "SourceDigestionAgent", FakeAgent)
+    return FakeAgent
+
+
+def test_digest_many_bounds_concurrency(fake_agent, tmp_path):
+    """Test that digest_many runs sources in parallel up to the concurrency limit."""
+    dois = [f"10.1/{i}" for i in range(6)] + ["10.1/0"]
+
+    results = orchestrator.digest_many(str(tmp_path), dois, concurrency=3)
+
+    assert list(results) == [f"10.1/{i}" for i in range(6)]
+    assert results["10.1/2"] == "digested 10.1/2 in digest-10.1/2"
+    assert 1 < fake_agent.max_in_flight <= 3
+    # One agent (graph, tools, model client) serves all sources
+    assert fake_agent.instances == 1
+
+
+def test_digest_many_retries_failed_runs(fake_agent, tmp_path):
+    """Test that failed runs are retried and persistent failures are reported."""
+    fake_agent.failures = {"10.1/a": 1, "10.1/b": 5}
+
+    results = orchestrator.digest_many(str(tmp_path), ["10.1/a", "10.1/b"], max_attempts=2, retry_delay=0)
+
+    assert results["10.1/a"] == "digested 10.1/a in digest-10.1/a"
+    assert isinstance(results["10.1/b"], RuntimeError)
+
+
+def _build_graph(checkpointer, fail_once: list[bool]):
+    """Build a two-step graph whose second step fails once, like a rate-limited model call."""
+    from langgraph.graph import START, MessagesState, StateGraph
+
+    def first(state):
+        return {"messages": [("ai", "first step done")]}
+
+    def second(state):
+        if fail_once and fail_once.pop():
+            raise RuntimeError("rate limited")
+        return {"messages": [("ai", "second step done")]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("first", first)
+    graph.add_node("second", second)
+    graph.add_edge(START, "first")
+    graph.add_edge("first", "second")
+    return graph.compile(checkpointer=checkpointer)
+
+
+def test_sqlite_checkpoints_resume_interrupted_runs(tmp_path):
+    """Test that a run failing mid-way resumes from its last completed step in a new process."""
+    from source_digestion_agent.checkpoints import sqlite_checkpointer
+
+    path = str(tmp_path / "checkpoints.sqlite")
+    config = {"configurable": {"thread_id": "run-1"}}
+    with pytest.raises(RuntimeError):
+        _build_graph(sqlite_checkpointer(path), [True]).invoke({"messages": [("user", "go")]}, config)
+
+    # A fresh checkpointer on the same file sees the interrupted run and resumes it
+    graph = _build_graph(sqlite_checkpointer(path), [])
+    assert graph.get_state(config).next == ("second",)
+    result = graph.invoke(None, config)
+    assert [m.content for m in result["messages"]] == ["go", "first step done", "second step done"]
+
+
+def test_list_and_prune_threads(tmp_path):
+    """Test listing threads by recency and pruning all but the latest."""
+    from source_digestion_agent.checkpoints import list_threads, prune_threads, sqlite_checkpointer
+
+    checkpointer = sqlite_checkpointer(str(tmp_path / "checkpoints.sqlite"))
+    graph = _build_graph(checkpointer, [])
+    for thread_id in ["old", "new"]:
+        graph.invoke({"messages": [("user", "go")]}, {"configurable": {"thread_id": thread_id}})
+
+    threads = list_threads(checkpointer)
+    assert [t.thread_id for t in threads] == ["new", "old"]
+    assert threads[0].step == 2
+
+    assert prune_threads(checkpointer, keep_latest=1) == ["old"]
+    assert [t.thread_id for t in list_threads(checkpointer)] == ["new"]
+
+
+def test_turn_usage_reports_cached_tokens():
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+    from source_digestion_agent.usage import total_usage, turn_usage
+
+    messages = [
+        HumanMessage("Digest this source"),
+        AIMessage("", usage_metadata={
+            "input_tokens": 10_000, "output_tokens": 200, "total_tokens": 10_200,
+            "input_token_details": {"cache_read": 8_000},
+        }),
+        ToolMessage("ok", tool_call_id="call-1"),
+        AIMessage("done", usage_metadata={"input_tokens": 11_000, "output_tokens": 50, "total_tokens": 11_050}),
+    ]
+
+    turns = turn_usage(messages)
+    assert [t.turn for t in turns] == [1, 2]
+    assert turns[0].uncached_input_tokens == 2_000
+    assert turns[0].cache_hit_rate == 0.8
+    assert turns[1].cached_input_tokens == 0
+
+    total = total_usage(turns)
+    assert (total.input_tokens, total.cached_input_tokens, total.output_tokens) == (21_000, 8_000, 250)
+    assert str(total).startswith("Total: 21,000 input tokens (8,000 cached")
+
+
+def test_system_prompt_is_static():
+    from source_digestion_agent.agent import _read_template
+
+    # Source-specific fields in the instructions would break the cacheable prompt prefix
+    assert "{" not in _read_template("system_prompt.md")
+    assert "{source_content}" in _read_template("source_context.md")
+
+
+def _read_turn(call_id, name, args, output):
+    from langchain_core.messages import AIMessage, ToolMessage
+
+    return [
+        AIMessage("", tool_calls=[{"name": name, "args": args, "id": call_id, "type": "tool_call"}]),
+        ToolMessage(output, tool_call_id=call_id),
+    ]
+
+
+def test_compaction_keeps_latest_note_read_and_elides_old_outputs():
+    from langchain_core.messages import HumanMessage
+    from source_digestion_agent.compaction import CompactionPolicy, compact_messages
+
+    messages = [
+        HumanMessage("Digest this source"),
+        *_read_turn("1", "read_note", {"note_title": "p/A"}, "A v1 " * 100),
+        *_read_turn("2", "list_relevant_notes", {}, "x" * 1000),
+        *_read_turn("3", "read_notes", {"note_titles": ["p/A.md", "p/B"]}, "A v2 and B"),
+    ]
+    policy = CompactionPolicy(keep_recent_turns=1, max_tool_output_chars=100, max_tokens=None)
+
+    compacted = compact_messages(messages, policy)
+
+    assert len(compacted) == len(messages)
+    assert compacted[2].content.startswith("[Outdated: p/A was read again later")
+    assert compacted[4].content.startswith("x" * 100) and "900 more characters" in compacted[4].content
+    assert compacted[6].content == "A v2 and B"
+    # The stored history is left untouched
+    assert messages[2].content.startswith("A v1")
+
+
+def test_compaction_drops_oldest_turns_over_budget():
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+    from source_digestion_agent.compaction import CompactionPolicy, compact_messages
+
+    messages = [HumanMessage("Digest this source")]
+    for i in range(10):
+        messages += _read_turn(str(i), "read_source", {"section": i}, "word " * 500)
+    policy = CompactionPolicy(keep_recent_turns=10, max_tokens=2_000)
+
+    compacted = compact_messages(messages, policy)
+
+    assert compacted[0] is messages[0]
+    assert isinstance(compacted[1], SystemMessage) and "earlier turns were removed" in compacted[1].content
+    rest = compacted[2:]
+    assert rest and isinstance(rest[0], AIMessage) and rest[-1].content == messages[-1].content
+    # Every remaining tool result still follows the AI message that called it
+    call_ids = {call["id"] for m in rest if isinstance(m, AIMessage) for call in m.tool_calls}
+    assert all(m.tool_call_id in call_ids for m in rest if isinstance(m, ToolMessage))
+    assert len(rest) < len(messages) - 1
+
+
+class FakeExtractor:
+    """Stand-in chat model for map-reduce extraction: one proposition per section, merged by statement."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = self.max_in_flight = self.calls = 0
+
+    def with_structured_output(self, schema):
+        return self
+
+    def invoke(self, messages):
+        from source_digestion_agent.map_reduce import CandidateProposition, PropositionList, REDUCE_PROMPT
+
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if messages[0].content == REDUCE_PROMPT:
+                merged: dict[str, CandidateProposition] = {}
+                for p in PropositionList.model_validate_json(messages[1].content).propositions:
+                    if p.statement in merged:
+                        merged[p.statement].pro += p.pro
+                        merged[p.statement].sections += p.sections
+                    else:
+                        merged[p.statement] = p
+                return PropositionList(propositions=list(merged.values()))
+            threading.Event().wait(0.05)
+            heading = messages[1].content.splitlines()[1]
+            statement = "Stealing is bad" if "thics" in heading else "Sharing is good"
+            return PropositionList(propositions=[CandidateProposition(statement=statement, pro=[heading])])
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def test_map_reduce_extracts_sections_in_parallel_and_caches_plan(tmp_path):
+    from source_digestion_agent.map_reduce import load_or_extract_plan, render_plan
+    from source_digestion_agent.source_text import SourceDocument
+
+    document = SourceDocument("# Ethics\nA\n\n# More ethics\nB\n\n# Sharing\nC\n")
+    llm = FakeExtractor()
+
+    plan = load_or_extract_plan(llm, str(tmp_path), "2025-doe-ethics", document=document)
+
+    assert llm.max_in_flight == 3
+    assert [p.statement for p in plan] == ["Stealing is bad", "Sharing is good"]
+    assert plan[0].sections == [1, 2]
+    assert "1. Stealing is bad (sections [1], [2])" in render_plan(plan)
+
+    calls = llm.calls
+    assert load_or_extract_plan(llm, str(tmp_path), "2025-doe-ethics", document=document) == plan
+    assert llm.calls == calls
+
+
+def test_map_reduce_does_not_cache_plan_with_failed_sections(tmp_path, monkeypatch):
+    from source_digestion_agent import map_reduce
+    from source_digestion_agent.concurrency import AdaptiveLimiter
+    from source_digestion_agent.map_reduce import IncompleteExtractionError, load_or_extract_plan, plan_path
+    from source_digestion_agent.source_text import SourceDocument
+
+    monkeypatch.setattr(map_reduce, "shared_limiter", lambda: AdaptiveLimiter(attempts=1))
+    document = SourceDocument("# Ethics\nA\n\n# Sharing\nC\n")
+
+    class FailingExtractor(FakeExtractor):
+        def __init__(self, failing):
+            super().__init__()
+            self.failing = failing
+
+        def invoke(self, messages):
+            if any(word in messages[-1].content.splitlines()[1] for word in self.failing):
+                raise RuntimeError("429 Too Many Requests")
+            return super().invoke(messages)
+
+    with pytest.raises(IncompleteExtractionError):
+        load_or_extract_plan(FailingExtractor(["Ethics", "Sharing"]), str(tmp_path), "2025-doe-ethics", document=document)
+    plan = load_or_extract_plan(FailingExtractor(["Sharing"]), str(tmp_path), "2025-doe-ethics", document=document)
+    assert [p.statement for p in plan] == ["Stealing is bad"]
+    assert not os.path.exists(plan_path(str(tmp_path), "2025-doe-ethics"))
+
+    plan = load_or_extract_plan(FakeExtractor(), str(tmp_path), "2025-doe-ethics", document=document)
+    assert [p.statement for p in plan] == ["Stealing is bad", "Sharing is good"]
+    assert os.path.exists(plan_path(str(tmp_path), "2025-doe-ethics"))
+
+
+def test_plan_and_execute_asks_again_only_on_conflicts(tmp_path, monkeypatch):
+    from source_digestion_agent import plan_execute
+    from source_digestion_agent.plan_execute import DigestionPlan, plan_and_execute
+    from source_digestion_agent.tools.create_notes import NoteDraft
+
+    (tmp_path / "s").mkdir()
+    (tmp_path / "c").mkdir()
+    (tmp_path / "s" / "2025-doe-ethics.md").write_text("# Ethics\n## Notes", encoding="utf-8")
+    (tmp_path / "c" / "Stealing.md").write_text("= Taking without permission", encoding="utf-8")
+    monkeypatch.setattr(plan_execute, "list_relevant_notes_outer", lambda **kwargs: lambda query: ["c/Stealing.md"])
+
+    class FakePlanner:
+        def __init__(self):
+            self.prompts = []
+
+        def with_structured_output(self, schema):
+            return self
+
+        def invoke(self, messages):
+            self.prompts.append(messages)
+            # The first plan re-creates an existing note; the corrected one does not
+            title = "c/Stealing" if len(self.prompts) == 1 else "c/Theft"
+            return DigestionPlan(new_notes=[NoteDraft(note_title=title, data="= x")], source_notes="- Stealing is bad")
+
+    planner = FakePlanner()
+    result = plan_and_execute(planner, [], str(tmp_path), "2025-doe-ethics", query="ethics")
+
+    assert result.applied
+    assert len(planner.prompts) == 2
+    assert "= Taking without permission" in planner.prompts[0][-1].content
+    assert "already exists" in planner.prompts[1][-1].content
+    assert (tmp_path / "c" / "Theft.md").exists()
+
+
+def test_llm_cache_replays_identical_calls_within_scope(tmp_path):
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    from source_digestion_agent.llm_cache import LLMCache
+
+    cache = LLMCache(str(tmp_path / "cache.sqlite"))
+    llm = GenericFakeChatModel(messages=iter([AIMessage("first"), AIMessage("second")]), cache=cache)
+
+    with LLMCache.scoped("block-v1"):
+        assert llm.invoke("Which notes are relevant?").content == "first"
+        assert llm.invoke("Which notes are relevant?").content == "first"
+    # A changed block (new scope) misses the cache
+    with LLMCache.scoped("block-v2"):
+        assert llm.invoke("Which notes are relevant?").content == "second"
+
+    # Entries survive a new cache instance on the same file
+    reopened = LLMCache(str(tmp_path / "cache.sqlite"))
+    assert len(reopened) == 2
+
+
+def test_llm_cache_evicts_least_recently_used(tmp_path):
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration
+    from source_digestion_agent.llm_cache import LLMCache
+
+    cache = LLMCache(str(tmp_path / "cache.sqlite"))
+    for prompt in ["a", "b"]:
+        cache.update(prompt, "model", [ChatGeneration(message=AIMessage("x" * 100))])
+    assert cache.lookup("a", "model")[0].message.content == "x" * 100
+
+    cache.max_bytes = cache._connection.execute("SELECT MAX(size) FROM responses").fetchone()[0] * 2
+    cache.update("c", "model", [ChatGeneration(message=AIMessage("x" * 100))])
+
+    assert cache.lookup("b", "model") is None
+    assert cache.lookup("a", "model") is not None and cache.lookup("c", "model") is not None
+
+
+@pytest.fixture
+def source_vault(tmp_path, monkeypatch):
+    """A vault containing one source and one proposition, with a placeholder API key."""
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    vault = tmp_path / "vault"
+    for folder in ["p", "s", "sources"]:
+        (vault / folder).mkdir(parents=True)
+    (vault / "sources" / "2025-doe-ethics.txt").write_text("# Ethics\nStealing harms people.\n", encoding="utf-8")
+    (vault / "sources" / "2025-doe-ethics.bib").write_text("@article{2025-doe-ethics}", encoding="utf-8")
+    (vault / "s" / "2025-doe-ethics.md").write_text("# Ethics\n## Notes", encoding="utf-8")
+    (vault / "p" / "Stealing is bad (50%).md").write_text("# Stealing is bad\n", encoding="utf-8")
+    return vault
+
+
+def test_record_and_replay_benchmark(source_vault, tmp_path):
+    import functools
+
+    from langchain_core.messages import AIMessage
+    from source_digestion_agent.benchmark import record_run, run_benchmark
+    from source_digestion_agent.recording import ReplayChatModel
+
+    def call(name, args, call_id):
+        return {"name": name, "args": args, "id": call_id, "type": "tool_call"}
+
+    usage = {"input_tokens": 1_000, "output_tokens": 10, "total_tokens": 1_010, "input_token_details": {"cache_read": 800}}
+    scripted = ReplayChatModel(responses=[
+        AIMessage("", tool_calls=[
+            call("list_relevant_notes", {"query": "stealing"}, "1"),
+            call("read_note", {"note_title": "p/Stealing is bad (50%)"}, "2"),
+        ], usage_metadata=usage),
+        AIMessage("", tool_calls=[call("create_note", {"note_title": "c/Stealing", "data": "= Taking"}, "3")], usage_metadata=usage),
+        AIMessage("Done", usage_metadata=usage),
+    ])
+
+    def fake_relevance(func):
+        @functools.wraps(func)
+        def relevant(*args, **kwargs):
+            return ["p/Stealing is bad (50%).md"]
+        return relevant
+
+    recording_path = str(tmp_path / "run.json")
+    recording = record_run(
+        str(source_vault), recording_path, filename="2025-doe-ethics",
+        llm=scripted, tool_wrappers={"list_relevant_notes": fake_relevance},
+    )
+    assert len(recording.model_calls) == 3
+    assert [t.name for t in sorted(recording.tool_calls, key=lambda t: t.name)] == ["create_note", "list_relevant_notes", "read_note"]
+
+    # The replay runs on a fresh copy of the vault as it was before the recorded run
+    (source_vault / "c" / "Stealing.md").unlink()
+    result = run_benchmark(recording_path, str(source_vault))
+
+    assert result.error is None
+    assert (result.steps, result.tool_calls) == (3, 3)
+    assert (result.input_tokens, result.cached_input_tokens) == (3_000, 2_400)
+    assert result.vault_io.notes_created == 1 and result.vault_io.reads >= 1 and result.vault_io.writes >= 1
+    assert not (source_vault / "c" / "Stealing.md").exists()
+
+
+def test_count_io_only_counts_its_own_context(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from source_digestion_agent.vault_io import atomic_write, count_io, read_with_hash
+
+    path = str(tmp_path / "note.md")
+    with count_io() as io:
+        atomic_write(path, "a")
+        read_with_hash(path)
+        # Another thread's operations are not counted
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(atomic_write, path, "b").result()
+    atomic_write(path, "c")
+
+    assert (io.reads, io.writes) == (1, 1)
+
+
+def test_invoke_returns_telemetry_summary_and_exports_jsonl(source_vault, tmp_path):
+    import json
+
+    from langchain_core.messages import AIMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+    from source_digestion_agent.agent import SourceDigestionAgent
+    from source_digestion_agent.recording import ReplayChatModel
+
+    usage = {"input_tokens": 1_000, "output_tokens": 10, "total_tokens": 1_010, "input_token_details": {"cache_read": 600}}
+    call = {"name": "read_note", "args": {"note_title": "p/Stealing is bad (50%)"}, "id": "1", "type": "tool_call"}
+    llm = ReplayChatModel(responses=[AIMessage("", tool_calls=[call], usage_metadata=usage), AIMessage("Done", usage_metadata=usage)])
+    log = tmp_path / "telemetry.jsonl"
+
+    agent = SourceDigestionAgent(
+        vault_directory=str(source_vault), filename="2025-doe-ethics", llm=llm,
+        checkpointer=InMemorySaver(), telemetry_log=str(log),
+    )
+    answer, summary = agent.invoke("Digest this source", return_summary=True)
+
+    assert answer == "Done"
+    assert (summary.model_calls, summary.tool_calls, summary.errors) == (2, 1, 0)
+    assert (summary.input_tokens, summary.cached_input_tokens, summary.output_tokens) == (2_000, 1_200, 20)
+    assert set(summary.tool_seconds_by_name) == {"read_note"}
+    assert agent.last_summary == summary
+
+    events = [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+    assert [e["kind"] for e in events].count("model") == 2
+    assert {e["thread_id"] for e in events} == {"default"}
+
+
+def test_agent_builds_every_tool_once(source_vault, monkeypatch):
+    from langgraph.checkpoint.memory import InMemorySaver
+    from source_digestion_agent.agent import SourceDigestionAgent
+    from source_digestion_agent.recording import ReplayChatModel
+    from source_digestion_agent.tools import list_relevant_notes
+
+    judges = []
+    init = list_relevant_notes.BlockJudge.__init__
+    monkeypatch.setattr(list_relevant_notes.BlockJudge, "__init__", lambda self, *args, **kwargs: judges.append(self) or init(self, *args, **kwargs))
+
+    SourceDigestionAgent(vault_directory=str(source_vault), llm=ReplayChatModel(responses=[]), checkpointer=InMemorySaver())
+
+    # One judge (and model client) each for list_relevant_notes and list_relevant_notes_batch
+    assert len(judges) == 2
+
+
+def test_concurrent_runs_return_their_own_summaries(source_vault):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from langchain_core.messages import AIMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+    from source_digestion_agent.agent import SourceDigestionAgent
+    from source_digestion_agent.recording import ReplayChatModel
+
+    llm = ReplayChatModel(responses=[AIMessage("Done")] * 16)
+    agent = SourceDigestionAgent(vault_directory=str(source_vault), filename="2025-doe-ethics", llm=llm, checkpointer=InMemorySaver())
+
+    def run(thread_id):
+        _, summary = agent.invoke("Digest this source", thread_id=thread_id, return_summary=True)
+        return summary.thread_id
+
+    thread_ids = [f"run-{i}" for i in range(16)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(executor.map(run, thread_ids)) == thread_ids
+
+
+def test_one_agent_digests_several_sources(source_vault):
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langchain_core.messages import AIMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+    from source_digestion_agent.agent import SourceDigestionAgent
+    from source_digestion_agent.recording import ReplayChatModel
+
+    (source_vault / "sources" / "2024-roe-sleep.txt").write_text("# Sleep\nSleep helps memory.\n", encoding="utf-8")
+    (source_vault / "sources" / "2024-roe-sleep.bib").write_text("@article{2024-roe-sleep}", encoding="utf-8")
+    (source_vault / "s" / "2024-roe-sleep.md").write_text("# Sleep\n## Notes", encoding="utf-8")
+
+    class SourcePrompts(BaseCallbackHandler):
+        prompts = []
+
+        def on_chat_model_start(self, serialized, messages, **kwargs):
+            self.prompts.append(messages[0][1].content)
+
+    llm = ReplayChatModel(responses=[AIMessage("Ethics done"), AIMessage("Sleep done"), AIMessage("Follow-up done")])
+    agent = SourceDigestionAgent(vault_directory=str(source_vault), llm=llm, checkpointer=InMemorySaver(), callbacks=[SourcePrompts()])
+
+    assert agent.invoke("Digest this source", thread_id="ethics", filename="2025-doe-ethics") == "Ethics done"
+    assert agent.invoke("Digest this source", thread_id="sleep", filename="2024-roe-sleep") == "Sleep done"
+    # Later messages on a thread keep the thread's source
+    assert agent.invoke("Anything missing?", thread_id="ethics") == "Follow-up done"
+
+    assert ["Stealing harms" in p for p in SourcePrompts.prompts] == [True, False, True]
+    assert "Sleep helps memory" in SourcePrompts.prompts[1]
+    with pytest.raises(ValueError):
+        agent.invoke("Digest this source", thread_id="no-source")
+
+
+def test_map_reduce_mode_extracts_the_plan_with_the_given_model(source_vault):
+    from langchain_core.messages import AIMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+    from source_digestion_agent.agent import SourceDigestionAgent
+    from source_digestion_agent.recording import ReplayChatModel
+
+    plan = {"name": "PropositionList", "args": {"propositions": [{"statement": "Stealing harms people"}]}, "id": "1", "type": "tool_call"}
+    llm = ReplayChatModel(responses=[AIMessage("", tool_calls=[plan]), AIMessage("Done")])
+    agent = SourceDigestionAgent(vault_directory=str(source_vault), llm=llm, checkpointer=InMemorySaver(), source_access="map_reduce")
+
+    source = agent.prepare_source(filename="2025-doe-ethics")
+
+    assert "1. Stealing harms people (sections [1])" in source.context
+    assert agent.invoke("Digest this source", filename="2025-doe-ethics") == "Done"
+
+
+def test_ainvoke_and_astream_run_on_one_event_loop(source_vault):
+    import asyncio
+
+    from langchain_core.messages import AIMessage
+    from source_digestion_agent.agent import SourceDigestionAgent
+    from source_digestion_agent.recording import ReplayChatModel
+
+    call = {"name": "read_note", "args": {"note_title": "p/Stealing is bad (50%)"}, "id": "1", "type": "tool_call"}
+    llm = ReplayChatModel(responses=[AIMessage("", tool_calls=[call]), AIMessage("Done"), AIMessage("Streamed")])
+    # The default SQLite checkpointer serves async runs too
+    agent = SourceDigestionAgent(vault_directory=str(source_vault), llm=llm)
+
+    async def run():
+        answer = await agent.ainvoke("Digest this source", thread_id="async", filename="2025-doe-ethics")
+        events = [event async for event in agent.astream("Anything missing?", thread_id="async")]
+        return answer, events
+
+    answer, events = asyncio.run(run())
+
+    assert answer == "Done"
+    assert [event.type for event in events] == ["model_turn_started", "model_turn_finished", "run_finished"]
+    assert events[-1].answer == "Streamed"
+    assert agent.get_thread("async").message_count == 6
+    assert asyncio.run(agent.aget_thread("async")) == agent.get_thread("async")
+    assert asyncio.run(agent.aget_thread("unknown")) is None
+
+
+def test_stream_yields_typed_progress_events(source_vault):
+    from langchain_core.messages import AIMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+    from source_digestion_agent.agent import SourceDigestionAgent
+    from source_digestion_agent.events import note_changes
+    from source_digestion_agent.recording import ReplayChatModel
+
+    usage = {"input_tokens": 1_000, "output_tokens": 10, "total_tokens": 1_010, "input_token_details": {"cache_read": 600}}
+    calls = [
+        {"name": "create_note", "args": {"note_title": "c/Theft", "data": "= Taking without permission"}, "id": "1", "type": "tool_call"},
+        {"name": "edit_note", "args": {"note_title": "p/Stealing is bad (50%)", "old": "missing", "new": "x"}, "id": "2", "type": "tool_call"},
+    ]
+    llm = ReplayChatModel(responses=[AIMessage("", tool_calls=calls, usage_metadata=usage), AIMessage("Done", usage_metadata=usage)])
+    agent = SourceDigestionAgent(vault_directory=str(source_vault), llm=llm, checkpointer=InMemorySaver())
+
+    events = list(agent.stream("Digest this source", filename="2025-doe-ethics"))
+
+    assert [e.type for e in events[:4]] == ["source_stage", "model_turn_started", "model_turn_finished", "tool_call_started"]
+    assert events[0].stage == "ready" and events[0].filename == "2025-doe-ethics"
+    assert events[2].tool_calls == ["create_note", "edit_note"] and events[2].usage.cached_input_tokens == 600
+    finished = {e.tool: e for e in events if e.type == "tool_call_finished"}
+    assert finished["edit_note"].summary.startswith("No string 'missing'")
+    # Only the successful call changed a note
+    assert [(e.action, e.note_title) for e in events if e.type == "note_changed"] == [("created", "c/Theft")]
+    assert events[-1].type == "run_finished" and events[-1].answer == "Done"
+    assert events[-1].summary.model_calls == 2 and agent.last_usage[1].turn == 2
+
+    # Batch tools report one result per note
+    edits = [{"note_title": "p/A"}, {"note_title": "p/A"}, {"note_title": "p/B"}]
+    results = '["Successfully edited p/A", "Successfully edited p/A", "Successfully edited p/B"]'
+    assert [e.note_title for e in note_changes("edit_notes", {"edits": edits}, results)] == ["p/A", "p/B"]
+
+
+def test_list_relevant_notes_reports_block_calls_to_callbacks(tmp_path):
+    from source_digestion_agent.telemetry import Telemetry, estimate_cost
+    from source_digestion_agent.tools.list_relevant_notes import list_relevant_notes_outer
+    from source_digestion_agent.vault_benchmark import StubRelevanceModel, generate_vault
+
+    generate_vault(str(tmp_path), 100)
+    telemetry = Telemetry()
+    list_relevant_notes = list_relevant_notes_outer(
+        vault_directory=str(tmp_path), llm=StubRelevanceModel(), llm_cache=False, callbacks=[telemetry], block_tokens=2_000,
+    )
+
+    list_relevant_notes("notes about sleep")
+
+    # 100 notes with their summaries fit into 2 blocks of 2,000 tokens, each judged in its own model call
+    assert telemetry.summary().model_calls == 2
+    assert estimate_cost("gpt-5-mini-2025-08-07", 1_000_000, 0, 0) == 0.25
+    assert estimate_cost("unknown-model", 1_000, 0, 0) is None
+
+
+def test_import_has_no_heavy_side_effects():
+    from source_digestion_agent.import_benchmark import measure_import_time
+
+    package = measure_import_time("source_digestion_agent", runs=1, budget_seconds=60)
+    agent = measure_import_time("source_digestion_agent.agent", runs=1, budget_seconds=60)
+
+    # Tracing, the OpenAI client, rich and PDF extraction are only imported when used
+    assert package.heavy_modules_loaded == [] and "langchain_core" not in package.slowest
+    assert agent.heavy_modules_loaded == []
+    assert agent.within_budget and agent.slowest
+
+
+def test_tracing_is_opt_in(monkeypatch):
+    from source_digestion_agent.runtime import TRACING_ENV_VAR, tracing_requested
+
+    monkeypatch.delenv(TRACING_ENV_VAR, raising=False)
+    assert not tracing_requested()
+    monkeypatch.setenv(TRACING_ENV_VAR, "1")
+    assert tracing_requested()
+    assert not tracing_requested(False)
+
+
+def test_job_queue_retries_with_backoff_and_dead_letters(tmp_path):
+    from source_digestion_agent.jobs import JobQueue
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=2, retry_delay=60)
+    assert queue.enqueue(["10.1/a", "10.1/b", "10.1/a"]) == ["10.1/a", "10.1/b"]
+    assert queue.enqueue(["10.1/a"]) == []
+
+    job = queue.claim()
+    assert (job.doi, job.status, job.attempts) == ("10.1/a", "running", 1)
+    queue.record_stage("10.1/a", "downloaded", "2025-doe-ethics")
+    failed = queue.fail("10.1/a", "HTTPError: 429")
+    # The failed job waits for its backoff; the next due job is claimed instead
+    assert failed.status == "queued" and failed.next_attempt_at > job.updated_at.timestamp() + 59
+    assert queue.claim().doi == "10.1/b"
+    assert queue.claim() is None
+    # A job leased to a live worker is not recovered, one whose lease expired is
+    assert queue.get("10.1/b").owner == queue.owner and queue.recover() == []
+    with queue._lock:
+        queue._connection.execute("UPDATE jobs SET lease_expires_at = 0 WHERE doi = '10.1/b'")
+    assert queue.recover() == ["10.1/b"] and queue.get("10.1/b").owner is None
+    # So is a job of a process on this host that is gone, even before its lease expires; this
+    # was its last attempt, so it is moved to the dead-letter list
+    finished = subprocess.Popen([sys.executable, "-c", ""])
+    finished.wait()
+    queue.claim()
+    assert queue.renew() == 1
+    with queue._lock:
+        queue._connection.execute("UPDATE jobs SET owner = ? WHERE doi = '10.1/b'", (f"{queue.owner.rpartition(':')[0]}:{finished.pid}",))
+    assert queue.recover() == [] and queue.get("10.1/b").status == "dead"
+
+    with queue._lock:
+        queue._connection.execute("UPDATE jobs SET next_attempt_at = 0")
+    queue.claim()
+    dead = queue.fail("10.1/a", "HTTPError: 429")
+    assert (dead.status, dead.stage, dead.filename) == ("dead", "downloaded", "2025-doe-ethics")
+    assert queue.requeue(["10.1/a"]) == ["10.1/a"] and queue.get("10.1/a").attempts == 0
+
+
+def test_job_queue_dead_letters_jobs_that_kill_their_worker(tmp_path):
+    from source_digestion_agent.jobs import JobQueue
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=2)
+    queue.enqueue(["10.1/crash"])
+
+    for _ in range(5):
+        if queue.claim() is None:
+            break
+        # The worker dies without calling fail(), and its lease runs out
+        with queue._lock:
+            queue._connection.execute("UPDATE jobs SET lease_expires_at = 0")
+        queue.recover()
+
+    job = queue.get("10.1/crash")
+    assert (job.status, job.attempts, job.owner) == ("dead", 2, None)
+    assert job.last_error.startswith("Worker died")
+
+
+def test_worker_pool_digests_queued_jobs(tmp_path):
+    from source_digestion_agent.events import RunFinished, SourceStage
+    from source_digestion_agent.jobs import JobQueue, WorkerPool
+    from source_digestion_agent.telemetry import RunSummary
+
+    class StreamingAgent:
+        def get_thread(self, thread_id):
+            return None
+
+        def stream(self, message, thread_id, doi=None):
+            if doi == "10.1/broken":
+                raise RuntimeError("no PDF found")
+            yield SourceStage(stage="extracted", filename=doi.replace("/", "-"))
+            yield RunFinished(answer=f"digested {doi}", summary=RunSummary())
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=2, retry_delay=0)
+    queue.enqueue([f"10.1/{i}" for i in range(5)] + ["10.1/broken"])
+    pool = WorkerPool(str(tmp_path), workers=3, queue=queue, agent=StreamingAgent(), poll_interval=0.01)
+
+    assert pool.run_until_idle() == {"done": 5, "dead": 1}
+    assert queue.get("10.1/3").answer == "digested 10.1/3" and queue.get("10.1/3").stage == "digested"
+    assert queue.get("10.1/broken").attempts == 2 and "no PDF found" in queue.get("10.1/broken").last_error
+
+
+def test_adaptive_limiter_grows_and_backs_off_on_rate_limits():
+    from source_digestion_agent.concurrency import AdaptiveLimiter
+
+    class RateLimitError(Exception):
+        status_code = 429
+
+    limiter = AdaptiveLimiter(initial=4, maximum=8, cooldown=60, retry_delay=0)
+    for _ in range(40):
+        limiter.call(lambda: None)
+    assert limiter.limit == 8
+
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitError("429 Too Many Requests")
+        return "ok"
+
+    # Both rate limits are retried; the cooldown allows only one cut
+    assert limiter.call(flaky) == "ok"
+    stats = limiter.stats()
+    assert (limiter.limit, stats.rate_limits, stats.decreases) == (4, 2, 1)
+
+
+def test_adaptive_limiter_bounds_threads_and_tasks_together():
+    import asyncio
+    import time as time_module
+    from concurrent.futures import ThreadPoolExecutor
+
+    from source_digestion_agent.concurrency import AdaptiveLimiter
+
+    limiter = AdaptiveLimiter(initial=3, maximum=3)
+    peak = []
+
+    def observe():
+        peak.append(limiter.stats().in_flight)
+
+    def sync_call():
+        with limiter.slot():
+            observe()
+            time_module.sleep(0.01)
+
+    async def async_calls():
+        async def one():
+            async with limiter.aslot():
+                observe()
+                await asyncio.sleep(0.01)
+        await asyncio.gather(*(one() for _ in range(10)))
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        futures = [executor.submit(sync_call) for _ in range(10)]
+        asyncio.run(async_calls())
+        for future in futures:
+            future.result()
+
+    assert len(peak) == 20 and max(peak) <= 3
+    assert limiter.stats().in_flight == 0 and limiter.stats().successes == 20
+
+
+def test_hedger_duplicates_slow_calls_within_budget():
+    import asyncio
+    import time as time_module
+
+    from source_digestion_agent.concurrency import Hedger
+
+    hedger = Hedger(percentile=0.9, budget=0.2, min_samples=5, min_delay=0.01)
+    cancelled = []
+    calls = []
+
+    async def request():
+        calls.append(1)
+        # Every 10th call (counting duplicates) is stuck
+        try:
+            await asyncio.sleep(5 if len(calls) % 10 == 0 else 0.001)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return "answer"
+
+    async def run():
+        return [await hedger.acall(request) for _ in range(30)]
+
+    start = time_module.perf_counter()
+    assert asyncio.run(run()) == ["answer"] * 30
+    assert time_module.perf_counter() - start < 2
+
+    stats = hedger.stats()
+    assert stats.hedges == stats.hedge_wins == len(cancelled) >= 2
+    assert stats.hedges <= 0.2 * stats.calls
+
+    # Sync calls: an invalid first response loses against a valid duplicate
+    responses = iter([(0.3, "invalid"), (0.0, "valid")])
+
+    def sync_request():
+        delay, result = next(responses)
+        time_module.sleep(delay)
+        return result
+
+    assert hedger.call(sync_request, valid=lambda result: result == "valid") == "valid"
+
+    # A caller cancelled during the hedging delay cancels its request too
+    async def cancel_while_waiting():
+        cancelled.clear()
+        calls[:] = [1] * 9
+        caller = asyncio.ensure_future(hedger.acall(request))
+        await asyncio.sleep(0.005)
+        caller.cancel()
+        await asyncio.sleep(0.01)
+        return caller.cancelled(), list(cancelled)
+
+    assert hedger.delay() > 0.005 and asyncio.run(cancel_while_waiting()) == (True, [1])
@@ -0,0 +1,568 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from source_digestion_agent.note_index import NoteIndex, split_frontmatter, parse_aliases
+from source_digestion_agent import tools
+from source_digestion_agent.tools import (
+    change_note_title_outer,
+    create_note_outer,
+    create_notes_outer,
+    edit_note_outer,
+    edit_notes_outer,
+    read_note_outer,
+    read_notes_outer,
+)
+from source_digestion_agent.tools.create_notes import NoteDraft
+from source_digestion_agent.tools.edit_notes import NoteEdit
+
+
+@pytest.fixture
+def temp_vault():
+    """Create temporary vault with a proposition linked from another note."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        vault = Path(tmpdir)
+        (vault / "p").mkdir()
+        (vault / "s").mkdir()
+        (vault / "p" / "Stealing is bad (50%).md").write_text("# Stealing is bad\n", encoding="utf-8")
+        (vault / "s" / "2025-doe-ethics.md").write_text(
+            "## Notes\n- Stealing is bad [[p/Stealing is bad (50%)|↗️]]\n", encoding="utf-8"
+        )
+        yield vault
+
+
+def test_change_note_title_rewrites_links_in_subfolders(temp_vault):
+    """Test that a plain rename updates links in notes inside folders."""
+    rename = change_note_title_outer(vault_directory=str(temp_vault))
+
+    result = rename("p/Stealing is bad (50%)", "p/Stealing is bad (60%)")
+
+    assert "Updated links in 1 files: s/2025-doe-ethics.md" in result
+    assert "[[p/Stealing is bad (60%)|↗️]]" in (temp_vault / "s" / "2025-doe-ethics.md").read_text(encoding="utf-8")
+
+
+def test_change_note_title_with_stable_ids_keeps_other_notes(temp_vault):
+    """Test that a stable-id rename only touches the renamed note and the index."""
+    source_note = temp_vault / "s" / "2025-doe-ethics.md"
+    before = source_note.read_text(encoding="utf-8")
+    rename = change_note_title_outer(vault_directory=str(temp_vault), stable_ids=True)
+
+    result = rename("p/Stealing is bad (50%)", "p/Stealing is bad (60%)")
+
+    assert "resolve through its alias" in result
+    assert source_note.read_text(encoding="utf-8") == before
+    fields, body = split_frontmatter((temp_vault / "p" / "Stealing is bad (60%).md").read_text(encoding="utf-8"))
+    assert fields["id"]
+    assert parse_aliases(fields["aliases"]) == ["Stealing is bad (50%)"]
+    assert body == "# Stealing is bad\n"
+    assert (temp_vault / ".fasterscience" / "note_index.json").exists()
+
+
+def test_old_titles_resolve_after_stable_rename(temp_vault):
+    """Test that reading and editing by a former title reach the renamed note."""
+    vault = str(temp_vault)
+    change_note_title_outer(vault_directory=vault, stable_ids=True)("p/Stealing is bad (50%)", "p/Stealing is bad (60%)")
+    change_note_title_outer(vault_directory=vault, stable_ids=True)("p/Stealing is bad (60%)", "p/Stealing is bad (70%)")
+
+    note = read_note_outer(vault_directory=vault, stable_ids=True)("p/Stealing is bad (50%)")
+    assert note.inlinks == ["s/2025-doe-ethics.md"]
+
+    result = edit_note_outer(vault_directory=vault, stable_ids=True)("p/Stealing is bad (60%)", "# Stealing", "# Theft")
+    assert result == "Successfully edited p/Stealing is bad (70%)"
+    assert "# Theft is bad" in (temp_vault / "p" / "Stealing is bad (70%).md").read_text(encoding="utf-8")
+
+
+def test_note_index_rebuilds_from_frontmatter(temp_vault):
+    """Test that a lost index is rebuilt from note frontmatter."""
+    vault = str(temp_vault)
+    change_note_title_outer(vault_directory=vault, stable_ids=True)("p/Stealing is bad (50%)", "p/Stealing is bad (60%)")
+    (temp_vault / ".fasterscience" / "note_index.json").unlink()
+
+    assert NoteIndex(vault).resolve("p/Stealing is bad (50%)") == "p/Stealing is bad (60%)"
+
+
+def test_create_note_with_stable_ids_adds_id(temp_vault):
+    """Test that new notes get a frontmatter id when stable ids are enabled."""
+    create = create_note_outer(vault_directory=str(temp_vault), stable_ids=True)
+
+    assert create("c/Theft", "= Taking without permission\n") == "Successfully created c/Theft"
+    fields, body = split_frontmatter((temp_vault / "c" / "Theft.md").read_text(encoding="utf-8"))
+    assert fields["id"]
+    assert body == "= Taking without permission\n"
+
+
+def test_create_note_returns_likely_duplicates_instead_of_creating(temp_vault):
+    """Test that a note similar to an existing one is not created unless explicitly allowed."""
+    assert create_note_outer(vault_directory=str(temp_vault))("p/Stealing is very bad (60%)", "y").startswith("Successfully")
+    (temp_vault / "p" / "Stealing is very bad (60%).md").unlink()
+    create = create_note_outer(vault_directory=str(temp_vault), duplicate_threshold=0.7)
+    create_notes = create_notes_outer(vault_directory=str(temp_vault), duplicate_threshold=0.7)
+
+    assert create("p/Sleep improves memory consolidation (70%)", "# [[c/Sleep]] improves memory") == "Successfully created p/Sleep improves memory consolidation (70%)"
+    result = create("p/Sleep increases memory consolidation (65%)", "# [[c/Sleep]] increases memory")
+    assert result.startswith("Not created") and "- p/Sleep improves memory consolidation (70%) (similarity 1.00)" in result
+    assert not (temp_vault / "p" / "Sleep increases memory consolidation (65%).md").exists()
+
+    # A different claim about the same concepts is created, as are counter-propositions; so is a duplicate the agent insists on
+    assert create("p/Stress impairs memory consolidation (70%)", "# Stress impairs memory").startswith("Successfully")
+    assert create("p/Sleep decreases memory consolidation (20%)", "# [[c/Sleep]] decreases memory").startswith("Successfully")
+    assert create("p/Sleep does not improve memory consolidation (30%)", "x").startswith("Successfully")
+    assert create("p/Sleep increases memory consolidation (65%)", "x", allow_similar=True).startswith("Successfully")
+
+    results = create_notes([NoteDraft(note_title="c/Theft", data="= x"), NoteDraft(note_title="p/Stealing is very bad (60%)", data="y")])
+    assert results[0].startswith("Not created: c/Theft") and "p/Stealing is bad (50%)" in results[1]
+
+
+def test_read_note_finds_folder_prefixed_inlinks(temp_vault):
+    """Test that inlinks written with a folder prefix are found."""
+    note = read_note_outer(vault_directory=str(temp_vault))("p/Stealing is bad (50%)")
+
+    assert note.inlinks == ["s/2025-doe-ethics.md"]
+
+
+def test_tools_are_registered_once():
+    """Test that factories imported between tool modules are not registered twice."""
+    assert len(tools.__all__) == len(set(tools.__all__))
+
+
+def test_read_notes_returns_per_title_results(temp_vault):
+    """Test reading several notes, including a missing one, in one call."""
+    results = read_notes_outer(vault_directory=str(temp_vault))(["p/Stealing is bad (50%)", "c/Missing"])
+
+    assert list(results) == ["p/Stealing is bad (50%)", "c/Missing"]
+    assert results["p/Stealing is bad (50%)"].inlinks == ["s/2025-doe-ethics.md"]
+    assert "Note not found" in results["c/Missing"]
+
+
+def test_create_notes_is_all_or_nothing(temp_vault):
+    """Test that one invalid note prevents the whole batch from being created."""
+    create_notes = create_notes_outer(vault_directory=str(temp_vault))
+
+    results = create_notes([NoteDraft(note_title="c/Theft", data="= x"), NoteDraft(note_title="p/Stealing is bad (50%)", data="y")])
+
+    assert results == ["Not created: c/Theft (another note in this batch failed)", "Note p/Stealing is bad (50%) already exists."]
+    assert not (temp_vault / "c" / "Theft.md").exists()
+
+    results = create_notes([NoteDraft(note_title="c/Theft", data="= x"), NoteDraft(note_title="c/Property", data="= y")])
+    assert results == ["Successfully created c/Theft", "Successfully created c/Property"]
+
+
+def test_edit_notes_applies_edits_in_order(temp_vault):
+    """Test several edits to one note and the rollback when an edit fails."""
+    edit_notes = edit_notes_outer(vault_directory=str(temp_vault))
+    note = temp_vault / "p" / "Stealing is bad (50%).md"
+
+    results = edit_notes([NoteEdit(note_title="p/Stealing is bad (50%)", old="Stealing", new="Theft"), NoteEdit(note_title="c/Missing", old="a", new="b")])
+    assert results[1] == "Note c/Missing not found."
+    assert note.read_text(encoding="utf-8") == "# Stealing is bad\n"
+
+    results = edit_notes([
+        NoteEdit(note_title="p/Stealing is bad (50%)", old="Stealing", new="Theft"),
+        NoteEdit(note_title="p/Stealing is bad (50%)", old="Theft is", new="Theft was"),
+    ])
+    assert results == ["Successfully edited p/Stealing is bad (50%)"] * 2
+    assert note.read_text(encoding="utf-8") == "# Theft was bad\n"
+
+
+def test_concurrent_edits_do_not_lose_updates(temp_vault):
+    """Test that parallel read-modify-write edits of one note never overwrite each other."""
+    edit_note = edit_note_outer(vault_directory=str(temp_vault))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: edit_note("p/Stealing is bad (50%)", "bad", f"bad\n- [p] arg{i}"), range(8)))
+
+    content = (temp_vault / "p" / "Stealing is bad (50%).md").read_text(encoding="utf-8")
+    for i, result in enumerate(results):
+        if result.startswith("Successfully"):
+            assert f"arg{i}" in content
+        else:
+            assert "changed concurrently" in result
+    assert any(result.startswith("Successfully") for result in results)
+
+
+def test_concurrent_creates_are_exclusive(temp_vault):
+    """Test that only one of several parallel creations of the same note succeeds."""
+    create_note = create_note_outer(vault_directory=str(temp_vault))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: create_note("c/Theft", f"= version {i}"), range(8)))
+
+    assert sum(result == "Successfully created c/Theft" for result in results) == 1
+    assert all(
+        result in ("Successfully created c/Theft", "Note c/Theft already exists.") or "created concurrently" in result
+        for result in results
+    )
+
+
+SOURCE_TEXT = (
+    "# A Study of Theft\n\nAbstract text.\n\n--- end of page=0 ---\n\n"
+    "## Introduction\n\nStealing is common.\n\n--- end of page=1 ---\n\n"
+    "## Results\n\nStealing is bad.\n\nMore results.\n\n--- end of page=2 ---\n\n"
+)
+
+
+def test_source_document_sections_and_pages():
+    """Test splitting extracted text into sections with page ranges."""
+    from source_digestion_agent.source_text import SourceDocument
+
+    document = SourceDocument(SOURCE_TEXT)
+
+    assert [s.title for s in document.sections] == ["A Study of Theft", "Introduction", "Results"]
+    assert [(s.start_page, s.end_page) for s in document.sections] == [(1, 1), (2, 2), (3, 3)]
+    assert document.page_count == 3
+    assert "- [3] Results (p. 3," in document.table_of_contents()
+    assert document.section(2).startswith("## Introduction")
+    assert "Stealing is common" in document.pages(1, 2) and "Stealing is bad" not in document.pages(1, 2)
+
+
+def test_source_document_splits_long_text_without_headings():
+    """Test that text without headings is split into bounded parts."""
+    from source_digestion_agent.source_text import SourceDocument
+
+    document = SourceDocument("\n\n".join(["word " * 30] * 40), max_section_chars=1000)
+
+    assert len(document.sections) > 1
+    assert all(s.end - s.start <= 1000 for s in document.sections)
+    assert document.sections[0].title.startswith("Full text (part 1/")
+    assert "".join(document.section(s.index) for s in document.sections) == document.text
+
+
+def test_read_source_reads_sections_and_pages(temp_vault):
+    """Test the read_source tool against a source in the vault."""
+    from source_digestion_agent.tools import read_source_outer
+
+    (temp_vault / "sources").mkdir()
+    (temp_vault / "sources" / "2025-doe-ethics.txt").write_text(SOURCE_TEXT, encoding="utf-8")
+    read_source = read_source_outer(vault_directory=str(temp_vault))
+
+    assert read_source("2025-doe-ethics", section=3).startswith("## Results")
+    assert "Stealing is common" in read_source("2025-doe-ethics", start_page=2)
+    assert read_source("2025-doe-ethics", section=9).startswith("Error: Section 9 does not exist")
+    assert read_source("missing") == "Source missing not found."
+
+
+def test_execute_plan_applies_all_changes(temp_vault):
+    """Test that a digestion plan creates notes, edits notes and fills the source note."""
+    from source_digestion_agent.plan_execute import DigestionPlan, execute_plan
+
+    plan = DigestionPlan(
+        new_notes=[NoteDraft(note_title="c/Stealing", data="= Taking without permission")],
+        edits=[NoteEdit(note_title="p/Stealing is bad (50%)", old="# Stealing is bad", new="# [[c/Stealing]] is bad")],
+        source_notes="- Theft harms [[p/Stealing is bad (50%)|↗️]]",
+    )
+
+    result = execute_plan(plan, str(temp_vault), "2025-doe-ethics")
+
+    assert result.applied
+    assert (temp_vault / "c" / "Stealing.md").exists()
+    assert "[[c/Stealing]] is bad" in (temp_vault / "p" / "Stealing is bad (50%).md").read_text(encoding="utf-8")
+    assert "## Notes\n- Theft harms" in (temp_vault / "s" / "2025-doe-ethics.md").read_text(encoding="utf-8")
+
+
+def test_execute_plan_is_all_or_nothing(temp_vault):
+    """Test that a failing edit rolls back the notes created by the plan."""
+    from source_digestion_agent.plan_execute import DigestionPlan, execute_plan
+
+    source_before = (temp_vault / "s" / "2025-doe-ethics.md").read_text(encoding="utf-8")
+    plan = DigestionPlan(
+        new_notes=[NoteDraft(note_title="c/Stealing", data="= Taking without permission")],
+        edits=[NoteEdit(note_title="p/Stealing is bad (50%)", old="not in the note", new="x")],
+        source_notes="- Theft harms",
+    )
+
+    result = execute_plan(plan, str(temp_vault), "2025-doe-ethics")
+
+    assert not result.applied
+    assert any("No string 'not in the note'" in message for message in result.messages)
+    assert not (temp_vault / "c" / "Stealing.md").exists()
+    assert (temp_vault / "s" / "2025-doe-ethics.md").read_text(encoding="utf-8") == source_before
+
+
+def test_synthetic_vault_tool_benchmarks():
+    """Test that the synthetic vault is well-formed and every tool gets measured."""
+    from source_digestion_agent.tools.list_relevant_notes import get_note_list
+    from source_digestion_agent.vault_benchmark import generate_vault, run_tool_benchmarks
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        propositions = generate_vault(tmpdir, 200)
+        notes = get_note_list(tmpdir)
+        assert len(notes) == 200
+        assert {note.split("/")[0] for note in notes} == {"c", "p", "s"}
+        # Propositions are linked from other notes, as in a real vault
+        read_note = read_note_outer(vault_directory=tmpdir)
+        assert any(read_note(title).inlinks for title in propositions[:10])
+
+    results = run_tool_benchmarks(sizes=[200], samples=3)
+    assert [r.tool for r in results] == ["get_note_list", "read_note", "change_note_title", "list_relevant_notes"]
+    assert all(r.calls == 3 and r.p50_ms <= r.p99_ms and r.peak_memory_mb > 0 for r in results)
+
+
+def test_async_tools_match_sync_tools():
+    """Test that every tool has an async version and list_relevant_notes fans out natively."""
+    import asyncio
+    import functools
+    import inspect
+
+    from source_digestion_agent.tools.list_relevant_notes import list_relevant_notes_outer
+    from source_digestion_agent.vault_benchmark import StubRelevanceModel, generate_vault
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        propositions = generate_vault(tmpdir, 100)
+        kwargs = {"vault_directory": tmpdir, "llm": StubRelevanceModel(), "llm_cache": False}
+
+        for name in tools.__all__:
+            assert inspect.iscoroutinefunction(tools.async_tool(name, **kwargs))
+        assert inspect.iscoroutinefunction(list_relevant_notes_outer(asynchronous=True, **kwargs))
+        # The async version shares the sync tool's judge instead of building another one
+        sync_list = list_relevant_notes_outer(**kwargs)
+        async_list = tools.coroutine_of(sync_list)
+        assert async_list is sync_list.coroutine and async_list.__name__ == "list_relevant_notes"
+        # A wrapper's async version runs the wrapper, not the tool it wraps
+        assert tools.coroutine_of(functools.wraps(sync_list)(lambda query: [])) is not async_list
+
+        sync_result = sync_list("notes about sleep")
+        async_result = asyncio.run(async_list("notes about sleep"))
+        assert sync_result and sorted(async_result) == sorted(sync_result)
+
+        read_note = asyncio.run(tools.async_tool("read_note_outer", vault_directory=tmpdir)(propositions[0]))
+        expected = read_note_outer(vault_directory=tmpdir)(propositions[0])
+        assert read_note == expected and read_note.inlinks == sorted(read_note.inlinks)
+
+
+def test_list_relevant_notes_retries_blocks_and_reports_lost_ones():
+    """Test that failed block calls are retried and blocks that keep failing raise instead of vanishing."""
+    from typing import ClassVar
+
+    from source_digestion_agent.concurrency import AdaptiveLimiter
+    from source_digestion_agent.tools.list_relevant_notes import IncompleteRelevanceError, list_relevant_notes_outer
+    from source_digestion_agent.vault_benchmark import StubRelevanceModel, generate_vault
+
+    class FlakyModel(StubRelevanceModel):
+        calls: ClassVar[dict] = {}
+        broken: ClassVar[bool] = False
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            block = messages[-1].content
+            FlakyModel.calls[block] = FlakyModel.calls.get(block, 0) + 1
+            if FlakyModel.broken or FlakyModel.calls[block] == 1:
+                raise TimeoutError("model timed out")
+            return super()._generate(messages, stop, run_manager, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        generate_vault(tmpdir, 100)
+        limiter = AdaptiveLimiter(attempts=3, retry_delay=0)
+        list_relevant_notes = list_relevant_notes_outer(vault_directory=tmpdir, llm=FlakyModel(), llm_cache=False, limiter=limiter, block_tokens=2_000)
+        expected = list_relevant_notes_outer(vault_directory=tmpdir, llm=StubRelevanceModel(), llm_cache=False, block_tokens=2_000)("notes about sleep")
+
+        # The first call of every block fails and is retried
+        assert sorted(list_relevant_notes("notes about sleep")) == sorted(expected)
+        assert limiter.stats().errors == 2 and set(FlakyModel.calls.values()) == {2}
+
+        FlakyModel.broken = True
+        with pytest.raises(IncompleteRelevanceError, match="2 of 2 blocks"):
+            list_relevant_notes("notes about sleep")
+
+
+def test_list_relevant_notes_retries_invalid_responses_without_caching_them():
+    """Test that answers without the tool call are retried like failures and never cached."""
+    from typing import ClassVar
+
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    from source_digestion_agent.concurrency import AdaptiveLimiter
+    from source_digestion_agent.llm_cache import LLMCache
+    from source_digestion_agent.tools.list_relevant_notes import IncompleteRelevanceError, list_relevant_notes_outer
+    from source_digestion_agent.vault_benchmark import StubRelevanceModel, generate_vault
+
+    class ToollessModel(StubRelevanceModel):
+        calls: ClassVar[dict] = {}
+        broken: ClassVar[bool] = False
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            block = messages[-1].content
+            ToollessModel.calls[block] = ToollessModel.calls.get(block, 0) + 1
+            if ToollessModel.broken or ToollessModel.calls[block] == 1:
+                return ChatResult(generations=[ChatGeneration(message=AIMessage(content="These notes look relevant."))])
+            return super()._generate(messages, stop, run_manager, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        generate_vault(tmpdir, 100)
+        cache = LLMCache(os.path.join(tmpdir, "cache.sqlite"))
+        limiter = AdaptiveLimiter(attempts=2, retry_delay=0)
+        list_relevant_notes = list_relevant_notes_outer(vault_directory=tmpdir, llm=ToollessModel(cache=cache), llm_cache=False, limiter=limiter, block_tokens=2_000)
+        expected = list_relevant_notes_outer(vault_directory=tmpdir, llm=StubRelevanceModel(), llm_cache=False, block_tokens=2_000)("notes about sleep")
+
+        assert sorted(list_relevant_notes("notes about sleep")) == sorted(expected)
+        assert set(ToollessModel.calls.values()) == {2} and len(cache) == 2
+
+        # Only the valid answers were cached; a query whose answers are all invalid is reported
+        assert sorted(list_relevant_notes("notes about sleep")) == sorted(expected)
+        assert set(ToollessModel.calls.values()) == {2}
+        ToollessModel.broken = True
+        with pytest.raises(IncompleteRelevanceError, match="2 of 2 blocks"):
+            list_relevant_notes("notes about memory")
+        assert len(cache) == 2
+
+
+def test_compare_block_recall_against_fixed_blocks():
+    """Test that the recall comparison finds the known relevant notes with every block configuration."""
+    from source_digestion_agent.vault_benchmark import StubRelevanceModel, compare_block_recall
+
+    results = compare_block_recall(StubRelevanceModel(), notes=1_000, queries=3, block_tokens=[750, 6_000])
+
+    assert [r.configuration for r in results] == ["30 paths per block", "summaries, 750 tokens", "summaries, 6000 tokens"]
+    assert results[0].calls_per_query == 34 and results[2].calls_per_query == 4
+    assert all(r.recall == 1.0 and r.precision == 1.0 for r in results)
+
+
+def test_list_relevant_notes_packs_blocks_to_a_token_budget():
+    """Test that notes are packed into few blocks with their cached one-line summaries."""
+    from source_digestion_agent.note_summaries import SummaryStore, extract_summary
+    from source_digestion_agent.tools.list_relevant_notes import get_note_list, list_relevant_notes_outer
+    from source_digestion_agent.vault_benchmark import StubRelevanceModel, generate_vault
+
+    class CountingModel(StubRelevanceModel):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            prompts.append(messages[-1].content)
+            return super()._generate(messages, stop, run_manager, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        generate_vault(tmpdir, 1_000)
+        prompts = []
+        list_relevant_notes = list_relevant_notes_outer(vault_directory=tmpdir, llm=CountingModel(), llm_cache=False, block_tokens=6_000)
+        paths_only = list_relevant_notes_outer(vault_directory=tmpdir, llm=StubRelevanceModel(), llm_cache=False, summaries=False, block_tokens=6_000)
+
+        # 1,000 notes take 4 calls instead of 34 blocks of 30, and the selection is the same
+        relevant = list_relevant_notes("notes about sleep")
+        assert len(prompts) == 4 and relevant and sorted(relevant) == sorted(paths_only("notes about sleep"))
+        assert all(" | " in prompt for prompt in prompts)
+        # By default, blocks hold about as many summarized notes as the fixed blocks held paths
+        prompts.clear()
+        list_relevant_notes_outer(vault_directory=tmpdir, llm=CountingModel(), llm_cache=False)("notes about sleep")
+        assert 30 <= len(prompts) <= 40
+
+        # Summaries are extracted once and refreshed when a note changes
+        assert extract_summary("p/A", "---\ntags: [x]\n---\n# [[c/Sleep]] increases [[c/Memory|memory]]\n- [p] ...") == "Sleep increases memory"
+        # A first line repeating the title is skipped for the next one
+        assert extract_summary("p/Sleep increases memory (80%)", "# [[c/Sleep]] increases [[c/Memory|memory]]\n- [!] Only in mice") == "[!] Only in mice"
+        store = SummaryStore.for_vault(tmpdir)
+        note = get_note_list(tmpdir)[0]
+        with open(os.path.join(tmpdir, note), "w", encoding="utf-8") as f:
+            f.write("= Changed definition")
+        assert store.get([note]) == {note: "Changed definition"}
+        assert SummaryStore(tmpdir, os.path.join(tmpdir, ".fasterscience", "note_summaries.sqlite")).get([note]) == {note: "Changed definition"}
+
+        # Summaries of an older summarizer version are extracted again
+        import sqlite3
+        from source_digestion_agent.note_summaries import SUMMARY_VERSION
+        with sqlite3.connect(os.path.join(tmpdir, ".fasterscience", "note_summaries.sqlite")) as connection:
+            connection.execute("UPDATE summaries SET summary = 'Stale'")
+            connection.execute(f"PRAGMA user_version = {SUMMARY_VERSION - 1}")
+        assert SummaryStore(tmpdir, os.path.join(tmpdir, ".fasterscience", "note_summaries.sqlite")).get([note]) == {note: "Changed definition"}
+
+
+def test_list_relevant_notes_batch_answers_many_queries_in_one_pass():
+    """Test that the batched tool judges all queries per block in one call and matches single queries."""
+    import asyncio
+
+    from source_digestion_agent.tools.list_relevant_notes import list_relevant_notes_outer
+    from source_digestion_agent.tools.list_relevant_notes_batch import list_relevant_notes_batch_outer
+    from source_digestion_agent.vault_benchmark import StubRelevanceModel, generate_vault
+
+    class CountingModel(StubRelevanceModel):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            calls.append(messages[-1].content)
+            return super()._generate(messages, stop, run_manager, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        generate_vault(tmpdir, 300)
+        queries = [f"notes about {word}" for word in ("sleep", "memory", "dopamine", "fasting", "zebra")]
+        calls = []
+        single = list_relevant_notes_outer(vault_directory=tmpdir, llm=CountingModel(), llm_cache=False)
+        expected = {query: sorted(single(query)) for query in queries}
+        calls_per_query = len(calls) // len(queries)
+
+        calls.clear()
+        batch = list_relevant_notes_batch_outer(vault_directory=tmpdir, llm=CountingModel(), llm_cache=False)
+        result = batch(queries + [queries[0]])
+        assert {query: sorted(notes) for query, notes in result.items()} == expected
+        assert result["notes about zebra"] == [] and len(calls) == calls_per_query
+
+        abatch = tools.async_tool("list_relevant_notes_batch_outer", vault_directory=tmpdir, llm=StubRelevanceModel(), llm_cache=False)
+        assert {query: sorted(notes) for query, notes in asyncio.run(abatch(queries)).items()} == expected
+
+
+def test_duplicate_propositions_are_clustered_and_merged():
+    """Test that near-duplicate propositions are clustered vault-wide and merged into the most linked one."""
+    from source_digestion_agent.duplicates import find_duplicates, merge_cluster
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        vault = Path(tmpdir)
+        (vault / "p").mkdir()
+        (vault / "s").mkdir()
+        titles = [
+            "Sleep improves memory consolidation (70%)", "Sleep increases memory consolidation (65%)", "Sleep boosts memory consolidation (60%)",
+            "Stress impairs memory consolidation (70%)", "Exercise reduces the risk of heart disease (80%)", "Exercise lowers heart disease risk (75%)",
+            "Caffeine improves attention (70%)", "Alcohol impairs attention (70%)",
+        ]
+        for i, title in enumerate(titles):
+            (vault / "p" / f"{title}.md").write_text(f"# {title}\n- [p] [[s/Source {i}]]\n- [p] [[s/Shared]]\n", encoding="utf-8")
+        (vault / "s" / "Shared.md").write_text(
+            "- [[p/Sleep boosts memory consolidation (60%)|↗️]]\n- [[Sleep boosts memory consolidation (60%)]]\n- [[p/Sleep improves memory consolidation (70%)]]\n",
+            encoding="utf-8",
+        )
+        (vault / "s" / "Other.md").write_text("- [[p/Sleep boosts memory consolidation (60%)]]\n", encoding="utf-8")
+
+        report = find_duplicates(tmpdir)
+        assert report.notes == 8
+        assert [(c.keep, [d.note_title for d in c.duplicates]) for c in report.clusters] == [
+            ("p/Sleep boosts memory consolidation (60%)", ["p/Sleep improves memory consolidation (70%)", "p/Sleep increases memory consolidation (65%)"]),
+            ("p/Exercise lowers heart disease risk (75%)", ["p/Exercise reduces the risk of heart disease (80%)"]),
+        ]
+        assert report.clusters[0].inlinks["p/Sleep boosts memory consolidation (60%)"] == 2
+
+        results = merge_cluster(tmpdir, report.clusters[0])
+        assert len(results) == 2 and all(r.startswith("Merged") for r in results)
+        assert sorted(p.name for p in (vault / "p").iterdir())[-1] == "Stress impairs memory consolidation (70%).md"
+        kept = (vault / "p" / "Sleep boosts memory consolidation (60%).md").read_text(encoding="utf-8")
+        assert kept.count("[[s/Shared]]") == 1 and "[[s/Source 0]]" in kept and "[[s/Source 1]]" in kept
+        assert "[[p/Sleep improves memory consolidation (70%)]]" not in (vault / "s" / "Shared.md").read_text(encoding="utf-8")
+        assert find_duplicates(tmpdir).clusters[0].keep == "p/Exercise lowers heart disease risk (75%)"
+
+
+def test_duplicate_clusters_exclude_opposing_claims_and_chains(monkeypatch):
+    """Test that opposing claims are never clustered and every merged note is similar to the note it is merged into."""
+    import sys
+
+    from source_digestion_agent import cli
+    from source_digestion_agent.duplicates import find_duplicates
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        vault = Path(tmpdir)
+        (vault / "p").mkdir()
+        titles = [
+            "Sleep increases memory (70%)", "Sleep decreases memory (20%)",
+            "Exercise increases dopamine (80%)", "Exercise does not increase dopamine (30%)",
+            "Caffeine improves attention (70%)", "Caffeine improves attention span (60%)", "Caffeine improves attention span in adults (60%)",
+        ]
+        for title in titles:
+            (vault / "p" / f"{title}.md").write_text(f"# {title}\n", encoding="utf-8")
+        (vault / "Index.md").write_text("[[p/Caffeine improves attention (70%)]]\n", encoding="utf-8")
+
+        # Opposing claims are as close as 0.82-0.85, but are never clustered
+        assert [(c.keep, len(c.duplicates)) for c in find_duplicates(tmpdir).clusters] == [("p/Caffeine improves attention (70%)", 2)]
+
+        # The span notes chain to the kept note, but the longest one is not similar enough to it
+        report = find_duplicates(tmpdir, threshold=0.85)
+        assert [(c.keep, [d.note_title for d in c.duplicates]) for c in report.clusters] == [
+            ("p/Caffeine improves attention (70%)", ["p/Caffeine improves attention span (60%)"]),
+        ]
+
+        # Merging deletes notes, so the clusters to merge must be named
+        monkeypatch.setattr(sys, "argv", ["source-digestion-agent", "merge-duplicates", "report.json", "--vault", tmpdir])
+        with pytest.raises(SystemExit):
+            cli.main()